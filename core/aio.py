@@ -0,0 +1,384 @@
+"""
+asyncio 接口。
+
+供基于 asyncio 的编排服务嵌入使用：一个事件循环即可驱动大量 PHY 会话，不需要每个端口一个线程。
+
+    transport = AsyncBrokerTransport()
+    scanner = AsyncPhyScanner(configs, common_config, transport)
+    devices = await scanner.scan()
+    session = scanner.session(devices[0])
+    values = await session.run_sequence("General_Ops/Read ID")
+    await session.write(0x09, 0x2000, mask=0x1FFF)
+
+序列编译、Read ID 探测计划和输出解析与同步接口（PhyExecutor / PhyScanner）共用同一套代码，
+只有实际的 I/O 换成了非阻塞的子进程 / socket，延时和轮询使用 asyncio.sleep，可以随时取消。
+同一总线上的访问通过每总线的 asyncio.Lock 串行化。
+
+异步接口只有每次访问的时间预算（超时的子进程被终止，Broker 连接被丢弃），不经过 core/guard.py：
+没有重试、看门狗和熔断，需要时由调用方处理 MdioError / MdioTimeout。
+"""
+import asyncio
+import contextlib
+
+from core.broker import (
+    DEFAULT_SOCKET, FRAME_HDR, MAX_FRAME, OP_LIST, OP_SCAN,
+    _pack_str, check_reply, decode_buses, decode_scan, decode_values, encode_exec,
+)
+from core.config_cache import pin_config
+from core.executor import find_reset_sequence
+from core.identity import IdentityIndex
+from core.scanner import PhyScanner
+from core.sequence import build_step_op, compile_sequence, find_sequence, resolve_default_template
+from core.shadow import RegisterAttrs
+from core.transport import (
+    ACTION_READ, ACTION_WRITE, DEFAULT_OP_TIMEOUT_MS, KILL_GRACE,
+    MdioError, MdioOp, MdioTimeout, SubprocessTransport,
+    backend_access, describe_op, op_budget_ms, op_steps, sysfs_buses, transient_exit,
+)
+
+# 同时运行的 mdio 子进程数量上限
+DEFAULT_MAX_PROCS = 32
+
+
+async def run_steps(steps, access):
+    """异步执行 op_steps：await access(op) 完成一次读 / 写，等待使用 asyncio.sleep（可随时取消）"""
+    value = None
+    error = None
+    try:
+        while True:
+            try:
+                request = steps.throw(error) if error is not None else steps.send(value)
+            except StopIteration as done:
+                return done.value
+            value = error = None
+            if isinstance(request, MdioOp):
+                try:
+                    value = await access(request)
+                except MdioError as e:
+                    error = e
+            else:
+                await asyncio.sleep(request)
+    finally:
+        steps.close()
+
+
+class AsyncMdioTransport:
+    """异步传输层基类：子类实现 _execute / list_buses / scan_bus"""
+
+    def __init__(self):
+        self._bus_locks = {}
+
+    def bus_lock(self, bus):
+        lock = self._bus_locks.get(bus)
+        if lock is None:
+            lock = self._bus_locks[bus] = asyncio.Lock()
+        return lock
+
+    def describe(self, bus, addr, op):
+        return describe_op(bus, addr, op)
+
+    async def execute(self, bus, addr, ops):
+        if not ops:
+            return []
+        async with self.bus_lock(bus):
+            return await self._execute(bus, addr, ops)
+
+    async def read(self, bus, addr, op):
+        return (await self.execute(bus, addr, [op]))[0]
+
+    async def _execute(self, bus, addr, ops):
+        raise NotImplementedError
+
+    async def list_buses(self):
+        raise NotImplementedError
+
+    async def scan_bus(self, bus):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class AsyncSubprocessTransport(AsyncMdioTransport):
+    """非阻塞地执行 `sudo mdio`；命令构造与输出解析沿用 SubprocessTransport"""
+
+    def __init__(self, use_sudo=True, max_procs=DEFAULT_MAX_PROCS, op_timeout_ms=DEFAULT_OP_TIMEOUT_MS,
+                 shell_batch=False):
+        super().__init__()
+        self.tool = SubprocessTransport(use_sudo, op_timeout_ms, shell_batch)
+        self.max_procs = max_procs
+        self._procs = None
+
+    def describe(self, bus, addr, op):
+        return self.tool.describe(bus, addr, op)
+
+    async def _run(self, cmd, timeout_ms=None):
+        timeout_ms = self.tool.op_timeout_ms if timeout_ms is None else timeout_ms
+        if self._procs is None:
+            self._procs = asyncio.Semaphore(self.max_procs)
+        async with self._procs:
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+            except FileNotFoundError:
+                raise MdioError("'sudo' or 'mdio' command not found")
+            try:
+                out, err = await asyncio.wait_for(proc.communicate(), timeout_ms / 1000.0)
+            except asyncio.TimeoutError:
+                # 与 SubprocessTransport 相同：先 SIGTERM（sudo 会转发给 mdio），宽限期后 SIGKILL，
+                # 仍持有管道的孙进程可能使 wait() 迟迟不返回，不再等待
+                for signal_proc in (proc.terminate, proc.kill):
+                    with contextlib.suppress(ProcessLookupError):
+                        signal_proc()
+                    try:
+                        await asyncio.wait_for(proc.wait(), KILL_GRACE)
+                        break
+                    except asyncio.TimeoutError:
+                        pass
+                raise MdioTimeout(f"'{self.tool._trace_name(cmd)}' timed out after {timeout_ms} ms")
+            except asyncio.CancelledError:
+                # 进程可能恰好已经退出
+                with contextlib.suppress(ProcessLookupError):
+                    proc.kill()
+                await proc.wait()
+                raise
+        out = out.decode(errors='replace')
+        if proc.returncode != 0:
+            err = err.decode(errors='replace')
+            raise MdioError(f"Command failed with error code {proc.returncode}",
+                            stderr=err.strip(), stdout=out.strip(),
+                            returncode=proc.returncode, transient=transient_exit(proc.returncode, err))
+        return out
+
+    async def _execute_one(self, bus, addr, op):
+        out = await self._run(self.tool.render(bus, addr, op))
+        return self.tool._parse_value(out) if op.action == ACTION_READ else None
+
+    async def _execute(self, bus, addr, ops):
+        if len(ops) == 1 and ops[0].action in (ACTION_READ, ACTION_WRITE):
+            return [await self._execute_one(bus, addr, ops[0])]
+        if not self.tool.shell_batch:
+            return await run_steps(op_steps(ops, 'process_poll'), lambda op: self._execute_one(bus, addr, op))
+        try:
+            out = await self._run(self.tool.script_command(bus, addr, ops), op_budget_ms(ops, self.tool.op_timeout_ms))
+            failed = None
+        except MdioError as e:
+            out = e.stdout
+            failed = e
+        return self.tool.parse_script_output(ops, out, failed)
+
+    async def list_buses(self):
+        # 与 SubprocessTransport.list_buses 相同：优先从 sysfs 读取，没有 sysfs 时才执行 `sudo mdio`
+        buses = sysfs_buses()
+        if buses is not None:
+            return buses
+        return self.tool.parse_buses(await self._run(self.tool.prefix + ["mdio"]))
+
+    async def scan_bus(self, bus):
+        async with self.bus_lock(bus):
+            return self.tool.parse_scan(await self._run(self.tool.prefix + ["mdio", bus]))
+
+
+class AsyncBrokerTransport(AsyncMdioTransport):
+    """通过 Unix socket 访问 Broker，每条总线一个连接，不同总线的请求并行"""
+
+    def __init__(self, path=DEFAULT_SOCKET, op_timeout_ms=DEFAULT_OP_TIMEOUT_MS):
+        super().__init__()
+        self.path = path
+        self.op_timeout_ms = op_timeout_ms
+        self._conns = {}
+
+    @staticmethod
+    async def _exchange(reader, writer, payload):
+        writer.write(FRAME_HDR.pack(len(payload)) + payload)
+        await writer.drain()
+        (length,) = FRAME_HDR.unpack(await reader.readexactly(FRAME_HDR.size))
+        if length > MAX_FRAME:
+            raise MdioError(f"Broker frame too large: {length} bytes")
+        return await reader.readexactly(length)
+
+    async def _request(self, key, payload, timeout_ms=None):
+        timeout_ms = self.op_timeout_ms if timeout_ms is None else timeout_ms
+        conn = self._conns.get(key)
+        if conn is None:
+            try:
+                conn = self._conns[key] = await asyncio.wait_for(
+                    asyncio.open_unix_connection(self.path), timeout_ms / 1000.0)
+            except asyncio.TimeoutError:
+                raise MdioTimeout(f"Connecting to MDIO broker at {self.path} timed out after {timeout_ms} ms")
+            except OSError as e:
+                raise MdioError(f"Cannot connect to MDIO broker at {self.path}: {e}", transient=True)
+        reader, writer = conn
+        try:
+            reply = await asyncio.wait_for(self._exchange(reader, writer, payload), timeout_ms / 1000.0)
+        except (OSError, asyncio.IncompleteReadError, asyncio.CancelledError, asyncio.TimeoutError, MdioError) as e:
+            # 请求中断或超时后连接上可能残留半个响应，直接丢弃该连接
+            self._conns.pop(key, None)
+            writer.close()
+            if isinstance(e, asyncio.TimeoutError):
+                raise MdioTimeout(f"MDIO broker request timed out after {timeout_ms} ms")
+            if isinstance(e, (asyncio.CancelledError, MdioError)):
+                raise
+            raise MdioError(f"MDIO broker request failed: {e}", transient=True)
+        return check_reply(reply)
+
+    async def _execute(self, bus, addr, ops):
+        reply = await self._request(bus, encode_exec(bus, addr, ops), op_budget_ms(ops, self.op_timeout_ms))
+        return decode_values(reply, ops)
+
+    async def list_buses(self):
+        return decode_buses(await self._request(None, bytes([OP_LIST])))
+
+    async def scan_bus(self, bus):
+        async with self.bus_lock(bus):
+            return decode_scan(await self._request(bus, bytes([OP_SCAN]) + _pack_str(bus)))
+
+    async def close(self):
+        conns = list(self._conns.values())
+        self._conns.clear()
+        for _, writer in conns:
+            writer.close()
+
+
+class AsyncBackendTransport(AsyncMdioTransport):
+    """
+    进程内寄存器后端（如仿真后端）的异步包装。
+    后端的读写被视为不会阻塞的快速调用，延时和轮询等待使用 asyncio.sleep。
+    """
+
+    def __init__(self, backend):
+        super().__init__()
+        self.backend = backend
+
+    async def _execute(self, bus, addr, ops):
+        # 与同步的 apply_ops 共用 op_steps，只是等待换成 asyncio.sleep
+        async def access(op):
+            return backend_access(self.backend, bus, addr, op)
+        return await run_steps(op_steps(ops, 'backend_poll'), access)
+
+    async def list_buses(self):
+        return self.backend.list_buses()
+
+    async def scan_bus(self, bus):
+        async with self.bus_lock(bus):
+            return self.backend.scan_bus(bus)
+
+
+class AsyncPhySession:
+    """一个 PHY 的异步会话，对应同步接口中的 PhyExecutor"""
+
+    def __init__(self, config, common_config, bus, addr_int, transport):
+        self.config = config
+        self._pinned = pin_config(config)
+        self.bus = bus
+        self.addr = addr_int
+        self.transport = transport
+        self.templates = common_config.get('cmd_templates', {})
+        self.default_tmpl_key, _ = resolve_default_template(config, self.templates)
+        self._programs = {id(seq): (seq, program) for seq, program in config.get('_programs', ())}
+
+    def compile(self, sequence):
+        cached = self._programs.get(id(sequence))
+        if cached is not None and cached[0] is sequence:
+            return cached[1]
+        program = compile_sequence(sequence, self.templates, self.default_tmpl_key,
+                                   self.config.get('check_inprogress'), RegisterAttrs(self.config, self.templates),
+                                   self.config.get('coalesce_writes', True))
+        self._programs[id(sequence)] = (sequence, program)
+        return program
+
+    async def run_sequence(self, path):
+        """
+        执行 test_modes 中路径为 path 的序列（也可以直接传入 sequence 列表），
+        返回每个步骤的结果（READ 为读到的值，其余为 None），失败时抛出 MdioError。
+        """
+        sequence = path
+        if isinstance(path, str):
+            sequence = find_sequence(self.config.get('test_modes', {}), path)
+            if sequence is None:
+                raise KeyError(f"No sequence '{path}' in {self.config.get('config_name', 'Unnamed Config')}")
+        program = self.compile(sequence)
+        values = await self.transport.execute(self.bus, self.addr, program.ops)
+        return [values[step.op_index] for step in program.steps]
+
+    def _op(self, step):
+        _, op = build_step_op(step, self.templates, self.default_tmpl_key)
+        return op
+
+    async def read(self, reg, dev_id=0, template=None):
+        step = {'action': 'READ', 'reg': reg, 'dev_id': dev_id}
+        if template:
+            step['template'] = template
+        return await self.transport.read(self.bus, self.addr, self._op(step))
+
+    async def write(self, reg, val, mask=0, dev_id=0, template=None):
+        """带掩码的写，mask 为需要保留的原有位（与配置中的 mask 语义相同）"""
+        step = {'action': 'WRITE', 'reg': reg, 'val': val, 'mask': mask, 'dev_id': dev_id}
+        if template:
+            step['template'] = template
+        await self.transport.execute(self.bus, self.addr, [self._op(step)])
+
+    async def reset(self):
+        """执行配置中的复位序列；没有复位序列时返回 False"""
+        _, sequence = find_reset_sequence(self.config)
+        if sequence is None:
+            return False
+        await self.run_sequence(sequence)
+        return True
+
+
+class AsyncPhyScanner:
+    """异步扫描，对应同步接口中的 PhyScanner"""
+
+    def __init__(self, configs, common_config, transport, identity_index=None):
+        self.common_config = common_config
+        self.transport = transport
+        self.identity_index = identity_index or IdentityIndex(configs, verbose=False)
+        # 仅用于生成 Read ID 探测计划和设备记录，不通过它访问总线
+        self._planner = PhyScanner(configs, common_config, transport, self.identity_index)
+
+    async def read_phy_id(self, bus, addr_int):
+        addr_hex = f"0x{addr_int:02x}"
+        probe = self._planner.id_probe(bus, addr_hex)
+        values = None
+        try:
+            while True:
+                config_name, ops = probe.send(values)
+                try:
+                    values = await self.transport.execute(bus, addr_int, ops)
+                except MdioError as e:
+                    print(f"    [!] Failed to read ID registers for {config_name} on {bus} addr {addr_hex}")
+                    print(f"      STDERR: {e.stderr or e}")
+                    values = None
+        except StopIteration as stop:
+            return stop.value
+
+    async def scan_bus(self, bus):
+        """扫描一条总线，ID 为 0 的地址使用 Read ID 序列重新获取"""
+        try:
+            found = await self.transport.scan_bus(bus)
+        except MdioError as e:
+            print(f"[ERR] Failed to scan bus {bus}: {e.stderr or e}")
+            return []
+        devices = []
+        for addr_int, phy_id in sorted(found):
+            probed = phy_id == 0
+            if probed:
+                phy_id = await self.read_phy_id(bus, addr_int)
+            if phy_id > 0:
+                devices.append(PhyScanner.device_record(bus, addr_int, phy_id, probed))
+        return devices
+
+    async def scan(self, buses=None):
+        """并发扫描所有总线，结果按 (总线顺序, 地址) 排序"""
+        if buses is None:
+            buses = await self.transport.list_buses()
+        per_bus = await asyncio.gather(*(self.scan_bus(bus) for bus in buses))
+        return [dev for devs in per_bus for dev in devs]
+
+    def session(self, device):
+        """为扫描结果中的一个设备创建会话；没有匹配的配置时返回 None"""
+        cfg = self.identity_index.resolve(device['phy_id'])
+        if cfg is None:
+            return None
+        return AsyncPhySession(cfg, self.common_config, device['bus'], device['addr_int'], self.transport)
@@ -0,0 +1,350 @@
+"""
+性能基准测试：在仿真 MDIO 总线上度量配置加载、ID 匹配、扫描发现以及所有配置中每个测试序列的执行耗时，
+不需要硬件。仿真拓扑由 configs/*.json 的 identity 生成（见 SimulatedMdio.from_configs），
+可以为每次寄存器访问设置延迟，结果以 JSON 输出，便于比较传输层或调度方式改动前后的性能。
+
+    python3 -m core.bench --buses 4 --per-bus 8 --latency-us 50 --output bench.json
+    python3 -m core.bench --transports backend,scheduled,broker --repeat 5
+    python3 -m core.bench --startup 10       # 启动耗时：默认方式与 --fast-start 对比（假的 sudo / mdio）
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from core.broker import BrokerTransport, MdioBroker
+from core.config_cache import load_compiled_configs
+from core.executor import PhyExecutor
+from core.identity import IdentityIndex
+from core.netlink import FakeNetlinkEndpoint, NetlinkTransport
+from core.profiler import Stat
+from core.scanner import DEFAULT_WORKERS, PhyScanner
+from core.scheduler import ScheduledTransport
+from core.sequence import iter_sequences, sequence_path
+from core.sim import SimulatedMdio
+from core.transport import BackendTransport, MdioError
+
+TRANSPORTS = ('backend', 'scheduled', 'broker', 'netlink')
+DEFAULT_TRANSPORTS = ('backend', 'scheduled')
+
+# ID 匹配基准中的查找次数
+IDENTITY_LOOKUPS = 10000
+
+
+class Bench:
+    """按名称收集耗时样本"""
+
+    def __init__(self):
+        self.stats = {}
+
+    def time(self, name, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, duration):
+        stat = self.stats.get(name)
+        if stat is None:
+            stat = self.stats[name] = Stat()
+        stat.add(duration)
+
+    def report(self):
+        return {name: stat.as_dict() for name, stat in sorted(self.stats.items())}
+
+
+@contextlib.contextmanager
+def quiet():
+    """被测代码的控制台输出不计入结果"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def bench_config_loading(config_dir, repeat):
+    bench = Bench()
+    for _ in range(repeat):
+        with quiet():
+            bench.time('config.load_cold', load_compiled_configs, config_dir, use_cache=False)
+            bench.time('config.load_cached', load_compiled_configs, config_dir, use_cache=True)
+    return bench.report()
+
+
+def bench_identity(configs, repeat):
+    bench = Bench()
+    rng = random.Random(0)
+    known = []
+    for cfg in configs:
+        try:
+            known.append(int(str(cfg['identity']['phy_id']), 0))
+        except (KeyError, TypeError, ValueError):
+            continue
+    lookups = [rng.choice(known) if known and i % 2 else rng.getrandbits(32) for i in range(IDENTITY_LOOKUPS)]
+    for _ in range(repeat):
+        index = bench.time('identity.build', IdentityIndex, configs, verbose=False)
+        start = time.perf_counter()
+        for phy_id in lookups:
+            index.resolve(phy_id)
+        bench.add('identity.resolve', (time.perf_counter() - start) / len(lookups))
+    return bench.report()
+
+
+@contextlib.contextmanager
+def open_transport(name, sim):
+    """创建被测传输层；broker 在本进程的线程中运行，使用临时 socket，netlink 使用假 netlink 端点"""
+    if name == 'backend':
+        yield BackendTransport(sim)
+    elif name == 'scheduled':
+        transport = ScheduledTransport(BackendTransport(sim))
+        try:
+            yield transport
+        finally:
+            transport.close()
+    elif name == 'netlink':
+        yield NetlinkTransport(FakeNetlinkEndpoint(sim))
+    elif name == 'broker':
+        path = os.path.join(tempfile.mkdtemp(prefix="phy-bench-"), "broker.sock")
+        server = MdioBroker(path, sim)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield BrokerTransport(path)
+        finally:
+            server.shutdown()
+            server.server_close()
+            os.unlink(path)
+            os.rmdir(os.path.dirname(path))
+    else:
+        raise ValueError(f"Unknown transport '{name}'")
+
+
+def bench_discovery(bench, transport, configs, common_config, repeat):
+    for _ in range(repeat):
+        scanner = PhyScanner(configs, common_config, transport)
+        with quiet():
+            buses = bench.time('discovery.get_buses', scanner.get_buses)
+            for bus in buses:
+                found = bench.time('discovery.scan_bus', transport.scan_bus, bus)
+                for addr, phy_id in found:
+                    if phy_id == 0:
+                        bench.time('discovery.read_phy_id', scanner.read_phy_id, bus, f"0x{addr:02x}")
+            bench.time('discovery.scan_devices', lambda: [scanner.scan_devices(bus) for bus in buses])
+            bench.time('discovery.discover_serial', scanner.discover, buses, 1)
+            bench.time('discovery.discover_parallel', scanner.discover, buses, DEFAULT_WORKERS)
+
+
+def bench_sequences(bench, transport, common_config, placements, repeat):
+    """执行每个 PHY 上其配置中的每个 test_modes 叶子序列（批量与逐步两种方式）"""
+    leaves = {}
+    for bus, addr, cfg in placements:
+        executor = PhyExecutor(cfg, common_config, bus, addr, transport=transport)
+        for path, sequence in iter_sequences(cfg.get('test_modes', {})):
+            key = (cfg.get('config_name', ''), sequence_path(path))
+            leaf = leaves.get(key)
+            if leaf is None:
+                leaf = leaves[key] = {"config": key[0], "path": key[1],
+                                      "ops": len(executor.compile(sequence)), "batch": Stat(), "errors": 0}
+            for _ in range(repeat):
+                start = time.perf_counter()
+                try:
+                    executor.run_sequence(sequence)
+                except MdioError:
+                    leaf['errors'] += 1
+                duration = time.perf_counter() - start
+                leaf['batch'].add(duration)
+                bench.add('sequence.batch', duration)
+                with quiet():
+                    bench.time('sequence.stepwise', executor.execute_sequence_stepwise, sequence)
+
+    results = []
+    for leaf in leaves.values():
+        stat = leaf.pop('batch').as_dict()
+        leaf.update(count=stat['count'], mean_ms=stat['mean_ms'], p50_ms=stat['p50_ms'], p99_ms=stat['p99_ms'])
+        results.append(leaf)
+    return results
+
+
+# 启动基准中替代 sudo / mdio 的脚本：每次调用在日志中记录一行 "纳秒时间戳 程序 参数..."，
+# mdio 模拟 fixed-0 总线地址 1 上的一个 88Q2112（ID 寄存器 2/3），其余寄存器读为 0
+FAKE_SUDO = """#!/bin/sh
+echo "$(date +%s%N) sudo $1" >> "$MDIO_BENCH_LOG"
+exec "$@"
+"""
+FAKE_MDIO = """#!/bin/sh
+echo "$(date +%s%N) mdio $*" >> "$MDIO_BENCH_LOG"
+case $# in
+0) echo fixed-0 ;;
+1) [ "$1" = "-h" ] || echo "0x01  0x002b0980  up" ;;
+5) case $(printf '%d' "$5") in 2) echo 0x002b ;; 3) echo 0x0980 ;; *) echo 0x0000 ;; esac ;;
+esac
+exit 0
+"""
+STARTUP_PLAN = {"targets": [{"chip": "*88Q2112*"}], "tests": ["100M/*"], "reset_after": False}
+STARTUP_MODES = (('default', []), ('fast_start', ['--fast-start']))
+
+
+def _startup_run(workdir, env, extra):
+    """运行一次 main.py --plan，返回 (总耗时 ms, 到第一次写寄存器的耗时 ms, 之前启动的进程数, 之前的 mdio 调用数)"""
+    log = env['MDIO_BENCH_LOG']
+    open(log, 'w').close()
+    main_py = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+    start = time.time_ns()
+    subprocess.run([sys.executable, main_py, '--plan', 'plan.json'] + extra, cwd=workdir, env=env,
+                   stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+    total = (time.time_ns() - start) / 1e6
+    with open(log) as fp:
+        lines = [line.split() for line in fp if line.strip()]
+    first, spawned, calls = None, 0, 0
+    for i, fields in enumerate(lines):
+        if fields[1] == 'mdio' and len(fields) == 8 and '/' in fields[7]:
+            first = (int(fields[0]) - start) / 1e6
+            # 紧接在前面的 sudo 是执行这次写的进程本身
+            spawned -= i > 0 and lines[i - 1][1] == 'sudo'
+            break
+        spawned += fields[1] == 'sudo'
+        calls += fields[1] == 'mdio'
+    return total, first, spawned, calls
+
+
+def bench_startup(config_dir, runs):
+    """
+    进程启动耗时：在临时目录中用假的 sudo / mdio 运行 main.py --plan，默认方式与 --fast-start 各运行 runs 次
+    （各先运行一次以建立配置与拓扑缓存）。第一次写寄存器视为第一个真正有用的操作。
+    """
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="mdio-startup-") as workdir:
+        bindir = os.path.join(workdir, "bin")
+        os.makedirs(bindir)
+        for name, text in (("sudo", FAKE_SUDO), ("mdio", FAKE_MDIO)):
+            path = os.path.join(bindir, name)
+            with open(path, 'w') as fp:
+                fp.write(text)
+            os.chmod(path, 0o755)
+        shutil.copytree(config_dir, os.path.join(workdir, "configs"), ignore=shutil.ignore_patterns('.cache'))
+        with open(os.path.join(workdir, "plan.json"), 'w') as fp:
+            json.dump(STARTUP_PLAN, fp)
+        env = dict(os.environ, PATH=bindir + os.pathsep + os.environ.get('PATH', ''),
+                   MDIO_BENCH_LOG=os.path.join(workdir, "mdio.log"))
+
+        for mode, extra in STARTUP_MODES:
+            _startup_run(workdir, env, extra)
+            samples = [_startup_run(workdir, env, extra) for _ in range(runs)]
+            firsts = [s[1] for s in samples if s[1] is not None]
+            results[mode] = {
+                "runs": runs,
+                "total_ms": statistics.median(s[0] for s in samples),
+                "first_write_ms": statistics.median(firsts) if firsts else None,
+                "processes_before_first_write": samples[-1][2],
+                "mdio_calls_before_first_write": samples[-1][3],
+            }
+    return results
+
+
+def print_startup(results):
+    print(f"  {'mode':<12} {'runs':>5} {'total ms':>10} {'first write ms':>15} {'procs before':>13} {'mdio before':>12}")
+    for mode, r in results.items():
+        first = f"{r['first_write_ms']:.1f}" if r['first_write_ms'] is not None else "-"
+        print(f"  {mode:<12} {r['runs']:>5} {r['total_ms']:>10.1f} {first:>15} "
+              f"{r['processes_before_first_write']:>13} {r['mdio_calls_before_first_write']:>12}")
+
+
+def run(config_dir, transports, buses, per_bus, latency_us, repeat):
+    with quiet():
+        configs, common_config, _, _ = load_compiled_configs(config_dir)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "buses": buses,
+            "per_bus": per_bus,
+            "latency_us": latency_us,
+            "repeat": repeat,
+            "configs": len(configs),
+        },
+        "config_loading": bench_config_loading(config_dir, repeat),
+        "identity": bench_identity(configs, repeat),
+        "transports": {},
+    }
+    for name in transports:
+        # 每种传输层使用一套全新的仿真寄存器，保证初始状态一致
+        sim, placements = SimulatedMdio.from_configs(configs, common_config, buses, per_bus, latency_us / 1e6)
+        report['meta']['devices'] = len(placements)
+        bench = Bench()
+        start = time.perf_counter()
+        with open_transport(name, sim) as transport:
+            bench_discovery(bench, transport, configs, common_config, repeat)
+            leaves = bench_sequences(bench, transport, common_config, placements, repeat)
+        report['transports'][name] = {
+            "elapsed_ms": (time.perf_counter() - start) * 1000.0,
+            "timings": bench.report(),
+            "sequences": leaves,
+        }
+    return report
+
+
+def print_summary(report):
+    meta = report['meta']
+    print(f"[*] {meta['devices']} emulated PHYs on {meta['buses']} bus(es), "
+          f"latency {meta['latency_us']} us/access, repeat {meta['repeat']}")
+    sections = [('', report['config_loading']), ('', report['identity'])]
+    sections += [(f"{name}: ", data['timings']) for name, data in report['transports'].items()]
+    print(f"  {'benchmark':<40} {'count':>6} {'mean ms':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for prefix, timings in sections:
+        for key, s in timings.items():
+            print(f"  {prefix + key:<40} {s['count']:>6} {s['mean_ms']:>10.4f} {s['p50_ms']:>10.4f} {s['p99_ms']:>10.4f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark PHY tester on an emulated MDIO bus")
+    parser.add_argument('--configs', default="configs", help="Config directory")
+    parser.add_argument('--transports', default=','.join(DEFAULT_TRANSPORTS),
+                        help=f"Comma separated list of: {', '.join(TRANSPORTS)}")
+    parser.add_argument('--buses', type=int, default=2, help="Number of emulated buses")
+    parser.add_argument('--per-bus', type=int, default=None,
+                        help="PHYs per bus (default: one PHY per config, spread over the buses)")
+    parser.add_argument('--latency-us', type=float, default=0.0, help="Emulated latency per register access")
+    parser.add_argument('--repeat', type=int, default=3, help="Repetitions of each benchmark")
+    parser.add_argument('--output', default="-", help="JSON report path ('-' for stdout)")
+    parser.add_argument('--startup', type=int, default=0, metavar='N',
+                        help="Measure process startup (default vs --fast-start) over N runs instead")
+    args = parser.parse_args(argv)
+
+    if args.startup > 0:
+        results = bench_startup(args.configs, args.startup)
+        print_startup(results)
+        if args.output != '-':
+            with open(args.output, 'w') as fp:
+                fp.write(json.dumps(results, indent=2) + "\n")
+            print(f"[*] Report written to {args.output}")
+        return 0
+
+    transports = [t.strip() for t in args.transports.split(',') if t.strip()]
+    unknown = [t for t in transports if t not in TRANSPORTS]
+    if unknown:
+        parser.error(f"unknown transport(s): {', '.join(unknown)}")
+
+    report = run(args.configs, transports, max(1, args.buses), args.per_bus, args.latency_us, max(1, args.repeat))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w') as fp:
+            fp.write(text + "\n")
+        print_summary(report)
+        print(f"[*] Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,399 @@
+"""
+常驻特权 MDIO Broker。
+
+以 root 身份启动一次，独占 MDIO 总线，通过 Unix socket 为多个测试进程提供
+读 / 写 / 读改写服务，避免每次寄存器访问都执行一次 `sudo mdio`。
+
+    sudo python3 -m core.broker                          # 真实硬件，后端为 mdio 工具
+    sudo python3 -m core.broker --netlink                # 真实硬件，直接使用 mdio-netlink
+    python3 -m core.broker --sim "fixed-0:1=0x002b0980"  # 仿真后端，无需硬件
+
+协议：每帧为 4 字节大端长度 + 负载。请求负载首字节为操作码，
+响应负载首字节为状态（0 成功 / 1 失败，失败时附带错误信息）。
+"""
+import argparse
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+
+from core import profiler
+from core.transport import (
+    ACTION_DELAY, ACTION_POLL, ACTION_READ, DEFAULT_OP_TIMEOUT_MS, MODE_C22, MODE_NAMES,
+    MdioError, MdioOp, MdioTimeout, MdioTransport, SubprocessTransport, apply_ops, op_budget_ms,
+)
+
+DEFAULT_SOCKET = "/tmp/phy-mdio-broker.sock"
+
+OP_LIST = 1
+OP_SCAN = 2
+OP_EXEC = 3
+
+STATUS_OK = 0
+STATUS_ERR = 1
+
+FRAME_HDR = struct.Struct('!I')
+COUNT = struct.Struct('!H')
+EXEC_HDR = struct.Struct('!BH')          # addr, op 数量
+OP_ENTRY = struct.Struct('!BBBHHHHHI')   # action, mode, dev_id, reg, val, mask, interval, max_interval, timeout
+SCAN_ENTRY = struct.Struct('!BI')        # addr, phy_id
+VALUE = struct.Struct('!H')
+
+MAX_FRAME = 1 << 20
+NO_INDEX = 0xFFFF
+
+# OP_ENTRY 中各字段的取值上限（延时与轮询间隔为 16 位毫秒数，最长约 65 秒）
+ENTRY_LIMITS = (('dev_id', 0xFF), ('reg', 0xFFFF), ('val', 0xFFFF), ('mask', 0xFFFF),
+                ('interval', 0xFFFF), ('max_interval', 0xFFFF), ('timeout', 0xFFFFFFFF))
+
+# 各寻址模式在 broker 内部使用的规范模板
+CANONICAL_FORMATS = {
+    mode: f"mdio {{bus}} {name} " + ("{phy_addr}" if mode == MODE_C22 else "{phy_addr}:{dev_id}") + " raw {reg} {data}"
+    for mode, name in MODE_NAMES.items()
+}
+
+
+# ---------- 编解码 ----------
+
+def _pack_str(text):
+    data = text.encode('utf-8')
+    return COUNT.pack(len(data)) + data
+
+
+def _unpack_str(buf, offset):
+    (length,) = COUNT.unpack_from(buf, offset)
+    offset += COUNT.size
+    return buf[offset:offset + length].decode('utf-8'), offset + length
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_frame(sock):
+    hdr = _recv_exact(sock, FRAME_HDR.size)
+    if hdr is None:
+        return None
+    (length,) = FRAME_HDR.unpack(hdr)
+    if length > MAX_FRAME:
+        raise MdioError(f"Broker frame too large: {length} bytes")
+    return _recv_exact(sock, length)
+
+
+def send_frame(sock, payload):
+    sock.sendall(FRAME_HDR.pack(len(payload)) + payload)
+
+
+def _entry_range_error(op, index):
+    for name, limit in ENTRY_LIMITS:
+        value = getattr(op, name)
+        if not 0 <= value <= limit:
+            return MdioError(f"Operation {index}: {name} {value} does not fit the broker protocol "
+                             f"(0..{limit})", index=index)
+    return MdioError(f"Operation {index} cannot be encoded for the broker", index=index)
+
+
+def encode_exec(bus, addr, ops):
+    """取值超出协议字段范围时抛出 MdioError（而不是 struct.error）"""
+    try:
+        parts = [bytes([OP_EXEC]), _pack_str(bus), EXEC_HDR.pack(addr, len(ops))]
+    except struct.error:
+        raise MdioError(f"Cannot encode broker request for {bus}:{addr} with {len(ops)} operation(s)")
+    for index, op in enumerate(ops):
+        if op.action == ACTION_DELAY:
+            mode = MODE_C22
+        elif op.mode is None:
+            raise MdioError(f"Cannot determine MDIO addressing mode from template: {op.fmt}")
+        else:
+            mode = op.mode
+        try:
+            parts.append(OP_ENTRY.pack(op.action, mode, op.dev_id, op.reg, op.val, op.mask,
+                                       op.interval, op.max_interval, op.timeout))
+        except struct.error:
+            raise _entry_range_error(op, index)
+    return b''.join(parts)
+
+
+def decode_exec(buf, offset):
+    bus, offset = _unpack_str(buf, offset)
+    addr, count = EXEC_HDR.unpack_from(buf, offset)
+    offset += EXEC_HDR.size
+    ops = []
+    for _ in range(count):
+        (action, mode, dev_id, reg, val, mask,
+         interval, max_interval, timeout) = OP_ENTRY.unpack_from(buf, offset)
+        offset += OP_ENTRY.size
+        fmt = None if action == ACTION_DELAY else CANONICAL_FORMATS[mode]
+        ops.append(MdioOp(action, fmt, reg, dev_id, val, mask, interval, max_interval, timeout))
+    return bus, addr, ops
+
+
+def encode_values(results):
+    return COUNT.pack(len(results)) + b''.join(VALUE.pack(v or 0) for v in results)
+
+
+def encode_buses(buses):
+    return COUNT.pack(len(buses)) + b''.join(_pack_str(b) for b in buses)
+
+
+def encode_scan(found):
+    return COUNT.pack(len(found)) + b''.join(SCAN_ENTRY.pack(a, i) for a, i in found)
+
+
+def encode_error(message, index=None):
+    """错误响应：状态 + 错误信息 + 出错的操作序号"""
+    return bytes([STATUS_ERR]) + _pack_str(message) + COUNT.pack(NO_INDEX if index is None else index)
+
+
+def check_reply(reply, source="Broker"):
+    """检查响应状态，失败时抛出 MdioError；成功时返回 (reply, 负载起始偏移)"""
+    if reply[0] != STATUS_OK:
+        message, offset = _unpack_str(reply, 1)
+        (index,) = COUNT.unpack_from(reply, offset)
+        raise MdioError(f"{source}: {message}" if source else message,
+                        index=None if index == NO_INDEX else index)
+    return reply, 1
+
+
+def decode_values(response, ops):
+    reply, offset = response
+    (count,) = COUNT.unpack_from(reply, offset)
+    offset += COUNT.size
+    results = []
+    for op in ops[:count]:
+        (value,) = VALUE.unpack_from(reply, offset)
+        offset += VALUE.size
+        results.append(value if op.action in (ACTION_READ, ACTION_POLL) else None)
+    return results
+
+
+def decode_buses(response):
+    reply, offset = response
+    (count,) = COUNT.unpack_from(reply, offset)
+    offset += COUNT.size
+    buses = []
+    for _ in range(count):
+        bus, offset = _unpack_str(reply, offset)
+        buses.append(bus)
+    return buses
+
+
+def decode_scan(response):
+    reply, offset = response
+    (count,) = COUNT.unpack_from(reply, offset)
+    offset += COUNT.size
+    found = []
+    for _ in range(count):
+        found.append(SCAN_ENTRY.unpack_from(reply, offset))
+        offset += SCAN_ENTRY.size
+    return found
+
+
+# ---------- 后端 ----------
+
+class MdioToolBackend:
+    """Broker 已具备特权，直接调用 mdio 工具（不再经过 sudo）"""
+
+    def __init__(self):
+        self.tool = SubprocessTransport(use_sudo=False)
+
+    def read(self, bus, addr, mode, dev_id, reg):
+        return self.tool.execute(bus, addr, [MdioOp.read(CANONICAL_FORMATS[mode], reg, dev_id)])[0]
+
+    def write(self, bus, addr, mode, dev_id, reg, val, mask=0):
+        self.tool.execute(bus, addr, [MdioOp.write(CANONICAL_FORMATS[mode], reg, val, mask, dev_id)])
+
+    def list_buses(self):
+        return self.tool.list_buses()
+
+    def scan_bus(self, bus):
+        return self.tool.scan_bus(bus)
+
+
+# ---------- 服务端 ----------
+
+class _BrokerHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                frame = recv_frame(self.request)
+            except (OSError, MdioError):
+                return
+            if frame is None:
+                return
+            try:
+                reply = bytes([STATUS_OK]) + self.server.dispatch(frame)
+            except MdioError as e:
+                reply = encode_error(str(e), e.index)
+            except Exception as e:
+                # 格式错误的请求（空帧、截断的字段等）只让这一个请求失败，连接继续可用
+                reply = encode_error(f"Malformed request: {e!r}")
+            try:
+                send_frame(self.request, reply)
+            except OSError:
+                return
+
+
+class MdioBroker(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """多客户端共享的 Broker，同一总线上的访问通过每总线锁串行化"""
+    daemon_threads = True
+
+    def __init__(self, path, backend):
+        self.backend = backend
+        self._bus_locks = {}
+        self._locks_guard = threading.Lock()
+        super().__init__(path, _BrokerHandler)
+
+    def bus_lock(self, bus):
+        with self._locks_guard:
+            lock = self._bus_locks.get(bus)
+            if lock is None:
+                lock = self._bus_locks[bus] = threading.Lock()
+            return lock
+
+    def dispatch(self, frame):
+        opcode = frame[0]
+        if opcode == OP_EXEC:
+            bus, addr, ops = decode_exec(frame, 1)
+            # 整个操作列表在总线锁内完成，保证分页 / 间接 MMD 访问不被其他客户端打断
+            with self.bus_lock(bus):
+                results = apply_ops(self.backend, bus, addr, ops)
+            return encode_values(results)
+        if opcode == OP_SCAN:
+            bus, _ = _unpack_str(frame, 1)
+            with self.bus_lock(bus):
+                found = self.backend.scan_bus(bus)
+            return encode_scan(found)
+        if opcode == OP_LIST:
+            buses = self.backend.list_buses()
+            return encode_buses(buses)
+        raise ValueError(f"Unknown broker opcode {opcode}")
+
+
+# ---------- 客户端 ----------
+
+class BrokerTransport(MdioTransport):
+    """
+    通过 Unix socket 访问 Broker 的传输层，每个线程持有独立连接。
+    每个请求的等待时间不超过其时间预算（见 op_budget_ms），超时后丢弃该连接
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET, op_timeout_ms=DEFAULT_OP_TIMEOUT_MS):
+        self.path = path
+        self.op_timeout_ms = op_timeout_ms
+        self._local = threading.local()
+        self._socks = {}   # {线程: 连接}，供 abort() 使用
+        self._socks_lock = threading.Lock()
+
+    def _sock(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+            except OSError as e:
+                sock.close()
+                raise MdioError(f"Cannot connect to MDIO broker at {self.path}: {e}", transient=True)
+            self._local.sock = sock
+            with self._socks_lock:
+                self._socks[threading.get_ident()] = sock
+        return sock
+
+    def _request(self, payload, timeout_ms=None):
+        timeout_ms = self.op_timeout_ms if timeout_ms is None else timeout_ms
+        sock = self._sock()
+        try:
+            sock.settimeout(timeout_ms / 1000.0)
+            with profiler.span('transport', 'broker_request', bytes=len(payload)):
+                send_frame(sock, payload)
+                reply = recv_frame(sock)
+        except OSError as e:
+            reply = None
+            err = e
+        else:
+            err = "connection closed"
+        if reply is None:
+            # 连接上可能残留半个响应，直接丢弃
+            sock.close()
+            self._local.sock = None
+            with self._socks_lock:
+                self._socks.pop(threading.get_ident(), None)
+            if isinstance(err, socket.timeout):
+                raise MdioTimeout(f"MDIO broker request timed out after {timeout_ms} ms")
+            raise MdioError(f"MDIO broker request failed: {err}", transient=True)
+        return check_reply(reply)
+
+    def execute(self, bus, addr, ops):
+        return decode_values(self._request(encode_exec(bus, addr, ops), op_budget_ms(ops, self.op_timeout_ms)), ops)
+
+    def list_buses(self):
+        return decode_buses(self._request(bytes([OP_LIST])))
+
+    def scan_bus(self, bus):
+        return decode_scan(self._request(bytes([OP_SCAN]) + _pack_str(bus)))
+
+    def abort(self, thread_id):
+        with self._socks_lock:
+            sock = self._socks.get(thread_id)
+        if sock is None:
+            return False
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            return False
+        return True
+
+
+def serve(path, backend, mode=0o660):
+    """启动 Broker 并阻塞运行，退出时清理 socket 文件"""
+    if os.path.exists(path):
+        os.unlink(path)
+    server = MdioBroker(path, backend)
+    os.chmod(path, mode)
+    print(f"[*] MDIO broker listening on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Privileged MDIO broker")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help="Unix socket path")
+    parser.add_argument('--mode', default='660', help="Socket file permissions (octal)")
+    parser.add_argument('--sim', metavar='TOPOLOGY',
+                        help="Use simulated registers, e.g. 'fixed-0:1=0x002b0980,2=0x31c31c13*'")
+    parser.add_argument('--latency-us', type=float, default=0.0,
+                        help="Simulated latency per register access (with --sim)")
+    parser.add_argument('--netlink', action='store_true',
+                        help="Access the buses through mdio-netlink instead of the mdio tool")
+    args = parser.parse_args(argv)
+
+    if args.sim:
+        from core.sim import SimulatedMdio, parse_topology
+        topology, c45_only = parse_topology(args.sim)
+        backend = SimulatedMdio(topology, c45_only, args.latency_us / 1e6)
+    elif args.netlink:
+        from core.netlink import NetlinkBackend
+        backend = NetlinkBackend()
+    else:
+        backend = MdioToolBackend()
+    serve(args.socket, backend, int(args.mode, 8))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
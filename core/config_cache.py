@@ -0,0 +1,420 @@
+"""
+配置编译缓存。
+
+首次启动时解析 configs/ 下所有 JSON，校验后把每个测试序列预编译为批量程序
+（MdioOp 中的数值已解析为 int、命令模板已预先拆分），结果用 pickle 保存在
+configs/.cache/ 下，以各 JSON 文件的 (文件名, mtime, 大小) 作为缓存键。
+之后的启动只要配置文件未变化，就直接加载缓存，不再解析 JSON、也不再做逐步的字符串处理。
+
+配置库很大时使用两阶段加载（load_config_index）：启动时只建立各配置头（identity、cmd_template、
+Read ID 序列等小块）的索引，configs/.cache/index.pickle 中按文件缓存，只有变化了的文件重新解析；
+某个配置的 test_modes 在匹配的设备第一次被使用时才加载、校验并编译（编译结果按文件缓存在
+configs/.cache/bodies/ 下），最近使用的测试树保存在有界 LRU 中。
+"""
+import collections
+import glob
+import json
+import os
+import pickle
+import threading
+import weakref
+from collections.abc import Mapping
+
+from core import profiler
+from core.sequence import (
+    build_check_op, compile_sequence, iter_sequences, read_id_sequence, resolve_default_template,
+)
+from core.shadow import RegisterAttrs
+
+# 编译结果格式变化时递增，使旧缓存失效
+CACHE_VERSION = 5
+CACHE_DIR_NAME = ".cache"
+CACHE_FILE_NAME = "compiled.pickle"
+
+
+def config_files(config_dir):
+    return sorted(glob.glob(os.path.join(config_dir, "*.json")))
+
+
+def fingerprint(files):
+    """缓存键：每个配置文件的 (文件名, mtime_ns, 大小)"""
+    key = []
+    for f in files:
+        st = os.stat(f)
+        key.append((os.path.basename(f), st.st_mtime_ns, st.st_size))
+    return (CACHE_VERSION, tuple(key))
+
+
+def parse_configs(config_dir, files):
+    """解析 JSON 配置文件，返回 (configs, common_config, 加载错误列表)"""
+    configs = []
+    common_config = {}
+    errors = []
+
+    # 首先加载 common.json
+    common_path = os.path.join(config_dir, "common.json")
+    if os.path.exists(common_path):
+        try:
+            with open(common_path, 'r') as fp:
+                common_config = json.load(fp)
+        except Exception as e:
+            errors.append(f"Failed to load {common_path}: {e}")
+
+    # 然后加载其他配置文件
+    for f in files:
+        if os.path.basename(f) == "common.json":
+            continue  # 跳过 common.json
+        try:
+            with open(f, 'r') as fp:
+                cfg = json.load(fp)
+                if 'identity' in cfg:
+                    configs.append(cfg)
+        except Exception as e:
+            errors.append(f"Failed to load {f}: {e}")
+    return configs, common_config, errors
+
+
+def compile_config(cfg, templates):
+    """
+    校验一个配置并预编译其中的每个 sequence。
+    编译结果以 [(sequence, program), ...] 的形式保存在 cfg['_programs'] 中，
+    PhyExecutor 创建时直接取用。返回发现的问题列表。
+    """
+    problems = []
+    name = cfg.get('config_name', 'Unnamed Config')
+    default_tmpl_key, found = resolve_default_template(cfg, templates)
+    if not found:
+        problems.append(f"{name}: template '{cfg.get('cmd_template')}' not found in common config")
+
+    check_config = cfg.get('check_inprogress')
+    if check_config and build_check_op(check_config, templates, default_tmpl_key) is None:
+        problems.append(f"{name}: invalid check_inprogress definition")
+
+    attrs = RegisterAttrs(cfg, templates)
+    coalesce = cfg.get('coalesce_writes', True)
+    programs = []
+    for path, sequence in iter_sequences(cfg.get('test_modes', {})):
+        try:
+            program = compile_sequence(sequence, templates, default_tmpl_key, check_config, attrs, coalesce)
+        except (ValueError, TypeError, AttributeError) as e:
+            problems.append(f"{name}: {'/'.join(path)}: {e}")
+            continue
+        for err in program.errors:
+            problems.append(f"{name}: {'/'.join(path)}: {err}")
+        programs.append((sequence, program))
+    cfg['_programs'] = programs
+    return problems
+
+
+# 模板 "backend" 字段可选的访问方式（见 core/netlink.py）
+TEMPLATE_BACKENDS = ('mdio', 'netlink')
+
+
+def check_templates(common_config):
+    problems = []
+    for key, tmpl in common_config.get('cmd_templates', {}).items():
+        if 'format' not in tmpl:
+            problems.append(f"Template '{key}' has no format string")
+        if tmpl.get('backend', 'mdio') not in TEMPLATE_BACKENDS:
+            problems.append(f"Template '{key}' has unknown backend '{tmpl['backend']}' "
+                            f"(expected one of: {', '.join(TEMPLATE_BACKENDS)})")
+    return problems
+
+
+def compile_configs(configs, common_config):
+    """校验所有配置并预编译其中的每个 sequence（见 compile_config），返回发现的问题列表"""
+    templates = common_config.get('cmd_templates', {})
+    problems = check_templates(common_config)
+    for cfg in configs:
+        problems += compile_config(cfg, templates)
+    return problems
+
+
+def load_compiled_configs(config_dir, use_cache=True):
+    """
+    加载并编译配置。返回 (configs, common_config, problems, from_cache)。
+    缓存不可读或已过期时重新编译，并尝试写回缓存（写入失败不影响运行）。
+    """
+    with profiler.span('config', 'load') as sp:
+        result = _load_compiled_configs(config_dir, use_cache)
+        sp.set(from_cache=result[3])
+    return result
+
+
+def _load_compiled_configs(config_dir, use_cache):
+    files = config_files(config_dir)
+    key = fingerprint(files)
+    cache_path = os.path.join(config_dir, CACHE_DIR_NAME, CACHE_FILE_NAME)
+
+    if use_cache and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as fp:
+                cached = pickle.load(fp)
+            if cached.get('key') == key:
+                return cached['configs'], cached['common_config'], cached['problems'], True
+        except Exception:
+            pass  # 缓存损坏或版本不兼容，重新编译
+
+    configs, common_config, problems = parse_configs(config_dir, files)
+    problems += compile_configs(configs, common_config)
+
+    if use_cache:
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as fp:
+                pickle.dump({'key': key, 'configs': configs, 'common_config': common_config,
+                             'problems': problems}, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+    return configs, common_config, problems, False
+
+
+# ---------------------------------------------------------------------------
+# 两阶段（延迟）加载
+# ---------------------------------------------------------------------------
+
+INDEX_FILE_NAME = "index.pickle"
+BODY_DIR_NAME = "bodies"
+
+# 第二阶段最多同时保留的配置数
+DEFAULT_LRU_SIZE = 32
+
+# 第二阶段才加载的键；其余顶层键（identity、cmd_template、registers 等）都在索引中
+BODY_KEYS = ('test_modes', '_programs')
+
+
+def config_header(cfg, filename):
+    """索引中保存的配置头：除 test_modes 外的所有顶层键，加上 Read ID 序列和来源文件名"""
+    header = {key: value for key, value in cfg.items() if key not in BODY_KEYS}
+    header['_read_id'] = read_id_sequence(cfg)
+    header['_file'] = filename
+    header['_body_keys'] = [key for key in BODY_KEYS if key == '_programs' or key in cfg]
+    return header
+
+
+class ConfigBody(dict):
+    """第二阶段加载的 test_modes 及其编译结果（dict 子类以便被弱引用）"""
+
+
+class LazyConfig(Mapping):
+    """
+    延迟加载的配置：索引中的键直接可用，第一次访问 test_modes / _programs 时由 ConfigLibrary 加载。
+    加载的内容保存在库的 LRU 中，LazyConfig 本身不持有。
+    """
+    __slots__ = ('header', 'library')
+
+    def __init__(self, header, library):
+        self.header = header
+        self.library = library
+
+    def __getitem__(self, key):
+        if key in BODY_KEYS:
+            return self.library.body(self)[key]
+        return self.header[key]
+
+    def __contains__(self, key):
+        if key in BODY_KEYS:
+            return key in self.header['_body_keys']
+        return key in self.header
+
+    def __iter__(self):
+        yield from self.header
+        yield from self.header['_body_keys']
+
+    def __len__(self):
+        return len(self.header) + len(self.header['_body_keys'])
+
+    # 按身份比较，避免比较时加载整个测试树
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def body(self):
+        return self.library.body(self)
+
+
+def pin_config(config):
+    """
+    使用一个配置期间应持有的对象：延迟加载的配置在持有期间不会被换出后重新加载，
+    保证其中的 sequence 对象不变（预编译程序按 id(sequence) 查找）。普通配置返回 None。
+    """
+    return config.body() if isinstance(config, LazyConfig) else None
+
+
+class ConfigLibrary:
+    """第二阶段加载器：按需加载、校验并编译配置的测试树，最近使用的保存在有界 LRU 中"""
+
+    def __init__(self, config_dir, common_config, use_cache=True, lru_size=DEFAULT_LRU_SIZE):
+        self.config_dir = config_dir
+        self.templates = common_config.get('cmd_templates', {})
+        self.use_cache = use_cache
+        self.lru_size = max(1, lru_size)
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self._lru = collections.OrderedDict()
+        # LRU 之外仍被使用中的（例如被执行器持有的）测试树
+        self._live = weakref.WeakValueDictionary()
+        self._reported = set()
+        self._lock = threading.Lock()
+        common_path = os.path.join(config_dir, "common.json")
+        self._common_key = fingerprint([common_path]) if os.path.exists(common_path) else None
+
+    def stats(self):
+        with self._lock:
+            return {"cached": len(self._lru), "loads": self.loads, "hits": self.hits, "evictions": self.evictions}
+
+    def body(self, config):
+        name = config.header['_file']
+        with self._lock:
+            body = self._lru.get(name)
+            if body is not None:
+                self._lru.move_to_end(name)
+                self.hits += 1
+                return body
+            body = self._live.get(name)
+            if body is None:
+                body = self._load(config)
+                self._live[name] = body
+            else:
+                self.hits += 1
+            self._lru[name] = body
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+                self.evictions += 1
+            return body
+
+    def _load(self, config):
+        filename = config.header['_file']
+        path = os.path.join(self.config_dir, filename)
+        cache_path = os.path.join(self.config_dir, CACHE_DIR_NAME, BODY_DIR_NAME, filename + ".pickle")
+        with profiler.span('config', 'load_body', config=config.header.get('config_name', '')) as sp:
+            try:
+                key = (fingerprint([path]), self._common_key)
+            except OSError:
+                key = None
+            body, problems = self._load_cached(cache_path, key)
+            sp.set(from_cache=body is not None)
+            if body is None:
+                body, problems = self._compile(path)
+                self._store(cache_path, key, body, problems)
+        self.loads += 1
+        if filename not in self._reported:
+            self._reported.add(filename)
+            for problem in problems:
+                print(f"[WARN] {problem}")
+        return body
+
+    def _load_cached(self, cache_path, key):
+        if not self.use_cache or key is None or not os.path.exists(cache_path):
+            return None, None
+        try:
+            with open(cache_path, 'rb') as fp:
+                cached = pickle.load(fp)
+            if cached.get('key') == key:
+                return cached['body'], cached['problems']
+        except Exception:
+            pass  # 缓存损坏或版本不兼容，重新编译
+        return None, None
+
+    def _compile(self, path):
+        try:
+            with open(path, 'r') as fp:
+                cfg = json.load(fp)
+        except Exception as e:
+            return ConfigBody(_programs=[]), [f"Failed to load {path}: {e}"]
+        problems = compile_config(cfg, self.templates)
+        return ConfigBody((key, cfg[key]) for key in BODY_KEYS if key in cfg), problems
+
+    def _store(self, cache_path, key, body, problems):
+        if not self.use_cache or key is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as fp:
+                pickle.dump({'key': key, 'body': body, 'problems': problems}, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+
+
+def _index_file(path):
+    """第一阶段解析一个文件，返回 (类型, 数据, 问题列表)"""
+    try:
+        with open(path, 'r') as fp:
+            data = json.load(fp)
+    except Exception as e:
+        return 'error', None, [f"Failed to load {path}: {e}"]
+    if os.path.basename(path) == "common.json":
+        return 'common', data, []
+    if isinstance(data, dict) and 'identity' in data:
+        return 'config', config_header(data, os.path.basename(path)), []
+    return 'other', None, []
+
+
+def load_config_index(config_dir, use_cache=True, lru_size=DEFAULT_LRU_SIZE):
+    """
+    两阶段加载的第一阶段：只建立配置头（identity、cmd_template 等）的索引，测试树在第一次使用时加载。
+    索引按文件缓存，只有变化了的文件需要重新解析。
+    返回值与 load_compiled_configs 相同：(configs, common_config, problems, from_cache)，
+    configs 中的元素为 LazyConfig。
+    """
+    with profiler.span('config', 'index') as sp:
+        result = _load_config_index(config_dir, use_cache, lru_size)
+        sp.set(from_cache=result[3], configs=len(result[0]))
+    return result
+
+
+def _load_config_index(config_dir, use_cache, lru_size):
+    files = config_files(config_dir)
+    index_path = os.path.join(config_dir, CACHE_DIR_NAME, INDEX_FILE_NAME)
+
+    cached = {}
+    if use_cache and os.path.exists(index_path):
+        try:
+            with open(index_path, 'rb') as fp:
+                data = pickle.load(fp)
+            if data.get('version') == CACHE_VERSION:
+                cached = data['files']
+        except Exception:
+            pass  # 索引损坏或版本不兼容，重新建立
+
+    entries = {}
+    reparsed = 0
+    for f in files:
+        name = os.path.basename(f)
+        stamp = fingerprint([f])
+        entry = cached.get(name)
+        if entry is None or entry[0] != stamp:
+            entry = (stamp,) + _index_file(f)
+            reparsed += 1
+        entries[name] = entry
+
+    common_entry = entries.get("common.json")
+    common_config = common_entry[2] if common_entry and common_entry[1] == 'common' else {}
+    templates = common_config.get('cmd_templates', {})
+    problems = check_templates(common_config)
+    library = ConfigLibrary(config_dir, common_config, use_cache, lru_size)
+    configs = []
+    for name in sorted(entries):
+        _, kind, data, file_problems = entries[name]
+        problems += file_problems
+        if kind != 'config':
+            continue
+        if not resolve_default_template(data, templates)[1]:
+            problems.append(f"{data.get('config_name', 'Unnamed Config')}: "
+                            f"template '{data.get('cmd_template')}' not found in common config")
+        configs.append(LazyConfig(data, library))
+
+    if use_cache and (reparsed or len(entries) != len(cached)):
+        try:
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+            tmp_path = f"{index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as fp:
+                pickle.dump({'version': CACHE_VERSION, 'files': entries}, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, index_path)
+        except OSError:
+            pass
+    return configs, common_config, problems, bool(cached) and not reparsed
@@ -1,63 +1,71 @@
-import subprocess
 import time
 
+from core import profiler
+from core.config_cache import pin_config
+from core.guard import GuardPolicy
+from core.readback import ReadbackMismatch, by_step, expected_registers, format_mismatch, mismatches, readback_ops
+from core.scheduler import PRIORITY_RESET, priority
+from core.sequence import (
+    build_check_op, build_step_op, check_points, compile_sequence, resolve_default_template,
+)
+from core.shadow import RegisterAttrs, ShadowCache
+from core.transport import MdioError, MdioOp, PollBackoff, SubprocessTransport
+
+# General_Ops 中可作为复位序列的选项名称
+RESET_OPTION_NAMES = ('Reset', 'Soft Reset', 'Hardware Reset', 'Reset Device')
+
+
+def find_reset_sequence(config):
+    """查找复位序列，支持多种可能的名称。返回 (名称, sequence)，没有时返回 (None, None)"""
+    general_ops = config.get('test_modes', {}).get('General_Ops', {})
+    for option in general_ops.get('options', []):
+        option_name = option.get('name', '')
+        # 支持多种复位操作名称
+        if option_name in RESET_OPTION_NAMES and 'sequence' in option:
+            return option_name, option['sequence']
+    return None, None
+
+
 class PhyExecutor:
-    def __init__(self, config, common_config, bus, addr_int, debug_mode=False):
+    def __init__(self, config, common_config, bus, addr_int, debug_mode=False, transport=None, batch_mode=True,
+                 shadow=None, verify=False):
         self.config = config
+        # 延迟加载的配置在执行器存在期间保持同一份测试树（见 core/config_cache.py）
+        self._pinned = pin_config(config)
         self.bus = bus
         self.addr = addr_int # 整数格式的 PHY 地址
         self.debug_mode = debug_mode  # 调试模式标志
+        # 寄存器访问传输层，默认沿用 sudo mdio 子进程方式
+        self.transport = transport or SubprocessTransport()
+        # 批量模式：整个序列编译为一个程序一次执行；关闭后逐步执行
+        self.batch_mode = batch_mode
+        self._programs = {}
+        # 可选的寄存器影子缓存（ShadowCache），可在多个会话间共享
+        self.shadow = shadow
+        self._register_attrs = None
+        # 回读确认：序列执行完后一次批量读取其写入的寄存器，确认各位已生效（见 core/readback.py）
+        self.verify = verify
         
         # 从 common 配置中获取命令模板
         self.templates = common_config.get('cmd_templates', {})
+        # 逐步执行时整个序列的截止时间（批量模式下由传输层的时间预算限制，见 core/guard.py）
+        self.sequence_timeout_ms = GuardPolicy.from_config(common_config.get('timeouts')).sequence_timeout_ms
         
-        # 获取当前配置指定的模板名称
-        cmd_template_name = config.get('cmd_template')
-        if cmd_template_name and cmd_template_name in self.templates:
-            self.default_tmpl_key = cmd_template_name
-        else:
-            # 如果没有指定或找不到，使用第一个模板作为默认
-            self.default_tmpl_key = next(iter(self.templates)) if self.templates else None
-            if cmd_template_name and cmd_template_name not in self.templates:
-                print(f"[WARN] Template '{cmd_template_name}' not found in common config. Using default: {self.default_tmpl_key}")
+        # 获取当前配置指定的模板名称，如果没有指定或找不到，使用第一个模板作为默认
+        self.default_tmpl_key, found = resolve_default_template(config, self.templates)
+        if not found:
+            print(f"[WARN] Template '{config.get('cmd_template')}' not found in common config. Using default: {self.default_tmpl_key}")
 
+        # 加载配置时预编译好的批量程序（见 core/config_cache.py）
+        for sequence, program in config.get('_programs', ()):
+            self._programs[id(sequence)] = (sequence, program)
 
-    def _calc_hex_params(self, val_raw, shift, mask_raw):
-        """
-        处理数值逻辑：
-        1. 将输入(字符串或int)转为 int
-        2. 执行左移
-        3. 格式化为 0xXXXX 字符串
-        """
-        try:
-            val = int(str(val_raw), 0)
-            mask = int(str(mask_raw), 0)
-            
-            val_shifted = val << shift
-            
-            return f"0x{val_shifted:04x}/0x{mask:04x}"
-        except ValueError as e:
-            print(f"Data format error: {e}")
-            return "0x0000/0x0000"
 
-    def _construct_command(self, template_format, params):
+    def _check_inprogress(self):
         """
-        根据模板和参数构造完整的 mdio 命令列表。
-        返回的是一个列表，例如: ['sudo', 'mdio', 'fixed-0', 'phy', '1', 'raw', '0', '0x8000/0x7FFF']
+        检查操作是否完成，根据配置中的check_inprogress设置。
+        从较短的间隔开始轮询并指数退避，超过截止时间仍未完成返回 False。
         """
-        # 1. 填充模板
-        # 模板返回的是一个字符串，例如: "mdio {bus} phy {phy_addr} raw {reg} {data}/{mask}"
-        cmd_str_no_sudo = template_format.format(**params)
-        
-        # 2. 将字符串拆分为列表
-        # ['mdio', 'fixed-0', 'phy', '1', 'raw', '0', '0x8000/0x7FFF']
-        cmd_list = cmd_str_no_sudo.split()
-        
-        # 3. 添加 sudo
-        return ["sudo"] + cmd_list
-
-    def _check_inprogress(self):
-        """检查操作是否完成，根据配置中的check_inprogress设置"""
         check_config = self.config.get('check_inprogress')
         if not check_config:
             return True  # 如果没有配置，直接返回True
@@ -65,149 +73,253 @@ class PhyExecutor:
         if self.debug_mode:
             print(f" -> Checking operation progress...")
         
-        # 获取读取模板
-        tmpl_key = check_config.get('template', self.default_tmpl_key)
-        if tmpl_key not in self.templates:
-            print(f"[ERR] Template '{tmpl_key}' not found for check_inprogress.")
-            return True  # 如果模板不存在，跳过检查
-        
-        tmpl_fmt = self.templates[tmpl_key]['format']
-        
-        # 构造读取命令参数
-        cmd_params = {
-            'bus': self.bus,
-            'phy_addr': self.addr,
-            'dev_id': check_config.get('dev_id', 0),
-            'reg': check_config.get('reg'),
-            'data': ""
-        }
-        
-        # 构造完整的命令列表
-        full_cmd_list = self._construct_command(tmpl_fmt, cmd_params)
+        poll_op = build_check_op(check_config, self.templates, self.default_tmpl_key)
+        if poll_op is None:
+            print("[WARN] Invalid check_inprogress definition (template / completed_value). Skipping check.")
+            return True
+        read_op = MdioOp.read(poll_op.fmt, poll_op.reg, poll_op.dev_id)
 
-        completed_value = check_config.get('completed_value')
         comment = check_config.get('comment', '')
-        mask_raw = check_config.get('mask', '0x0000')
-        mask = int(str(mask_raw), 0)
         if self.debug_mode:
-            print(f"    [CHECK] Looking for value: {completed_value} (mask: {mask_raw})")
-        if not completed_value:
-            print("[WARN] No completed_value specified in check_inprogress. Skipping check.")
-            return True
-        
-        max_attempts = 100  # 最大尝试次数，防止无限循环
-        attempt = 0
-        
-        while attempt < max_attempts:
+            print(f"    [CHECK] Looking for value: 0x{poll_op.val:04x} (mask: 0x{poll_op.mask:04x})")
+
+        with profiler.span('poll', 'check_inprogress') as sp:
+            return self._poll_inprogress(poll_op, read_op, comment, sp)
+
+    def _poll_inprogress(self, poll_op, read_op, comment, sp):
+        """完成检查的轮询循环，sp 记录轮询次数和累计休眠时间"""
+        poll = PollBackoff(poll_op)
+        while True:
+            sp.set(iterations=poll.iterations + 1, sleep_ms=poll.slept * 1000.0)
             try:
-                result = subprocess.run(full_cmd_list, check=True, capture_output=True, text=True)
-                if self.debug_mode:
-                    print(f" -> Exec: {' '.join(full_cmd_list):<50} # {comment}")
-                read_val = result.stdout.strip()
-                
-                # 将读取的值和目标值都转换为整数进行比较
-                try:
-                    read_int = int(str(read_val), 0)
-                    target_int = int(str(completed_value), 0)
-                    
-                    if read_int & mask == target_int:
-                        if self.debug_mode:
-                            print(f"    [CHECK] Operation completed. Value: {read_val}")
-                        return True
-                    else:
-                        if self.debug_mode:
-                            print(f"    [CHECK] Operation in progress. Current: {read_val}, Target: {completed_value}")
-                        time.sleep(0.1)  # 等待100ms
-                        attempt += 1
-                        
-                except ValueError:
-                    print(f"[ERR] Cannot compare values: read='{read_val}', target='{completed_value}'")
-                    return True
-                    
-            except subprocess.CalledProcessError as e:
+                read_int = self.transport.read(self.bus, self.addr, read_op)
+            except MdioError as e:
+                # 无法确认操作已完成，不能当作完成继续执行后面的步骤
                 print(f"[ERR] Check command failed: {e}")
+                return False
+            if self.debug_mode:
+                print(f" -> Exec: {self.transport.describe(self.bus, self.addr, read_op):<50} # {comment}")
+
+            try:
+                wait = poll.next_wait(read_int)
+            except MdioError:
+                print(f"[ERR] Operation check timed out after {poll_op.timeout} ms. Last value: 0x{read_int:04x}")
+                return False
+            if wait is None:
+                if self.debug_mode:
+                    print(f"    [CHECK] Operation completed. Value: 0x{read_int:04x}")
                 return True
-        
-        print(f"[WARN] Operation check timeout after {max_attempts} attempts. Proceeding anyway.")
+            if self.debug_mode:
+                print(f"    [CHECK] Operation in progress. Current: 0x{read_int:04x}, retry in {wait * 1000:.0f} ms")
+            with profiler.span('poll', 'sleep'):
+                time.sleep(wait)
+
+    @property
+    def register_attrs(self):
+        if self._register_attrs is None:
+            self._register_attrs = RegisterAttrs(self.config, self.templates)
+        return self._register_attrs
+
+    def _run_ops(self, ops):
+        """执行操作列表；启用影子缓存时先过滤掉可跳过的写和可由缓存回答的读"""
+        if self.shadow is None:
+            return self.transport.execute(self.bus, self.addr, ops)
+
+        decisions = self.shadow.plan(self.bus, self.addr, ops, self.register_attrs)
+        send_index = [i for i, (kind, _) in enumerate(decisions) if kind == ShadowCache.SEND]
+        send = [ops[i] for i in send_index]
+        try:
+            values = self.transport.execute(self.bus, self.addr, send) if send else []
+        except MdioError as e:
+            # 执行中断时寄存器的实际状态未知
+            self.shadow.invalidate(self.bus, self.addr)
+            if e.index is not None and e.index < len(send_index):
+                e.index = send_index[e.index]
+            raise
+        self.shadow.record_reads(self.bus, self.addr, send, values, self.register_attrs)
+
+        if self.debug_mode and len(send) < len(ops):
+            print(f"    [SHADOW] {len(ops) - len(send)} of {len(ops)} operations answered or skipped by the register cache")
+        results = [cached for _, cached in decisions]
+        for i, value in zip(send_index, values):
+            results[i] = value
+        return results
+
+    def _report_error(self, e):
+        print(f"[FATAL] {e}!")
+        if e.stderr:
+            print(f"  STDERR: {e.stderr}")
+        if e.stdout:
+            print(f"  STDOUT: {e.stdout}")
+        print("Aborting sequence.")
+
+    def compile(self, sequence):
+        """编译（并缓存）序列对应的批量程序"""
+        cached = self._programs.get(id(sequence))
+        if cached is not None and cached[0] is sequence:
+            return cached[1]
+        program = compile_sequence(sequence, self.templates, self.default_tmpl_key,
+                                   self.config.get('check_inprogress'), self.register_attrs,
+                                   self.config.get('coalesce_writes', True))
+        self._programs[id(sequence)] = (sequence, program)
+        return program
+
+    def run_sequence(self, sequence, verify=None):
+        """
+        以批量方式执行序列，不打印任何信息（供无人值守的批量测试使用）。
+        返回 (program, 每个步骤的结果)，失败时抛出 MdioError；
+        verify（默认取 self.verify）为真时回读确认，不一致时抛出 ReadbackMismatch。
+        """
+        program = self.compile(sequence)
+        with profiler.span('sequence', 'batch', ops=len(program.ops)):
+            values = self._run_ops(program.ops) if program.ops else []
+        if self.verify if verify is None else verify:
+            _, bad = self.verify_program(program)
+            if bad:
+                raise ReadbackMismatch(program, bad)
+        return program, [values[step.op_index] for step in program.steps]
+
+    def verify_program(self, program):
+        """
+        回读程序写入的寄存器（跳过自清零位、复位位和易失寄存器），所有寄存器一次批量读取，
+        不经过影子缓存。返回 (期望列表, [(Expectation, 读到的值), ...] 不一致的寄存器)
+        """
+        expectations = expected_registers(program, self.register_attrs)
+        if not expectations:
+            return expectations, []
+        ops = readback_ops(expectations)
+        with profiler.span('sequence', 'readback', registers=len(ops)):
+            values = self.transport.execute(self.bus, self.addr, ops)
+        if self.shadow is not None:
+            self.shadow.record_reads(self.bus, self.addr, ops, values, self.register_attrs)
+        return expectations, mismatches(expectations, values)
+
+    def _verify_and_report(self, program):
+        """回读确认并按步骤打印不一致的寄存器，全部一致时返回 True"""
+        try:
+            expectations, bad = self.verify_program(program)
+        except MdioError as e:
+            print(f"[ERR] Readback verification failed: {e}")
+            return False
+        for i, group in by_step(bad):
+            print(f"[ERR] Step {i + 1} not confirmed: {program.steps[i].step.get('comment', '')}")
+            for e, value in group:
+                print(f"    [VERIFY] {format_mismatch(e, value)}")
+        if bad:
+            print(f"[ERR] Readback verification: {len(bad)} of {len(expectations)} register(s) mismatched.")
+            return False
+        if expectations:
+            print(f"[INFO] Readback verified {len(expectations)} register(s) in one batch.")
         return True
 
+    @staticmethod
+    def failed_step(program, index):
+        """根据出错的操作序号找到对应的步骤序号，找不到时返回 None"""
+        if index is None:
+            return None
+        for i, step in enumerate(program.steps):
+            if index in (step.op_index, step.poll_index):
+                return i
+        return None
+
     def execute_sequence(self, sequence):
-        """执行一系列寄存器操作"""
+        """
+        执行一系列寄存器操作。
+        默认将整个序列编译为一个批量程序，一次传输层调用完成；
+        batch_mode 为 False 时逐步执行（原有行为）。
+        返回每个步骤的结果列表（READ 为读到的值，其余为 None），失败时返回 None。
+        """
+        if not self.batch_mode:
+            return self.execute_sequence_stepwise(sequence)
+
+        print(f"\n[INFO] Starting sequence execution on Bus: {self.bus}, PHY: {self.addr}...")
+        program = self.compile(sequence)
+        for err in program.errors:
+            print(f"[ERR] {err}")
+
+        if self.debug_mode:
+            shown = set()
+            for step in program.steps:
+                for index in (step.op_index, step.poll_index):
+                    if index in shown:
+                        print(f" -> (merged into previous write){'':<23} # {step.step.get('comment', '')}")
+                    elif index is not None:
+                        shown.add(index)
+                        op = program.ops[index]
+                        print(f" -> Exec: {self.transport.describe(self.bus, self.addr, op):<50} # {step.step.get('comment', '')}")
+            if program.merged:
+                print(f"[DEBUG] Coalesced {program.merged} write step(s), {program.saved} bus operation(s) saved")
+
+        try:
+            _, results = self.run_sequence(sequence, verify=False)
+        except MdioError as e:
+            i = self.failed_step(program, e.index)
+            if i is not None:
+                print(f"[ERR] Failed at step {i + 1}: {program.steps[i].step.get('comment', '')}")
+            self._report_error(e)
+            return None
+
+        for step, value in zip(program.steps, results):
+            if step.action == 'READ':
+                print(f"    [RESULT] Register {step.step.get('reg')} value: 0x{value:04x}")
+
+        if self.verify and not self._verify_and_report(program):
+            return None
+        print("[INFO] Sequence completed.\n")
+        return results
+
+    def execute_sequence_stepwise(self, sequence):
+        """逐步执行寄存器操作，每一步都是一次独立的传输层调用"""
         print(f"\n[INFO] Starting sequence execution on Bus: {self.bus}, PHY: {self.addr}...")
 
+        built = []
         for step in sequence:
-            # 1. 获取模板
-            action = step.get('action', 'WRITE').upper() # 默认为写入操作
-            # 优先使用步骤中定义的 cmd_template，否则使用默认模板
-            tmpl_key = step.get('template', self.default_tmpl_key)
-            if tmpl_key not in self.templates:
-                print(f"[ERR] Template '{tmpl_key}' not found in config.")
-                continue
-            
-            tmpl_fmt = self.templates[tmpl_key]['format']
-
-            # 构造命令的基本参数字典
-            cmd_params = {
-                'bus': self.bus,
-                'phy_addr': self.addr,
-                'dev_id': step.get('dev_id', 0),
-                'reg': step.get('reg'),
-                'data': ""
-            }
-            
-            # --- 区分读/写操作 ---
-            if action == 'WRITE':
-                # 写入操作：需要计算 DATA/MASK
-                shift = step.get('shift', 0)
-                val = step.get('val', 0)
-                mask = step.get('mask', "0x0000")
-                data_hex = self._calc_hex_params(val, shift, mask)
-                cmd_params['data'] = data_hex
-                
-            elif action == 'READ':
-                # 读取操作：不需要 DATA/MASK 字段，命令由专门的读取模板构造
-                pass
-            
-            else:
-                print(f"[ERR] Unknown action type: {action}. Skipping step.")
+            try:
+                action, op = build_step_op(step, self.templates, self.default_tmpl_key)
+            except ValueError as e:
+                print(f"[ERR] {e}")
                 continue
+            built.append((step, action, op))
+        # 按 check_inprogress 策略决定在哪些步骤之后检查操作进度
+        points = check_points([(step, action) for step, action, _ in built], self.config.get('check_inprogress'))
 
-            # 4. 构造完整的命令列表
-            full_cmd_list = self._construct_command(tmpl_fmt, cmd_params)
-
+        results = []
+        deadline = time.monotonic() + self.sequence_timeout_ms / 1000.0
+        for i, (step, action, op) in enumerate(built):
             comment = step.get('comment', '')
+            if time.monotonic() > deadline:
+                print(f"[ERR] Sequence exceeded its deadline of {self.sequence_timeout_ms} ms before step {i + 1}: {comment}")
+                print("Aborting sequence.")
+                return None
             if self.debug_mode:
-                print(f" -> Exec: {' '.join(full_cmd_list):<50} # {comment}")
+                print(f" -> Exec: {self.transport.describe(self.bus, self.addr, op):<50} # {comment}")
+
+            if action == 'DELAY':
+                with profiler.span('sequence', 'delay', ms=op.interval):
+                    time.sleep(op.interval / 1000.0)
+                results.append(None)
+                continue
             
-            # 5. 调用系统命令
+            # 通过传输层执行寄存器访问
             try:
-                # 使用列表形式执行命令，安全且不会启动 shell
-                # check=True: 如果命令返回非零值（失败），则抛出异常
-                result = subprocess.run(full_cmd_list, check=True, capture_output=True, text=True)
-                # --- 处理返回值 ---
-                if action == 'READ':
-                    read_val = result.stdout.strip()
-                    print(f"    [RESULT] Register {step.get('reg')} value: {read_val}")
-                # 在执行每个步骤之后检查操作进度
-                if not self._check_inprogress():
-                    print("[WARN] Operation check failed, but continuing...")
-            
+                with profiler.span('sequence', 'step', action=action, reg=op.reg):
+                    read_val = self._run_ops([op])[0]
+            except MdioError as e:
+                self._report_error(e)
+                return None
+            # --- 处理返回值 ---
+            if action == 'READ':
+                print(f"    [RESULT] Register {step.get('reg')} value: 0x{read_val:04x}")
+            results.append(read_val)
 
-            except subprocess.CalledProcessError as e:
-                print(f"[FATAL] Command failed with error code {e.returncode}!")
-                print(f"  STDERR: {e.stderr.strip()}")
-                print(f"  STDOUT: {e.stdout.strip()}")
+            if i in points and not self._check_inprogress():
                 print("Aborting sequence.")
-                return 
-            except FileNotFoundError:
-                print("[FATAL] 'sudo' or 'mdio' command not found. Aborting sequence.")
-                return
-
-            # 模拟延时 (可选)
-            # time.sleep(0.1)
+                return None
 
+        if self.verify and not self._verify_and_report(self.compile(sequence)):
+            return None
         print("[INFO] Sequence completed.\n")
-        # input("Press Enter to continue...")
+        return results
 
     def show_menu_recursive(self, options, depth=0):
         """递归显示多级菜单"""
@@ -262,26 +374,25 @@ class PhyExecutor:
             else:
                 print("Invalid selection.")
 
+    def find_reset_sequence(self):
+        return find_reset_sequence(self.config)
+
     def reset_device(self):
         """对当前设备进行复位操作"""
         print(f"\n[INFO] Resetting device on Bus: {self.bus}, PHY: {self.addr}...")
         
-        # 查找复位序列，支持多种可能的名称
-        reset_sequence = None
-        if 'test_modes' in self.config and 'General_Ops' in self.config['test_modes']:
-            general_ops = self.config['test_modes']['General_Ops']
-            if 'options' in general_ops:
-                for option in general_ops['options']:
-                    option_name = option.get('name', '')
-                    # 支持多种复位操作名称
-                    if option_name in ['Reset', 'Soft Reset', 'Hardware Reset', 'Reset Device'] and 'sequence' in option:
-                        reset_sequence = option['sequence']
-                        print(f" -> Found reset sequence: {option_name}")
-                        break
-        
+        option_name, reset_sequence = self.find_reset_sequence()
+        if reset_sequence:
+            print(f" -> Found reset sequence: {option_name}")
+
+        if self.shadow is not None:
+            self.shadow.invalidate(self.bus, self.addr)
+
         if reset_sequence:
             print(" -> Executing device reset sequence...")
-            self.execute_sequence(reset_sequence)
+            # 复位请求在总线调度器中优先于其他请求执行
+            with priority(PRIORITY_RESET), profiler.span('sequence', 'reset', bus=self.bus, addr=self.addr):
+                self.execute_sequence(reset_sequence)
             print("[INFO] Device reset completed.")
         else:
             print("[WARN] No reset sequence found in configuration. Skipping reset.")
@@ -0,0 +1,354 @@
+"""
+无人值守的批量测试计划执行器。
+
+测试计划为 JSON 文件，按路径指定要执行的测试模式，并按芯片名称 / ID / 总线选择目标设备：
+
+    {
+      "targets": [
+        { "chip": "88Q2112*" },
+        { "phy_id": "0x002b0980", "phy_id_mask": "0xfffffff0", "bus": "fixed-*" }
+      ],
+      "tests": ["General_Ops/Read ID", "1000M_Test_Mode/*Test Mode-1*"],
+      "reset_after": true,
+      "stop_on_failure": true,
+      "snapshot_diff": true,
+      "verify": true,
+      "lockstep": true
+    }
+
+  - targets 中任意一个选择器匹配即选中设备；选择器内的各字段需同时满足。
+    省略 targets 时选中所有有配置的设备。
+  - 路径由 test_modes 中的各级名称以 "/" 连接而成，支持通配符（fnmatch）。
+  - 同一总线上的设备依次执行，不同总线之间并发。
+  - snapshot_diff 为 true 时在每个测试前后各拍一次寄存器快照（见 core/snapshot.py），
+    结果中的 changes 列出该测试改变了的寄存器。
+  - verify 为 true 时每个测试执行完后一次批量回读其写入的寄存器（见 core/readback.py），
+    不一致时测试失败，结果中的 mismatches 列出不一致的寄存器。
+  - lockstep 为 true 时使用同一配置的所有选中设备（多端口 PHY 的各端口）作为一组，
+    每个测试在组内逐步同步执行并回读确认（见 core/group.py），结果中的 lockstep 记录端口间偏差。
+"""
+import fnmatch
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core import profiler
+from core.executor import PhyExecutor
+from core.group import GroupExecutor
+from core.readback import ReadbackMismatch, format_mismatch
+from core.scheduler import PRIORITY_RESET, inherit_priority, priority
+from core.sequence import iter_sequences, sequence_path
+from core.snapshot import SnapshotTaker, diff_captures, format_register
+from core.transport import MdioError, to_int
+
+STATUS_PASS = 'pass'
+STATUS_FAIL = 'fail'
+STATUS_SKIPPED = 'skipped'
+
+# 选择器中支持的字段
+SELECTOR_KEYS = ('chip', 'config', 'phy_id', 'phy_id_mask', 'bus', 'addr')
+
+
+def _glob(pattern, text):
+    return fnmatch.fnmatchcase(text.lower(), str(pattern).lower())
+
+
+def _ms(seconds):
+    return round(seconds * 1000.0, 3)
+
+
+class FleetPlan:
+    """解析并校验后的测试计划"""
+
+    def __init__(self, data):
+        if not isinstance(data, dict):
+            raise ValueError("Plan must be a JSON object")
+        tests = data.get('tests')
+        if not tests or not isinstance(tests, list):
+            raise ValueError("Plan has no 'tests' list")
+        self.tests = [str(t) for t in tests]
+
+        self.targets = []
+        for selector in data.get('targets', []):
+            unknown = set(selector) - set(SELECTOR_KEYS)
+            if unknown:
+                raise ValueError(f"Unknown target selector field(s): {', '.join(sorted(unknown))}")
+            parsed = dict(selector)
+            for key in ('phy_id', 'addr'):
+                if key in parsed:
+                    parsed[key] = to_int(parsed[key])
+            parsed['phy_id_mask'] = to_int(parsed.get('phy_id_mask'), 0xFFFFFFFF)
+            self.targets.append(parsed)
+
+        self.reset_after = bool(data.get('reset_after', False))
+        self.stop_on_failure = bool(data.get('stop_on_failure', True))
+        self.snapshot_diff = bool(data.get('snapshot_diff', False))
+        self.verify = bool(data.get('verify', False))
+        self.lockstep = bool(data.get('lockstep', False))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as fp:
+            return cls(json.load(fp))
+
+    def selects(self, hw, cfg):
+        """设备 (扫描结果, 匹配的配置) 是否被计划选中"""
+        if cfg is None:
+            return False
+        if not self.targets:
+            return True
+        return any(self._match(selector, hw, cfg) for selector in self.targets)
+
+    @staticmethod
+    def _match(selector, hw, cfg):
+        if 'chip' in selector and not _glob(selector['chip'], cfg['identity'].get('chip_name', '')):
+            return False
+        if 'config' in selector and not _glob(selector['config'], cfg.get('config_name', '')):
+            return False
+        if 'phy_id' in selector:
+            mask = selector['phy_id_mask']
+            if hw['phy_id'] & mask != selector['phy_id'] & mask:
+                return False
+        if 'bus' in selector and not _glob(selector['bus'], hw['bus']):
+            return False
+        if 'addr' in selector and hw['addr_int'] != selector['addr']:
+            return False
+        return True
+
+    def resolve_tests(self, cfg):
+        """
+        按计划中的顺序展开配置里匹配的序列。
+        返回 ([(路径字符串, sequence), ...], 没有匹配任何序列的路径模式列表)
+        """
+        available = [(sequence_path(path), seq) for path, seq in iter_sequences(cfg.get('test_modes', {}))]
+        selected = []
+        missing = []
+        for pattern in self.tests:
+            matched = [(path, seq) for path, seq in available if fnmatch.fnmatchcase(path, pattern)]
+            if not matched:
+                missing.append(pattern)
+            selected.extend(matched)
+        return selected, missing
+
+
+class FleetRunner:
+    """对所有选中的设备执行测试计划，返回可序列化为 JSON 的结果"""
+
+    def __init__(self, common_config, transport, identity_index, workers, shadow=None):
+        self.common_config = common_config
+        self.transport = transport
+        self.identity_index = identity_index
+        self.workers = workers
+        self.shadow = shadow
+        self.snapshots = SnapshotTaker(common_config, transport, identity_index, workers)
+
+    def select(self, plan, devices):
+        """返回 [(扫描结果, 配置), ...]"""
+        selected = []
+        for hw in devices:
+            cfg = self.identity_index.resolve(hw['phy_id'])
+            if plan.selects(hw, cfg):
+                selected.append((hw, cfg))
+        return selected
+
+    def run_device(self, plan, hw, cfg):
+        """
+        执行一个设备的全部测试。MdioError 记在各测试中；其他意外异常记为该设备失败（"error"），
+        不影响同一总线上的其他设备
+        """
+        start = time.monotonic()
+        result = self._device_result(hw, cfg, [], [])
+        try:
+            tests, missing = plan.resolve_tests(cfg)
+            result = self._device_result(hw, cfg, tests, missing)
+            self._run_device_tests(plan, hw, cfg, tests, result)
+        except Exception as e:
+            result['status'] = STATUS_FAIL
+            result['error'] = f"Unexpected error: {e!r}"
+        result['elapsed_ms'] = _ms(time.monotonic() - start)
+        return result
+
+    def _run_device_tests(self, plan, hw, cfg, tests, result):
+        executor = PhyExecutor(cfg, self.common_config, hw['bus'], hw['addr_int'],
+                               transport=self.transport, shadow=self.shadow, verify=plan.verify)
+        for path, sequence in tests:
+            before = self.snapshots.capture_device(hw, cfg) if plan.snapshot_diff else None
+            test = self._run_test(executor, path, sequence)
+            if before is not None:
+                self._add_changes(test, before, self.snapshots.capture_device(hw, cfg))
+            result['tests'].append(test)
+            if test['status'] == STATUS_FAIL:
+                result['status'] = STATUS_FAIL
+                if plan.stop_on_failure:
+                    break
+
+        if plan.reset_after:
+            name, sequence = executor.find_reset_sequence()
+            if sequence is not None:
+                if self.shadow is not None:
+                    self.shadow.invalidate(hw['bus'], hw['addr_int'])
+                with priority(PRIORITY_RESET):
+                    reset = self._run_test(executor, f"General_Ops/{name}", sequence)
+                result['reset'] = reset
+                if reset['status'] == STATUS_FAIL:
+                    result['status'] = STATUS_FAIL
+
+    @staticmethod
+    def _run_test(executor, path, sequence):
+        start = time.monotonic()
+        test = {"path": path, "status": STATUS_PASS}
+        with profiler.span('fleet', 'test', path=path, bus=executor.bus, addr=executor.addr):
+            FleetRunner._run_test_body(executor, sequence, test)
+        test['elapsed_ms'] = _ms(time.monotonic() - start)
+        return test
+
+    @staticmethod
+    def _run_test_body(executor, sequence, test):
+        program = executor.compile(sequence)
+        if program.errors:
+            test['warnings'] = list(program.errors)
+        try:
+            _, values = executor.run_sequence(sequence)
+        except MdioError as e:
+            test['status'] = STATUS_FAIL
+            test['error'] = str(e)
+            i = executor.failed_step(program, e.index)
+            if i is not None:
+                test['failed_step'] = i + 1
+                test['failed_comment'] = program.steps[i].step.get('comment', '')
+            if isinstance(e, ReadbackMismatch):
+                test['mismatches'] = [format_mismatch(expectation, value) for expectation, value in e.mismatches]
+        else:
+            reads = []
+            for i, (step, value) in enumerate(zip(program.steps, values)):
+                if step.action == 'READ':
+                    op = program.ops[step.op_index]
+                    reads.append({"step": i + 1, "dev_id": f"0x{op.dev_id:02x}", "reg": f"0x{op.reg:04x}",
+                                  "value": f"0x{value:04x}", "comment": step.step.get('comment', '')})
+            if reads:
+                test['reads'] = reads
+
+    @staticmethod
+    def _add_changes(test, before, after):
+        error = before[0]['error'] or after[0]['error']
+        if error:
+            test['snapshot_error'] = error
+            return
+        test['changes'] = [{"register": format_register(c['space'], c['dev_id'], c['reg']),
+                            "old": f"0x{c['old']:04x}", "new": f"0x{c['new']:04x}", "volatile": c['volatile']}
+                           for c in diff_captures(before, after)]
+
+    def _run_bus(self, plan, targets):
+        return [self.run_device(plan, hw, cfg) for hw, cfg in targets]
+
+    def _device_result(self, hw, cfg, tests, missing):
+        return {
+            "bus": hw['bus'],
+            "addr": hw['addr_hex'],
+            "phy_id": f"0x{hw['phy_id']:08x}",
+            "chip": cfg['identity'].get('chip_name', ''),
+            "config": cfg.get('config_name', ''),
+            "status": STATUS_PASS if tests else STATUS_SKIPPED,
+            "missing_tests": missing,
+            "tests": [],
+        }
+
+    def _apply_group(self, group, path, sequence, results):
+        """在组内同步执行一个测试，把各端口的结果追加到 results 中对应的设备；返回是否全部通过"""
+        start = time.monotonic()
+        with profiler.span('fleet', 'lockstep_test', path=path, ports=len(group.members)):
+            outcome = group.apply(sequence)
+        elapsed = _ms(time.monotonic() - start)
+        lockstep = {key: outcome[key] for key in ('max_skew_ms', 'mean_skew_ms', 'final_skew_ms', 'registers')}
+        ok = True
+        for result, port in zip(results, outcome['ports']):
+            test = {"path": path, "status": port['status'], "elapsed_ms": elapsed, "lockstep": lockstep}
+            for key in ('error', 'failed_step', 'failed_comment', 'mismatches'):
+                if key in port:
+                    test[key] = port[key]
+            result['tests'].append(test)
+            if port['status'] != STATUS_PASS:
+                result['status'] = STATUS_FAIL
+                ok = False
+        return ok
+
+    def run_group(self, plan, targets):
+        """lockstep 模式：targets 为使用同一配置的 [(扫描结果, 配置), ...]；意外异常记为组内各设备失败"""
+        start = time.monotonic()
+        cfg = targets[0][1]
+        results = [self._device_result(hw, c, [], []) for hw, c in targets]
+        try:
+            tests, missing = plan.resolve_tests(cfg)
+            results = [self._device_result(hw, c, tests, missing) for hw, c in targets]
+            self._run_group_tests(plan, targets, tests, results)
+        except Exception as e:
+            for result in results:
+                result['status'] = STATUS_FAIL
+                result['error'] = f"Unexpected error: {e!r}"
+
+        elapsed = _ms(time.monotonic() - start)
+        for result in results:
+            result['elapsed_ms'] = elapsed
+        return results
+
+    def _run_group_tests(self, plan, targets, tests, results):
+        cfg = targets[0][1]
+        group = GroupExecutor(cfg, self.common_config, [(hw['bus'], hw['addr_int']) for hw, _ in targets],
+                              transport=self.transport, shadow=self.shadow)
+        for path, sequence in tests:
+            before = [self.snapshots.capture_device(hw, c) for hw, c in targets] if plan.snapshot_diff else None
+            ok = self._apply_group(group, path, sequence, results)
+            if before is not None:
+                for result, (hw, c), snap in zip(results, targets, before):
+                    self._add_changes(result['tests'][-1], snap, self.snapshots.capture_device(hw, c))
+            if not ok and plan.stop_on_failure:
+                break
+
+        if plan.reset_after:
+            name, sequence = group.find_reset_sequence()
+            if sequence is not None:
+                if self.shadow is not None:
+                    for hw, _ in targets:
+                        self.shadow.invalidate(hw['bus'], hw['addr_int'])
+                with priority(PRIORITY_RESET):
+                    self._apply_group(group, f"General_Ops/{name}", sequence, results)
+                for result in results:
+                    result['reset'] = result['tests'].pop()
+
+    def run(self, plan, devices):
+        """
+        对 devices（PhyScanner.discover 的结果）执行计划。
+        同一总线上的设备在一个任务中依次执行，保证总线访问串行化。
+        """
+        start = time.monotonic()
+        selected = self.select(plan, devices)
+
+        if plan.lockstep:
+            # 同一配置的设备为一组，组内的并发由 GroupExecutor 负责，各组依次执行
+            by_config = {}
+            for hw, cfg in selected:
+                by_config.setdefault(id(cfg), []).append((hw, cfg))
+            results = [r for targets in by_config.values() for r in self.run_group(plan, targets)]
+        else:
+            by_bus = {}
+            for hw, cfg in selected:
+                by_bus.setdefault(hw['bus'], []).append((hw, cfg))
+            groups = list(by_bus.values())
+
+            workers = max(1, min(self.workers, len(groups) or 1))
+            if workers == 1:
+                per_bus = [self._run_bus(plan, targets) for targets in groups]
+            else:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mdio-fleet") as pool:
+                    per_bus = list(pool.map(inherit_priority(lambda targets: self._run_bus(plan, targets)), groups))
+            results = [r for rs in per_bus for r in rs]
+        summary = {STATUS_PASS: 0, STATUS_FAIL: 0, STATUS_SKIPPED: 0}
+        for r in results:
+            summary[r['status']] += 1
+        return {
+            "devices_found": len(devices),
+            "devices_selected": len(selected),
+            "summary": summary,
+            "elapsed_ms": _ms(time.monotonic() - start),
+            "devices": results,
+        }
@@ -0,0 +1,202 @@
+"""
+多端口 PHY 的同步（lockstep）执行。
+
+对多端口器件（四端口 88Q2112、LAN743x / 78xx 等）做一致性测试时，所有端口需要进入同一测试模式。
+GroupExecutor 接收使用同一配置的一组 (bus, addr)，把编译好的批量程序按步骤拆分，
+每一步依次发给所有端口之后才进入下一步：
+  - 同一总线上的端口在一个线程中紧接着执行，不同总线之间并发，每一步结束时同步；
+  - 延时步骤对整个组只执行一次，完成检查轮询在各端口上分别执行；
+  - 每一步记录各端口完成的时刻，端口间的偏差（skew）为最晚与最早之差；
+  - 全部步骤完成后对每个端口做一次批量回读（见 core/readback.py），确认各端口都进入了请求的模式。
+出错的端口退出后续步骤，其余端口继续执行。
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core import profiler
+from core.executor import PhyExecutor
+from core.readback import expected_registers, format_mismatch, mismatches, readback_ops
+from core.scheduler import PRIORITY_RESET, inherit_priority, priority
+from core.transport import ACTION_DELAY, ACTION_WRITE, MdioError
+
+
+def _ms(seconds):
+    return round(seconds * 1000.0, 3)
+
+
+def program_stages(program):
+    """
+    按步骤拆分批量程序，返回 [(步骤序号, 操作列表), ...]。
+    与前一步合并了的写（见 core/optimizer.py）不再单独成为一步；操作列表只含一个延时的为延时步骤。
+    """
+    stages = []
+    seen = set()
+    for i, step in enumerate(program.steps):
+        ops = []
+        for index in (step.op_index, step.poll_index):
+            if index is not None and index not in seen:
+                seen.add(index)
+                ops.append(program.ops[index])
+        if ops:
+            stages.append((i, ops))
+    return stages
+
+
+class GroupExecutor(PhyExecutor):
+    """
+    同一配置的一组端口。菜单、序列查找等沿用 PhyExecutor（以第一个端口为代表），
+    execute_sequence / reset_device 作用于组内所有端口。
+    """
+
+    def __init__(self, config, common_config, targets, debug_mode=False, transport=None, shadow=None):
+        if not targets:
+            raise ValueError("GroupExecutor needs at least one target")
+        bus, addr = targets[0]
+        super().__init__(config, common_config, bus, addr, debug_mode, transport, True, shadow)
+        self.members = [PhyExecutor(config, common_config, b, a, debug_mode, self.transport, True, shadow)
+                        for b, a in targets]
+        for member in self.members:
+            member._programs = self._programs   # 同一配置，共享编译结果
+        self.by_bus = {}
+        for member in self.members:
+            self.by_bus.setdefault(member.bus, []).append(member)
+
+    @staticmethod
+    def port_name(member):
+        return f"{member.bus}:0x{member.addr:02x}"
+
+    def _each_bus(self, pool, members, fn):
+        """对 members 中的每个端口执行 fn，同一总线依次、不同总线并发；返回 {member: 结果或 MdioError}"""
+        by_bus = {}
+        for member in members:
+            by_bus.setdefault(member.bus, []).append(member)
+
+        def visit(bus_members):
+            out = []
+            for member in bus_members:
+                try:
+                    out.append((member, fn(member)))
+                except MdioError as e:
+                    out.append((member, e))
+            return out
+
+        if pool is None or len(by_bus) == 1:
+            per_bus = [visit(ms) for ms in by_bus.values()]
+        else:
+            per_bus = list(pool.map(inherit_priority(visit), by_bus.values()))
+        return {member: result for out in per_bus for member, result in out}
+
+    def apply(self, sequence):
+        """
+        对组内所有端口同步执行序列并回读确认。返回可序列化为 JSON 的结果：
+        {"ports": [...], "steps", "registers", "max_skew_ms", "mean_skew_ms", "final_skew_ms", "elapsed_ms"}
+        """
+        start = time.monotonic()
+        program = self.compile(sequence)
+        ports = {member: {"port": self.port_name(member), "status": "pass"} for member in self.members}
+        pool = ThreadPoolExecutor(max_workers=len(self.by_bus), thread_name_prefix="mdio-group") \
+            if len(self.by_bus) > 1 else None
+        try:
+            with profiler.span('group', 'lockstep', ports=len(self.members), steps=len(program.steps)):
+                active, skews, final_skew = self._lockstep(pool, program, ports)
+            expectations = expected_registers(program, self.register_attrs)
+            if expectations and active:
+                with profiler.span('group', 'readback', ports=len(active), registers=len(expectations)):
+                    self._readback(pool, active, expectations, ports)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        return {
+            "ports": [ports[member] for member in self.members],
+            "steps": len(program.steps),
+            "registers": len(expectations),
+            "max_skew_ms": _ms(max(skews, default=0.0)),
+            "mean_skew_ms": _ms(sum(skews) / len(skews)) if skews else 0.0,
+            "final_skew_ms": _ms(final_skew),
+            "elapsed_ms": _ms(time.monotonic() - start),
+        }
+
+    def _lockstep(self, pool, program, ports):
+        """逐步执行，返回 (仍然正常的端口, 各步骤的偏差, 最后一个写步骤的偏差)"""
+        active = list(self.members)
+        skews = []
+        final_skew = 0.0
+        for i, ops in program_stages(program):
+            if not active:
+                break
+            if len(ops) == 1 and ops[0].action == ACTION_DELAY:
+                time.sleep(ops[0].interval / 1000.0)
+                continue
+
+            def run(member):
+                member._run_ops(ops)
+                return time.monotonic()
+
+            done = self._each_bus(pool, active, run)
+            times = []
+            for member in list(active):
+                result = done[member]
+                if isinstance(result, MdioError):
+                    active.remove(member)
+                    ports[member].update(status="fail", error=str(result), failed_step=i + 1,
+                                         failed_comment=program.steps[i].step.get('comment', ''))
+                else:
+                    times.append(result)
+            if len(times) > 1:
+                skew = max(times) - min(times)
+                skews.append(skew)
+                if any(op.action == ACTION_WRITE for op in ops):
+                    final_skew = skew
+                if self.debug_mode:
+                    print(f"    [GROUP] Step {i + 1}: skew {skew * 1000:.3f} ms "
+                          f"# {program.steps[i].step.get('comment', '')}")
+        return active, skews, final_skew
+
+    def _readback(self, pool, active, expectations, ports):
+        """每个端口一次批量读取，不经过影子缓存"""
+        ops = readback_ops(expectations)
+        read = self._each_bus(pool, active, lambda member: self.transport.execute(member.bus, member.addr, ops))
+        for member in active:
+            values = read[member]
+            if isinstance(values, MdioError):
+                ports[member].update(status="fail", error=f"Readback failed: {values}")
+                continue
+            bad = mismatches(expectations, values)
+            if bad:
+                ports[member].update(status="fail", mismatches=[format_mismatch(e, value) for e, value in bad])
+
+    def execute_sequence(self, sequence):
+        print(f"\n[INFO] Applying sequence to {len(self.members)} port(s) in lockstep: "
+              f"{', '.join(self.port_name(m) for m in self.members)}")
+        program = self.compile(sequence)
+        for err in program.errors:
+            print(f"[ERR] {err}")
+        result = self.apply(sequence)
+        failed = [p for p in result['ports'] if p['status'] != "pass"]
+        for port in failed:
+            if 'failed_step' in port:
+                print(f"[ERR] {port['port']}: failed at step {port['failed_step']}: {port['error']}")
+            elif 'error' in port:
+                print(f"[ERR] {port['port']}: {port['error']}")
+            for line in port.get('mismatches', ()):
+                print(f"[ERR] {port['port']}: {line}")
+        print(f"[INFO] Lockstep: {result['steps']} step(s) in {result['elapsed_ms']:.1f} ms, "
+              f"max skew {result['max_skew_ms']:.3f} ms, final skew {result['final_skew_ms']:.3f} ms")
+        if not failed:
+            print(f"[INFO] Readback confirmed {result['registers']} register(s) on all {len(self.members)} port(s).\n")
+        return result
+
+    def reset_device(self):
+        """对组内所有端口同步执行复位序列"""
+        option_name, reset_sequence = self.find_reset_sequence()
+        if not reset_sequence:
+            print("[WARN] No reset sequence found in configuration. Skipping reset.")
+            return
+        print(f"\n[INFO] Resetting {len(self.members)} port(s) with: {option_name}")
+        if self.shadow is not None:
+            for member in self.members:
+                self.shadow.invalidate(member.bus, member.addr)
+        with priority(PRIORITY_RESET):
+            self.execute_sequence(reset_sequence)
+
@@ -0,0 +1,357 @@
+"""
+访问超时、有限重试、看门狗与熔断。
+
+一个卡住的 mdio 进程（或等待 sudo 密码的提示）原本会让整个会话无限期地阻塞，
+批量测试中一个坏的 PHY 或总线也会拖住其他设备。GuardedTransport 包装实际的传输层
+（位于调度器之下，在各总线的工作线程中执行）：
+
+  - 时间预算：一次 execute 的预算为每次总线访问 op_timeout_ms，加上其中的延时与轮询超时
+    （见 op_budget_ms），不超过 sequence_timeout_ms（批量模式下一个序列就是一次调用）。
+    子进程 / Broker / netlink 传输层自己按预算终止访问；
+  - 看门狗：后台线程检查正在进行的调用，超过预算加宽限期仍未返回的调用被报告并终止
+    （transport.abort()：终止 mdio 子进程、关闭 Broker 连接），调用以 MdioTimeout 失败；
+  - 重试：偶发错误（MdioError.transient：mdio 进程报告 EBUSY / EIO / EAGAIN、连接中断等）
+    最多重试 retries 次，间隔从 retry_backoff_ms 起指数增长并带随机抖动。
+    出错位置（MdioError.index）之前只有写 / 延时时从出错的操作继续，否则整个操作列表从头重试；
+    按 mdio 的写语义 new = (old & mask) | val，重复执行普通的写结果相同，但要重新执行的操作中
+    有复位 / 自清零位的写或易失寄存器（锁存位、读后清零的计数器）的读时不重试，直接失败
+    （寄存器属性来自 PHY 的芯片配置，见 core/shadow.py，未知的 PHY 按 IEEE 标准寄存器判断）。
+    超时、轮询超时、输出无法解析等错误不重试；
+  - 熔断：同一 PHY 连续失败 breaker_threshold 次后，breaker_cooldown_s 秒内对它的访问
+    直接失败（CircuitOpen），冷却后只放行一次试探（试探完成前其他访问仍被拒绝），成功则恢复；同一总线上连续的超时达到阈值、
+    并且涉及不止一个 PHY 时整条总线熔断（只有一个 PHY 卡住时只熔断该 PHY）。
+
+配置为 common.json 中的 "timeouts" 段（均可省略），命令行 --op-timeout MS、--sequence-timeout MS、
+--retries N 优先；--no-guard 不使用本层：
+
+    "timeouts": {"op_timeout_ms": 5000, "sequence_timeout_ms": 120000, "retries": 2,
+                 "retry_backoff_ms": 20, "breaker_threshold": 3, "breaker_cooldown_s": 30}
+"""
+import random
+import threading
+import time
+
+from core import profiler
+from core.shadow import RegisterAttrs, repeatable
+from core.transport import (
+    ACTION_DELAY, ACTION_WRITE, DEFAULT_OP_TIMEOUT_MS, MdioError, MdioTimeout, MdioTransport, op_budget_ms, to_int,
+)
+
+DEFAULT_POLICY = {
+    "op_timeout_ms": DEFAULT_OP_TIMEOUT_MS,
+    "sequence_timeout_ms": 120000,
+    "retries": 2,
+    "retry_backoff_ms": 20,
+    "breaker_threshold": 3,
+    "breaker_cooldown_s": 30,
+}
+
+# 看门狗在预算之外额外等待的时间（传输层自己的超时应当先生效）与检查间隔
+WATCHDOG_GRACE = 2.0
+WATCHDOG_INTERVAL = 0.25
+
+
+class GuardPolicy:
+    """超时、重试与熔断参数"""
+
+    def __init__(self, **values):
+        unknown = set(values) - set(DEFAULT_POLICY)
+        if unknown:
+            raise ValueError(f"Unknown timeout setting(s): {', '.join(sorted(unknown))}")
+        merged = dict(DEFAULT_POLICY, **values)
+        for key, value in merged.items():
+            try:
+                value = to_int(value, -1)
+            except (TypeError, ValueError):
+                value = -1
+            if value < 0:
+                raise ValueError(f"Invalid value for '{key}': {merged[key]!r}")
+            setattr(self, key, value)
+
+    @classmethod
+    def from_config(cls, section, overrides=None):
+        """section 为 common.json 中的 "timeouts" 段，overrides 中值为 None 的项被忽略"""
+        values = dict(section or {})
+        values.update({k: v for k, v in (overrides or {}).items() if v is not None})
+        return cls(**values)
+
+    def budget_ms(self, ops):
+        return min(op_budget_ms(ops, self.op_timeout_ms), self.sequence_timeout_ms)
+
+    def backoff(self, attempt):
+        """第 attempt 次重试前的等待时间（秒）：指数增长，随机抖动为 50%–150%"""
+        return self.retry_backoff_ms * (2 ** attempt) * random.uniform(0.5, 1.5) / 1000.0
+
+
+class CircuitOpen(MdioError):
+    """熔断期间的访问被直接拒绝"""
+
+
+class CircuitBreaker:
+    """
+    按键统计连续失败次数，达到阈值（且失败来自至少 min_sources 个不同来源）后熔断 cooldown 秒
+    """
+
+    def __init__(self, threshold, cooldown, min_sources=1):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.min_sources = min_sources
+        self._state = {}   # key -> [连续失败次数, 熔断时刻或 None, 失败来源, 试探开始时刻或 None]
+        self._lock = threading.Lock()
+
+    def check(self, key):
+        """
+        熔断中返回剩余秒数，否则返回 None。冷却结束后只放行一次试探，试探的结果记录之前
+        其他调用仍被拒绝；试探超过 cooldown 仍没有结果（调用方异常退出）时再放行一次
+        """
+        if not self.threshold:
+            return None
+        with self._lock:
+            state = self._state.get(key)
+            if state is None:
+                return None
+            now = time.monotonic()
+            if state[1] is not None:
+                remaining = state[1] + self.cooldown - now
+                if remaining > 0:
+                    return remaining
+                # 半开：放行这一次，失败后立即重新熔断
+                state[0] = self.threshold - 1
+                state[1] = None
+                state[3] = now
+                return None
+            if state[3] is not None:
+                remaining = state[3] + self.cooldown - now
+                if remaining > 0:
+                    return remaining
+                state[3] = now
+            return None
+
+    def record(self, key, ok, source=None):
+        """记录一次结果，返回是否因此熔断"""
+        if not self.threshold:
+            return False
+        with self._lock:
+            if ok:
+                self._state.pop(key, None)
+                return False
+            state = self._state.setdefault(key, [0, None, set(), None])
+            state[0] += 1
+            state[2].add(source)
+            state[3] = None
+            if state[0] >= self.threshold and len(state[2]) >= self.min_sources and state[1] is None:
+                state[1] = time.monotonic()
+                return True
+            return False
+
+    def open_keys(self):
+        now = time.monotonic()
+        with self._lock:
+            return [key for key, (_, opened, _, _) in self._state.items()
+                    if opened is not None and opened + self.cooldown > now]
+
+
+class _Call:
+    __slots__ = ('transport', 'thread_id', 'what', 'start', 'deadline', 'fired')
+
+    def __init__(self, transport, what, budget):
+        self.transport = transport
+        self.thread_id = threading.get_ident()
+        self.what = what
+        self.start = time.monotonic()
+        self.deadline = self.start + budget
+        self.fired = False
+
+
+class Watchdog:
+    """检查正在进行的调用，超过截止时间的调用被报告并通过 transport.abort() 终止"""
+
+    def __init__(self, grace=WATCHDOG_GRACE, interval=WATCHDOG_INTERVAL):
+        self.grace = grace
+        self.interval = interval
+        self.aborted = 0
+        self._calls = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, transport, what, budget_ms):
+        call = _Call(transport, what, budget_ms / 1000.0 + self.grace)
+        with self._lock:
+            self._calls.add(call)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="mdio-watchdog", daemon=True)
+                self._thread.start()
+        return call
+
+    def finish(self, call):
+        with self._lock:
+            self._calls.discard(call)
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            with self._lock:
+                overdue = [call for call in self._calls if not call.fired and now > call.deadline]
+                for call in overdue:
+                    call.fired = True
+                    self.aborted += 1
+            for call in overdue:
+                aborted = call.transport.abort(call.thread_id)
+                print(f"[WARN] Watchdog: {call.what} hung for {(now - call.start) * 1000:.0f} ms, "
+                      f"{'aborted' if aborted else 'cannot be aborted by this transport'}")
+                profiler.count('guard', 'watchdog_abort', 1)
+
+
+class DeviceAttrs:
+    """按 (bus, addr) 查找 PHY 的寄存器属性，用于判断重试是否安全；未登记的 PHY 使用 IEEE 标准寄存器的默认属性"""
+
+    def __init__(self):
+        self._configs = {}
+        self._templates = {}
+        self._attrs = {}   # 配置名 -> RegisterAttrs
+        self._default = RegisterAttrs({}, {})
+        self._lock = threading.Lock()
+
+    def update(self, devices, templates):
+        """devices 为 [{"hw": 扫描记录, "cfg": 匹配的配置或 None}, ...]，重新扫描后再次调用"""
+        configs = {(dev['hw']['bus'], dev['hw']['addr_int']): dev['cfg'] for dev in devices if dev['cfg']}
+        with self._lock:
+            self._configs = configs
+            self._templates = templates
+            self._attrs.clear()
+
+    def get(self, bus, addr):
+        with self._lock:
+            cfg = self._configs.get((bus, addr))
+            if cfg is None:
+                return self._default
+            name = cfg.get('config_name')
+            attrs = self._attrs.get(name)
+            if attrs is None:
+                attrs = self._attrs[name] = RegisterAttrs(cfg, self._templates)
+            return attrs
+
+
+class GuardedTransport(MdioTransport):
+    """在实际访问层之上加时间预算、看门狗、重试与熔断"""
+
+    def __init__(self, inner, policy=None, watchdog=None, device_attrs=None):
+        self.inner = inner
+        self.policy = policy or GuardPolicy()
+        self.watchdog = watchdog or Watchdog()
+        self.device_attrs = device_attrs or DeviceAttrs()
+        self.devices = CircuitBreaker(self.policy.breaker_threshold, self.policy.breaker_cooldown_s)
+        self.buses = CircuitBreaker(self.policy.breaker_threshold, self.policy.breaker_cooldown_s, min_sources=2)
+        self.counts = {"retries": 0, "unsafe": 0, "timeouts": 0, "rejected": 0, "tripped": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+        profiler.count('guard', key, 1)
+
+    def _check_bus(self, bus):
+        remaining = self.buses.check(bus)
+        if remaining is not None:
+            self._count('rejected')
+            raise CircuitOpen(f"Circuit open for bus {bus} after repeated timeouts (retry in {remaining:.0f} s)")
+
+    def _check(self, bus, addr):
+        self._check_bus(bus)
+        remaining = self.devices.check((bus, addr))
+        if remaining is not None:
+            self._count('rejected')
+            raise CircuitOpen(f"Circuit open for {bus}:0x{addr:02x} after repeated failures "
+                              f"(retry in {remaining:.0f} s)")
+
+    def _record(self, bus, addr, error):
+        if self.devices.record((bus, addr), error is None):
+            self._count('tripped')
+            print(f"[WARN] Circuit opened for {bus}:0x{addr:02x} after {self.policy.breaker_threshold} "
+                  f"consecutive failure(s): {error}")
+        # 只有超时才算作总线的问题，其余错误只影响该 PHY
+        if (error is None or isinstance(error, MdioTimeout)) and self.buses.record(bus, error is None, addr):
+            self._count('tripped')
+            print(f"[WARN] Circuit opened for bus {bus} after {self.policy.breaker_threshold} "
+                  f"consecutive timeout(s) on several PHYs")
+
+    def _call(self, what, budget_ms, fn):
+        call = self.watchdog.start(self.inner, what, budget_ms)
+        try:
+            return fn()
+        except MdioError as e:
+            if call.fired and not isinstance(e, MdioTimeout):
+                raise MdioTimeout(f"{what} aborted by watchdog: {e}", stderr=e.stderr, stdout=e.stdout,
+                                  returncode=e.returncode, index=e.index)
+            raise
+        finally:
+            self.watchdog.finish(call)
+
+    def describe(self, bus, addr, op):
+        return self.inner.describe(bus, addr, op)
+
+    def _retry_from(self, bus, addr, ops, start, error):
+        """
+        偶发错误后从哪个操作开始重试，不能安全重试时返回 None。
+        ops[:start] 是之前的尝试中已经完成的写 / 延时，error.index 相对于 ops[start:]
+        """
+        attrs = self.device_attrs.get(bus, addr)
+        if error.index is not None:
+            failed = start + error.index
+            # 出错位置之前的操作已经完成：只有写 / 延时（结果为 None）时可以从出错的操作继续
+            if (all(op.action in (ACTION_WRITE, ACTION_DELAY) for op in ops[start:failed])
+                    and all(repeatable(op, attrs) for op in ops[failed:])):
+                return failed
+        if all(repeatable(op, attrs) for op in ops):
+            return 0
+        return None
+
+    def execute(self, bus, addr, ops):
+        self._check(bus, addr)
+        attempt = 0
+        start = 0
+        while True:
+            pending = ops[start:]
+            what = f"{len(pending)} operation(s) on {bus}:0x{addr:02x}"
+            try:
+                result = self._call(what, self.policy.budget_ms(pending),
+                                    lambda: self.inner.execute(bus, addr, pending))
+            except MdioError as e:
+                if isinstance(e, MdioTimeout):
+                    self._count('timeouts')
+                retry_from = None
+                if e.transient and attempt < self.policy.retries:
+                    retry_from = self._retry_from(bus, addr, ops, start, e)
+                    if retry_from is None:
+                        self._count('unsafe')
+                if retry_from is None:
+                    if e.index is not None:
+                        e.index += start
+                    self._record(bus, addr, e)
+                    raise
+                time.sleep(self.policy.backoff(attempt))
+                attempt += 1
+                start = retry_from
+                self._count('retries')
+                continue
+            self._record(bus, addr, None)
+            return [None] * start + list(result)
+
+    def list_buses(self):
+        return self.inner.list_buses()
+
+    def scan_bus(self, bus):
+        self._check_bus(bus)
+        return self._call(f"scan of {bus}", self.policy.op_timeout_ms, lambda: self.inner.scan_bus(bus))
+
+    def abort(self, thread_id):
+        return self.inner.abort(thread_id)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts)
+        stats['watchdog_aborts'] = self.watchdog.aborted
+        stats['open_circuits'] = [key if isinstance(key, str) else f"{key[0]}:0x{key[1]:02x}"
+                                  for key in self.buses.open_keys() + self.devices.open_keys()]
+        return stats
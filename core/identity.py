@@ -0,0 +1,86 @@
+def _popcount(value):
+    return bin(value).count('1')
+
+
+class IdentityIndex:
+    """
+    PHY ID 匹配索引，在加载配置时一次性构建。
+    各配置的 identity 按掩码分组：{mask: {phy_id & mask: config}}，
+    查找时按掩码位数从多到少依次查表（最长掩码优先），
+    查找代价只与不同掩码的数量有关，与配置数量无关。
+    掩码为 0 或 identity 中标记 "fallback": true 的配置作为通用兜底配置。
+    """
+
+    def __init__(self, configs, verbose=True):
+        self._tables = {}
+        self._masks = []
+        self.fallback = None
+        self.problems = []   # 加载时发现的无效 / 冲突 / 重叠条目说明
+
+        entries = []
+        for cfg in configs:
+            name = cfg.get('config_name', 'Unnamed Config')
+            try:
+                ident = cfg['identity']
+                target = int(str(ident['phy_id']), 0)
+                mask = int(str(ident['phy_id_mask']), 0)
+            except (KeyError, TypeError, ValueError) as e:
+                self.problems.append(f"Invalid identity in '{name}': {e}")
+                continue
+
+            if mask == 0 or ident.get('fallback'):
+                if self.fallback is None:
+                    self.fallback = cfg
+                else:
+                    self.problems.append(
+                        f"Multiple fallback configs: '{name}' ignored, using "
+                        f"'{self.fallback.get('config_name', 'Unnamed Config')}'")
+                if mask == 0:
+                    continue
+
+            table = self._tables.setdefault(mask, {})
+            key = target & mask
+            if key in table:
+                self.problems.append(
+                    f"Identity conflict: '{name}' and '{table[key].get('config_name', 'Unnamed Config')}' "
+                    f"both claim 0x{key:08x}/0x{mask:08x}; keeping the first")
+                continue
+            table[key] = cfg
+            entries.append((mask, key, name))
+
+        # 最长掩码优先；位数相同时按掩码数值排序，保证结果确定
+        self._masks = sorted(self._tables, key=lambda m: (-_popcount(m), -m))
+        self._check_overlaps(entries)
+
+        if verbose:
+            for problem in self.problems:
+                print(f"[WARN] {problem}")
+
+    def _check_overlaps(self, entries):
+        """不同掩码的两个条目在公共位上一致时，同一 PHY ID 可能同时匹配二者"""
+        for i, (mask_a, key_a, name_a) in enumerate(entries):
+            for mask_b, key_b, name_b in entries[i + 1:]:
+                if mask_a == mask_b:
+                    continue
+                common = mask_a & mask_b
+                if (key_a & common) == (key_b & common):
+                    winner = name_a if self._masks.index(mask_a) < self._masks.index(mask_b) else name_b
+                    self.problems.append(
+                        f"Identity overlap: '{name_a}' (0x{key_a:08x}/0x{mask_a:08x}) and "
+                        f"'{name_b}' (0x{key_b:08x}/0x{mask_b:08x}); '{winner}' takes priority")
+
+    def __len__(self):
+        return sum(len(t) for t in self._tables.values())
+
+    def match(self, phy_id):
+        """返回与 PHY ID 匹配的配置（不含兜底配置），没有则返回 None"""
+        for mask in self._masks:
+            cfg = self._tables[mask].get(phy_id & mask)
+            if cfg is not None:
+                return cfg
+        return None
+
+    def resolve(self, phy_id):
+        """返回匹配的配置，没有匹配时返回兜底配置（可能为 None）"""
+        cfg = self.match(phy_id)
+        return cfg if cfg is not None else self.fallback
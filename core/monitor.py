@@ -0,0 +1,386 @@
+"""
+链路 / 状态持续监控。
+
+按固定周期轮询所有设备上由芯片配置 "monitor" 定义的寄存器字段，只输出变化（以及可选的抽样）：
+
+    "monitor": [
+      { "name": "link",      "reg": "0x11", "mask": "0x0400", "shift": 10 },
+      { "name": "speed",     "reg": "0x11", "mask": "0xC000", "shift": 14 },
+      { "name": "rx_errors", "reg": "0x15", "counter": true, "clear_on_read": true },
+      { "name": "pma_link",  "dev_id": "0x01", "reg": "0x0001", "mask": "0x0004", "shift": 2 }
+    ]
+
+  - mask / shift 从寄存器值中取出字段：(值 & mask) >> shift，mask 默认为 0xFFFF；
+  - counter 字段不产生变化事件，抽样中给出累计值（clear_on_read 表示读后清零，
+    否则按字段宽度处理回绕）；
+  - template 缺省时使用配置的 cmd_template；没有 "monitor" 的配置使用 IEEE C22 的
+    BMCR、链路状态和自协商完成位（DEFAULT_FIELDS）。
+
+数据流为生成器流水线：每条总线一个轮询线程 → 有界队列 → monitor_events() 比较前后值 →
+写入 JSONL / CSV。内存占用只与设备数有关，与监控时长无关。
+
+同一总线上的 N 个设备在每个周期内错开 1/N 周期轮询，使总线占用均匀分布；
+轮询请求以后台优先级提交给调度器（见 core/scheduler.py），不会阻塞交互命令。
+每次轮询相对计划时间的偏差（drift）以及因总线过慢而跳过的周期在结束时汇总报告。
+
+    python3 main.py --monitor soak.jsonl --monitor-interval 500 --monitor-duration 3600
+    python3 main.py --monitor soak.csv --plan soak_plan.json   # 测试计划执行期间在后台监控
+"""
+import csv
+import json
+import queue
+import sys
+import threading
+import time
+
+from core import profiler
+from core.profiler import HISTOGRAM_BOUNDS, HISTOGRAM_LABELS
+from core.scheduler import PRIORITY_BACKGROUND, priority
+from core.sequence import find_template, resolve_default_template
+from core.transport import MdioError, MdioOp, to_int
+
+DEFAULT_INTERVAL_MS = 1000
+
+# 轮询线程与事件处理之间的队列长度
+QUEUE_SIZE = 1024
+
+# 没有 "monitor" 配置时使用的 IEEE 802.3 C22 字段
+DEFAULT_FIELDS = (
+    {"name": "bmcr", "reg": "0x00"},
+    {"name": "link", "reg": "0x01", "mask": "0x0004", "shift": 2},
+    {"name": "an_complete", "reg": "0x01", "mask": "0x0020", "shift": 5},
+)
+
+EVENT_SAMPLE = 'sample'
+EVENT_CHANGE = 'change'
+EVENT_ERROR = 'error'
+EVENT_RECOVERED = 'recovered'
+EVENT_SUMMARY = 'summary'
+
+CSV_COLUMNS = ('t', 'event', 'bus', 'addr', 'field', 'old', 'value')
+
+
+class MonitorField:
+    __slots__ = ('name', 'index', 'mask', 'shift', 'counter', 'clear_on_read', 'width')
+
+    def __init__(self, name, index, mask, shift, counter, clear_on_read):
+        self.name = name
+        self.index = index          # 在批量读取结果中的位置
+        self.mask = mask
+        self.shift = shift
+        self.counter = counter
+        self.clear_on_read = clear_on_read
+        self.width = (mask >> shift) + 1
+
+    def extract(self, values):
+        return (values[self.index] & self.mask) >> self.shift
+
+
+class MonitorLayout:
+    """一个芯片配置的监控字段及对应的批量读操作（同一寄存器只读一次）"""
+
+    def __init__(self, config, templates):
+        self.fields = []
+        self.ops = []
+        self.problems = []
+        if 'monitor' in config:
+            entries = config['monitor']
+            default_tmpl, _ = resolve_default_template(config, templates)
+            default_fmt = templates.get(default_tmpl, {}).get('format')
+        else:
+            entries = DEFAULT_FIELDS
+            default_fmt = find_template(templates, c22=True)
+        registers = {}
+        for entry in entries:
+            name = entry.get('name')
+            fmt = templates[entry['template']].get('format') if entry.get('template') in templates else None
+            if not name or not (fmt or default_fmt) or ('template' in entry and fmt is None):
+                self.problems.append(f"invalid monitor field {entry}")
+                continue
+            try:
+                key = (fmt or default_fmt, to_int(entry.get('dev_id', 0)), to_int(entry.get('reg')))
+                mask = to_int(entry.get('mask'), 0xFFFF)
+                shift = to_int(entry.get('shift', 0))
+            except ValueError as e:
+                self.problems.append(f"invalid monitor field '{name}': {e}")
+                continue
+            if key not in registers:
+                registers[key] = len(self.ops)
+                self.ops.append(MdioOp.read(key[0], key[2], key[1]))
+            self.fields.append(MonitorField(name, registers[key], mask, shift, bool(entry.get('counter')),
+                                            bool(entry.get('clear_on_read'))))
+
+
+class DriftStats:
+    """轮询时间偏差的计数统计（只保存直方图，不保存样本）"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * len(HISTOGRAM_LABELS)
+
+    def add(self, drift):
+        self.count += 1
+        self.total += drift
+        self.max = max(self.max, drift)
+        for i, bound in enumerate(HISTOGRAM_BOUNDS):
+            if drift < bound:
+                self.histogram[i] += 1
+                return
+        self.histogram[-1] += 1
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total * 1000.0 / self.count if self.count else 0.0,
+            "max_ms": self.max * 1000.0,
+            "histogram": dict(zip(HISTOGRAM_LABELS, self.histogram)),
+        }
+
+
+class Sample:
+    __slots__ = ('t', 'bus', 'addr', 'layout', 'values', 'error')
+
+    def __init__(self, t, bus, addr, layout, values, error=None):
+        self.t = t
+        self.bus = bus
+        self.addr = addr
+        self.layout = layout
+        self.values = values
+        self.error = error
+
+
+class Monitor:
+    """按固定周期轮询设备，samples() 产生 Sample 流"""
+
+    def __init__(self, common_config, transport, identity_index, interval_ms=DEFAULT_INTERVAL_MS,
+                 queue_size=QUEUE_SIZE):
+        self.templates = common_config.get('cmd_templates', {})
+        self.transport = transport
+        self.identity_index = identity_index
+        self.interval = max(1, interval_ms) / 1000.0
+        self.queue_size = queue_size
+        self.polls = 0
+        self.errors = 0
+        self.skipped = 0            # 因总线过慢而跳过的轮询周期
+        self.events = 0             # run_monitor() 输出的事件数
+        self.drift = DriftStats()
+        self._layouts = {}
+        self._lock = threading.Lock()
+
+    def layout(self, cfg):
+        # 以 id(cfg) 为键并保存 cfg 本身：配置对象不会被释放，其 id 也就不会被另一个配置复用
+        key = id(cfg)
+        _, layout = self._layouts.get(key, (None, None))
+        if layout is None:
+            layout = MonitorLayout(cfg or {}, self.templates)
+            self._layouts[key] = (cfg, layout)
+            for problem in layout.problems:
+                name = cfg.get('config_name', '') if cfg else 'default'
+                print(f"[WARN] Monitor layout of {name}: {problem}")
+        return layout
+
+    def summary(self):
+        with self._lock:
+            return {"event": EVENT_SUMMARY, "interval_ms": self.interval * 1000.0, "polls": self.polls,
+                    "events": self.events, "errors": self.errors, "skipped_periods": self.skipped, "drift": self.drift.as_dict()}
+
+    def samples(self, devices, duration=None, stop=None):
+        """
+        轮询 devices（PhyScanner.discover 的结果）直到 duration 秒后或 stop（threading.Event）被设置，
+        依次产生 Sample。生成器被关闭时轮询线程随之停止。
+        """
+        stop = stop or threading.Event()
+        by_bus = {}
+        for hw in devices:
+            layout = self.layout(self.identity_index.resolve(hw['phy_id']))
+            if layout.ops:
+                by_bus.setdefault(hw['bus'], []).append((hw['addr_int'], layout))
+
+        start = time.monotonic()
+        deadline = start + duration if duration else None
+        out = queue.Queue(self.queue_size)
+        threads = [threading.Thread(target=self._poll_bus, args=(bus, targets, start, deadline, stop, out),
+                                    name=f"mdio-monitor-{bus}", daemon=True)
+                   for bus, targets in by_bus.items()]
+        for thread in threads:
+            thread.start()
+        running = len(threads)
+        try:
+            while running:
+                sample = out.get()
+                if sample is None:
+                    running -= 1
+                else:
+                    yield sample
+        finally:
+            stop.set()
+            # 消费者提前退出时队列可能已满，取走剩余的样本让轮询线程能放入结束标记
+            for thread in threads:
+                while thread.is_alive():
+                    try:
+                        while True:
+                            out.get_nowait()
+                    except queue.Empty:
+                        pass
+                    thread.join(0.05)
+
+    def _put(self, out, item, stop):
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _poll_bus(self, bus, targets, start, deadline, stop, out):
+        """一条总线的轮询循环：第 k 个设备在每个周期的 k/N 处轮询"""
+        slot = self.interval / len(targets)
+        period = 0
+        try:
+            with priority(PRIORITY_BACKGROUND):
+                while not stop.is_set():
+                    base = start + period * self.interval
+                    for k, (addr, layout) in enumerate(targets):
+                        planned = base + k * slot
+                        if deadline is not None and planned >= deadline:
+                            return
+                        if stop.wait(max(0.0, planned - time.monotonic())):
+                            return
+                        out_sample = self._poll(bus, addr, layout, start, planned)
+                        self._put(out, out_sample, stop)
+                    period += 1
+                    # 总线跟不上时跳过已经错过的周期，而不是连续追赶
+                    behind = int((time.monotonic() - start) / self.interval) - period
+                    if behind > 0:
+                        with self._lock:
+                            self.skipped += behind
+                        period += behind
+        finally:
+            out.put(None)
+
+    def _poll(self, bus, addr, layout, start, planned):
+        now = time.monotonic()
+        error = None
+        values = None
+        with profiler.span('monitor', 'poll', bus=bus, addr=addr):
+            try:
+                values = self.transport.execute(bus, addr, layout.ops)
+            except MdioError as e:
+                error = str(e)
+        with self._lock:
+            self.polls += 1
+            self.errors += error is not None
+            self.drift.add(now - planned)
+        return Sample(round(now - start, 6), bus, addr, layout, values, error)
+
+
+class _DeviceState:
+    __slots__ = ('fields', 'raw', 'totals', 'polls', 'error')
+
+    def __init__(self):
+        self.fields = None
+        self.raw = {}
+        self.totals = {}
+        self.polls = 0
+        self.error = None
+
+
+def monitor_events(samples, decimate=0):
+    """
+    把 Sample 流转换为事件流：字段变化、读取失败 / 恢复，以及每个设备每 decimate 次轮询一次的抽样
+    （设备的第一次轮询总是输出抽样；decimate 为 0 时之后只输出变化）。
+    """
+    states = {}
+    for sample in samples:
+        key = (sample.bus, sample.addr)
+        state = states.get(key)
+        if state is None:
+            state = states[key] = _DeviceState()
+        base = {"t": sample.t, "bus": sample.bus, "addr": f"0x{sample.addr:02x}"}
+
+        if sample.error is not None:
+            if state.error is None:
+                yield dict(base, event=EVENT_ERROR, error=sample.error)
+            state.error = sample.error
+            continue
+        if state.error is not None:
+            yield dict(base, event=EVENT_RECOVERED)
+            state.error = None
+
+        current = {}
+        for field in sample.layout.fields:
+            value = field.extract(sample.values)
+            if field.counter:
+                previous = state.raw.get(field.name)
+                if field.clear_on_read:
+                    delta = value
+                elif previous is None:
+                    delta = 0
+                else:
+                    delta = (value - previous) % field.width
+                state.raw[field.name] = value
+                state.totals[field.name] = state.totals.get(field.name, 0) + delta
+                current[field.name] = state.totals[field.name]
+            else:
+                current[field.name] = value
+                old = state.fields.get(field.name) if state.fields is not None else None
+                if state.fields is not None and old != value:
+                    yield dict(base, event=EVENT_CHANGE, field=field.name, old=old, value=value)
+
+        first = state.fields is None
+        state.fields = current
+        state.polls += 1
+        if first or (decimate and state.polls % decimate == 0):
+            yield dict(base, event=EVENT_SAMPLE, values=current)
+
+
+class JsonlSink:
+    def __init__(self, fp):
+        self.fp = fp
+
+    def write(self, event):
+        self.fp.write(json.dumps(event) + "\n")
+        self.fp.flush()
+
+
+class CsvSink:
+    """每行一个字段：抽样事件展开为多行，汇总事件不写入"""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.writer = csv.writer(fp)
+        self.writer.writerow(CSV_COLUMNS)
+
+    def write(self, event):
+        if event['event'] == EVENT_SUMMARY:
+            return
+        row = [event['t'], event['event'], event['bus'], event['addr']]
+        if event['event'] == EVENT_SAMPLE:
+            for name, value in event['values'].items():
+                self.writer.writerow(row + [name, '', value])
+        elif event['event'] == EVENT_CHANGE:
+            self.writer.writerow(row + [event['field'], event['old'], event['value']])
+        else:
+            self.writer.writerow(row + ['', '', event.get('error', '')])
+        self.fp.flush()
+
+
+def open_sink(path):
+    """按扩展名选择输出格式（.csv 为 CSV，其余为 JSONL），"-" 表示标准输出；返回 (sink, 文件对象)"""
+    fp = sys.stdout if path == '-' else open(path, 'w', newline='')
+    sink = CsvSink(fp) if path.endswith('.csv') else JsonlSink(fp)
+    return sink, fp
+
+
+def run_monitor(monitor, devices, sink, decimate=0, duration=None, stop=None):
+    """执行监控流水线直到结束，汇总也写入 sink；返回汇总"""
+    try:
+        for event in monitor_events(monitor.samples(devices, duration, stop), decimate):
+            sink.write(event)
+            monitor.events += 1
+    finally:
+        summary = monitor.summary()
+        sink.write(summary)
+    return summary
@@ -0,0 +1,559 @@
+"""
+进程内的 mdio-netlink 传输层：不再为每次访问启动 mdio 工具，而是直接通过 generic netlink
+向内核的 mdio-netlink 模块（mdio 工具本身使用的接口）提交寄存器访问程序。
+
+mdio-netlink 在内核中执行一段小程序（每条指令 64 位：操作码 + 三个 18 位参数，参数为寄存器或立即数），
+一条 MDIO_GENL_XFER 消息中可以包含任意多次读写，EMIT 指令输出的值随回复一起返回。因此：
+  - 连续的读 / 写编译为一条消息（带掩码的写在内核中完成读-改-写）；
+  - 延时在本进程中执行，轮询以单次读取的消息按退避策略重复；
+  - C22 与 mmd 直接寻址（mmd 使用 Clause 45 地址 0x8000 | PRTAD << 5 | DEVAD），
+    mmd-c22 与 mdio 工具相同，通过 C22 寄存器 13 / 14 间接访问。
+
+访问 mdio-netlink 需要 CAP_NET_ADMIN（root 或 Broker 中使用）。没有内核模块时可以使用
+FakeNetlinkEndpoint：它解析同样的二进制消息，在寄存器后端（如仿真后端）上执行程序。
+
+    python3 main.py --netlink                     # 所有模板默认使用 netlink
+    python3 main.py --sim TOPOLOGY --netlink      # 仿真后端 + 假 netlink 端点
+    sudo python3 -m core.broker --netlink         # Broker 使用 netlink 访问总线
+"""
+import errno
+import itertools
+import os
+import socket
+import struct
+import threading
+import time
+
+from core import profiler
+from core.broker import CANONICAL_FORMATS
+from core.transport import (
+    ACTION_DELAY, ACTION_POLL, ACTION_READ, MODE_C22, MODE_MMD,
+    DEFAULT_OP_TIMEOUT_MS, SYSFS_MDIO_BUS, MdioError, MdioOp, MdioTimeout, MdioTransport,
+    PollBackoff, sysfs_buses,
+)
+
+# ---------- 协议常量（linux/netlink.h、linux/genetlink.h、mdio-netlink.h） ----------
+
+NETLINK_GENERIC = 16
+NLMSG_ERROR = 2
+NLM_F_REQUEST = 0x1
+
+GENL_ID_CTRL = 0x10
+CTRL_CMD_NEWFAMILY = 1
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+
+MDIO_GENL_NAME = "mdio"
+MDIO_GENL_VERSION = 1
+MDIO_GENL_XFER = 1
+
+MDIO_NLA_BUS_ID = 1   # 字符串
+MDIO_NLA_TIMEOUT = 2  # u32，毫秒
+MDIO_NLA_PROG = 3     # 指令数组
+MDIO_NLA_DATA = 4     # 嵌套的 u32 数组，EMIT 输出的值
+MDIO_NLA_ERROR = 5    # s32，0 或 -errno
+
+OP_READ = 1    # read  dev, reg, dst
+OP_WRITE = 2   # write dev, reg, src
+OP_AND = 3     # and   a, b, dst
+OP_OR = 4      # or    a, b, dst
+OP_ADD = 5     # add   a, b, dst
+OP_JEQ = 6     # jeq   a, b, 相对跳转
+OP_JNE = 7     # jne   a, b, 相对跳转
+OP_EMIT = 8    # emit  src
+
+ARG_NONE = 0
+ARG_REG = 1
+ARG_IMM = 2
+
+# 程序可用的寄存器数
+PROG_REGS = 8
+
+NLMSG_HDR = struct.Struct('=IHHII')   # len, type, flags, seq, pid
+GENL_HDR = struct.Struct('=BBH')      # cmd, version, reserved
+NLA_HDR = struct.Struct('=HH')        # len, type
+NLA_U16 = struct.Struct('=H')
+NLA_U32 = struct.Struct('=I')
+NLA_S32 = struct.Struct('=i')
+INSN = struct.Struct('=Q')
+
+# Clause 45 地址标志（mdio_phy_id_c45）
+C45_FLAG = 0x8000
+
+# mmd-c22 间接访问使用的 C22 寄存器（IEEE 802.3 22.2.4.3.11 / 12）
+MMD_CTRL = 0x0D
+MMD_DATA = 0x0E
+MMD_FUNC_DATA = 0x4000   # 数据访问，地址不自增
+
+# 单条消息的最大指令数，更长的操作列表拆分为多条消息
+MAX_PROG_INSNS = 1024
+DEFAULT_TIMEOUT_MS = 1000
+RECV_SIZE = 65536
+
+# 可以重试的总线错误
+TRANSIENT_ERRNOS = frozenset((errno.EAGAIN, errno.EBUSY, errno.EIO, errno.ETIMEDOUT))
+
+
+def reg(n):
+    return ARG_REG << 16 | n
+
+
+def imm(value):
+    return ARG_IMM << 16 | (value & 0xFFFF)
+
+
+def insn(op, arg0=ARG_NONE, arg1=ARG_NONE, arg2=ARG_NONE):
+    """一条指令：op:8、保留:2、arg0:18、arg1:18、arg2:18"""
+    return INSN.pack(op | arg0 << 10 | arg1 << 28 | arg2 << 46)
+
+
+def decode_insn(raw):
+    word = INSN.unpack(raw)[0]
+    return word & 0xFF, (word >> 10) & 0x3FFFF, (word >> 28) & 0x3FFFF, (word >> 46) & 0x3FFFF
+
+
+# ---------- 消息编解码 ----------
+
+def _align(n):
+    return (n + 3) & ~3
+
+
+def nla(attr_type, payload):
+    header = NLA_HDR.pack(NLA_HDR.size + len(payload), attr_type)
+    return header + payload + b'\0' * (_align(len(payload)) - len(payload))
+
+
+def nla_str(attr_type, text):
+    return nla(attr_type, text.encode() + b'\0')
+
+
+def parse_attrs(buf, offset=0):
+    """解析属性列表，返回 [(类型, 负载), ...]（同一类型可能出现多次）"""
+    attrs = []
+    while offset + NLA_HDR.size <= len(buf):
+        length, attr_type = NLA_HDR.unpack_from(buf, offset)
+        if length < NLA_HDR.size:
+            break
+        attrs.append((attr_type & 0x3FFF, buf[offset + NLA_HDR.size:offset + length]))
+        offset += _align(length)
+    return attrs
+
+
+def genl_message(family, cmd, version, seq, attrs):
+    payload = GENL_HDR.pack(cmd, version, 0) + b''.join(attrs)
+    return NLMSG_HDR.pack(NLMSG_HDR.size + len(payload), family, NLM_F_REQUEST, seq, 0) + payload
+
+
+def parse_message(buf):
+    """返回 (type, seq, 负载)；负载为 genl 头之后的属性或 NLMSG_ERROR 的内容"""
+    if len(buf) < NLMSG_HDR.size:
+        raise MdioError("Truncated netlink message")
+    length, msg_type, _, seq, _ = NLMSG_HDR.unpack_from(buf)
+    return msg_type, seq, buf[NLMSG_HDR.size:length]
+
+
+def error_message(seq, errno_value, request=b''):
+    payload = NLA_S32.pack(-errno_value) + request[:NLMSG_HDR.size]
+    return NLMSG_HDR.pack(NLMSG_HDR.size + len(payload), NLMSG_ERROR, 0, seq, 0) + payload
+
+
+def _errno_text(err):
+    return os.strerror(err) if err > 0 else f"error {err}"
+
+
+# ---------- 程序编译 ----------
+
+class Transfer:
+    """一条 XFER 消息：指令与 EMIT 输出对应的操作序号"""
+    __slots__ = ('insns', 'emits', 'first')
+
+    def __init__(self, first):
+        self.insns = []
+        self.emits = []
+        self.first = first   # 第一个操作的序号
+
+    def program(self):
+        return b''.join(self.insns)
+
+
+def _check_range(op, addr, index):
+    if not 0 <= addr < 32 or not 0 <= op.dev_id < 32 or not 0 <= op.reg <= 0xFFFF:
+        raise MdioError(f"Address out of range for netlink access: addr {addr}, "
+                        f"dev_id {op.dev_id}, reg 0x{op.reg:x}", index=index)
+
+
+def _target(addr, op):
+    """返回 (前置指令, dev 参数, reg 参数)"""
+    if op.mode == MODE_C22:
+        return [], imm(addr), imm(op.reg)
+    if op.mode == MODE_MMD:
+        return [], imm(C45_FLAG | addr << 5 | op.dev_id), imm(op.reg)
+    # mmd-c22：先写入设备号与寄存器地址，再切换为数据访问
+    setup = [
+        insn(OP_WRITE, imm(addr), imm(MMD_CTRL), imm(op.dev_id)),
+        insn(OP_WRITE, imm(addr), imm(MMD_DATA), imm(op.reg)),
+        insn(OP_WRITE, imm(addr), imm(MMD_CTRL), imm(MMD_FUNC_DATA | op.dev_id)),
+    ]
+    return setup, imm(addr), imm(MMD_DATA)
+
+
+def op_insns(addr, op):
+    """一次读或写对应的指令；读以 EMIT 输出读到的值"""
+    setup, dev, port = _target(addr, op)
+    if op.action == ACTION_READ:
+        return setup + [insn(OP_READ, dev, port, reg(0)), insn(OP_EMIT, reg(0))]
+    if not op.mask:
+        return setup + [insn(OP_WRITE, dev, port, imm(op.val))]
+    return setup + [
+        insn(OP_READ, dev, port, reg(0)),
+        insn(OP_AND, reg(0), imm(op.mask), reg(0)),
+        insn(OP_OR, reg(0), imm(op.val), reg(0)),
+        insn(OP_WRITE, dev, port, reg(0)),
+    ]
+
+
+def compile_ops(addr, ops):
+    """
+    把操作列表拆分为依次执行的片段：Transfer（连续的读写，一条消息）、
+    ('delay', 序号) 或 ('poll', 序号)
+    """
+    segments = []
+    current = None
+    for index, op in enumerate(ops):
+        if op.action == ACTION_DELAY:
+            current = None
+            segments.append(('delay', index))
+            continue
+        if op.mode is None:
+            raise MdioError(f"Cannot determine MDIO addressing mode from template: {op.fmt}", index=index)
+        _check_range(op, addr, index)
+        if op.action == ACTION_POLL:
+            current = None
+            segments.append(('poll', index))
+            continue
+        code = op_insns(addr, op)
+        if current is None or len(current.insns) + len(code) > MAX_PROG_INSNS:
+            current = Transfer(index)
+            segments.append(current)
+        current.insns.extend(code)
+        if op.action == ACTION_READ:
+            current.emits.append(index)
+    return segments
+
+
+# ---------- 内核通道 ----------
+
+class KernelChannel:
+    """
+    真实的 generic netlink socket，每个线程一个，不同总线的访问可以并发。
+    程序的执行时间由内核按 MDIO_NLA_TIMEOUT 限制，recv_timeout_ms 只是等待回复的上限
+    """
+
+    def __init__(self, recv_timeout_ms=DEFAULT_OP_TIMEOUT_MS):
+        self._local = threading.local()
+        self.recv_timeout_ms = recv_timeout_ms
+
+    def _sock(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            try:
+                sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+                sock.bind((0, 0))
+                sock.settimeout(self.recv_timeout_ms / 1000.0)
+            except (AttributeError, OSError) as e:
+                raise MdioError(f"Cannot open generic netlink socket: {e}")
+            self._local.sock = sock
+        return sock
+
+    def request(self, message):
+        sock = self._sock()
+        try:
+            sock.send(message)
+            return sock.recv(RECV_SIZE)
+        except OSError as e:
+            # 超时后迟到的回复会打乱序号，丢弃该 socket
+            self._local.sock = None
+            sock.close()
+            if isinstance(e, socket.timeout):
+                raise MdioTimeout(f"Netlink request timed out after {self.recv_timeout_ms} ms")
+            raise MdioError(f"Netlink request failed: {e}", transient=True)
+
+    def list_buses(self):
+        buses = sysfs_buses()
+        if buses is None:
+            raise MdioError(f"Cannot list MDIO buses in {SYSFS_MDIO_BUS}")
+        return buses
+
+
+# ---------- 传输层 ----------
+
+class NetlinkTransport(MdioTransport):
+    """通过 mdio-netlink 访问寄存器；channel 默认为内核 socket，测试时使用 FakeNetlinkEndpoint"""
+
+    def __init__(self, channel=None, timeout_ms=DEFAULT_TIMEOUT_MS):
+        self.channel = channel if channel is not None else KernelChannel()
+        self.timeout_ms = timeout_ms
+        self._family = None
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def family(self):
+        """查询（并缓存）mdio generic netlink 家族号"""
+        if self._family is None:
+            reply = self._request(GENL_ID_CTRL, CTRL_CMD_GETFAMILY, 1,
+                                  [nla_str(CTRL_ATTR_FAMILY_NAME, MDIO_GENL_NAME)])
+            for attr_type, payload in reply:
+                if attr_type == CTRL_ATTR_FAMILY_ID:
+                    self._family = NLA_U16.unpack_from(payload)[0]
+                    break
+            else:
+                raise MdioError("No family id in generic netlink reply")
+        return self._family
+
+    def _request(self, family, cmd, version, attrs):
+        with self._lock:
+            seq = next(self._seq)
+        reply = self.channel.request(genl_message(family, cmd, version, seq, attrs))
+        msg_type, reply_seq, payload = parse_message(reply)
+        if reply_seq != seq:
+            raise MdioError(f"Netlink reply out of sequence (expected {seq}, got {reply_seq})")
+        if msg_type == NLMSG_ERROR:
+            err = -NLA_S32.unpack_from(payload)[0]
+            if family == GENL_ID_CTRL:
+                raise MdioError(f"mdio-netlink is not available (generic netlink family "
+                                f"'{MDIO_GENL_NAME}': {_errno_text(err)}); is the kernel module loaded?")
+            raise MdioError(f"Netlink request failed: {_errno_text(err)}")
+        return parse_attrs(payload, GENL_HDR.size)
+
+    def transfer(self, bus, xfer):
+        """执行一条 XFER 消息，返回 EMIT 输出的值"""
+        try:
+            with profiler.span('transport', 'netlink_xfer', insns=len(xfer.insns)):
+                attrs = self._request(self.family(), MDIO_GENL_XFER, MDIO_GENL_VERSION, [
+                    nla_str(MDIO_NLA_BUS_ID, bus),
+                    nla(MDIO_NLA_TIMEOUT, NLA_U32.pack(self.timeout_ms)),
+                    nla(MDIO_NLA_PROG, xfer.program()),
+                ])
+        except MdioError as e:
+            e.index = xfer.first
+            raise
+        values = []
+        err = 0
+        for attr_type, payload in attrs:
+            if attr_type == MDIO_NLA_DATA:
+                values = [NLA_U32.unpack_from(p)[0] & 0xFFFF for _, p in parse_attrs(payload)]
+            elif attr_type == MDIO_NLA_ERROR:
+                err = -NLA_S32.unpack_from(payload)[0]
+        if err:
+            # 已经输出的值之后的第一个读就是出错的位置；没有读时只能归到片段的第一个操作
+            index = xfer.emits[len(values)] if len(values) < len(xfer.emits) else xfer.first
+            raise MdioError(f"mdio-netlink transfer on {bus} failed: {_errno_text(err)}", index=index,
+                            transient=err in TRANSIENT_ERRNOS)
+        if len(values) != len(xfer.emits):
+            raise MdioError(f"mdio-netlink returned {len(values)} values, expected {len(xfer.emits)}",
+                            index=xfer.first)
+        return values
+
+    def _poll(self, bus, addr, op, index):
+        xfer = Transfer(index)
+        xfer.insns = op_insns(addr, MdioOp.read(op.fmt, op.reg, op.dev_id))
+        xfer.emits = [index]
+        poll = PollBackoff(op)
+        with profiler.span('poll', 'netlink_poll', reg=op.reg) as sp:
+            try:
+                while True:
+                    value = self.transfer(bus, xfer)[0]
+                    wait = poll.next_wait(value)
+                    if wait is None:
+                        return value
+                    time.sleep(wait)
+            except MdioError as e:
+                if e.index is None:
+                    e.index = index
+                raise
+            finally:
+                sp.set(iterations=poll.iterations)
+
+    def execute(self, bus, addr, ops):
+        results = [None] * len(ops)
+        for segment in compile_ops(addr, ops):
+            if isinstance(segment, Transfer):
+                for index, value in zip(segment.emits, self.transfer(bus, segment)):
+                    results[index] = value
+            elif segment[0] == 'delay':
+                time.sleep(ops[segment[1]].interval / 1000.0)
+            else:
+                index = segment[1]
+                results[index] = self._poll(bus, addr, ops[index], index)
+        return results
+
+    def list_buses(self):
+        return self.channel.list_buses()
+
+    def scan_bus(self, bus):
+        """与 mdio 工具相同：读取每个地址的 ID1 / ID2，不响应的地址（读到 0xffff）不列出"""
+        xfer = Transfer(0)
+        for addr in range(32):
+            for id_reg in (0x02, 0x03):
+                xfer.insns += [insn(OP_READ, imm(addr), imm(id_reg), reg(0)), insn(OP_EMIT, reg(0))]
+                xfer.emits.append(len(xfer.emits))
+        values = self.transfer(bus, xfer)
+        found = []
+        for addr in range(32):
+            id1, id2 = values[2 * addr], values[2 * addr + 1]
+            if (id1, id2) != (0xFFFF, 0xFFFF):
+                found.append((addr, id1 << 16 | id2))
+        return found
+
+
+class NetlinkBackend:
+    """寄存器后端接口（read / write / list_buses / scan_bus），供 Broker 使用"""
+
+    def __init__(self, channel=None):
+        self.transport = NetlinkTransport(channel)
+
+    def read(self, bus, addr, mode, dev_id, reg_addr):
+        return self.transport.execute(bus, addr, [MdioOp.read(CANONICAL_FORMATS[mode], reg_addr, dev_id)])[0]
+
+    def write(self, bus, addr, mode, dev_id, reg_addr, val, mask=0):
+        self.transport.execute(bus, addr, [MdioOp.write(CANONICAL_FORMATS[mode], reg_addr, val, mask, dev_id)])
+
+    def list_buses(self):
+        return self.transport.list_buses()
+
+    def scan_bus(self, bus):
+        return self.transport.scan_bus(bus)
+
+
+# ---------- 假 netlink 端点 ----------
+
+class FakeNetlinkEndpoint:
+    """
+    在寄存器后端（read / write / list_buses / scan_bus，如 SimulatedMdio）上模拟内核一侧：
+    解析 NetlinkTransport 发出的同样的二进制消息，执行其中的程序并按内核的格式回复。
+    C22 寄存器 13 / 14 按 IEEE 802.3 的 MMD 间接访问方式转换为后端的 mmd 访问；
+    不存在的地址读到 0xffff，与真实总线相同。
+    """
+
+    def __init__(self, backend, family_id=0x20):
+        self.backend = backend
+        self.family_id = family_id
+        self.requests = 0
+        self._mmd = {}   # (bus, addr) -> [MMD 控制寄存器, 地址]
+        self._lock = threading.Lock()
+
+    def list_buses(self):
+        return self.backend.list_buses()
+
+    def request(self, message):
+        msg_type, seq, payload = parse_message(message)
+        with self._lock:
+            self.requests += 1
+        if len(payload) < GENL_HDR.size:
+            return error_message(seq, 22, message)   # EINVAL
+        cmd, _, _ = GENL_HDR.unpack_from(payload)
+        attrs = dict(parse_attrs(payload, GENL_HDR.size))
+        if msg_type == GENL_ID_CTRL and cmd == CTRL_CMD_GETFAMILY:
+            if attrs.get(CTRL_ATTR_FAMILY_NAME, b'').rstrip(b'\0').decode() != MDIO_GENL_NAME:
+                return error_message(seq, 2, message)   # ENOENT
+            return self._reply(GENL_ID_CTRL, CTRL_CMD_NEWFAMILY, seq, [
+                nla(CTRL_ATTR_FAMILY_ID, NLA_U16.pack(self.family_id)),
+                nla_str(CTRL_ATTR_FAMILY_NAME, MDIO_GENL_NAME),
+            ])
+        if msg_type != self.family_id or cmd != MDIO_GENL_XFER:
+            return error_message(seq, 95, message)   # EOPNOTSUPP
+        bus = attrs.get(MDIO_NLA_BUS_ID, b'').rstrip(b'\0').decode()
+        if bus not in self.backend.list_buses():
+            return error_message(seq, 19, message)   # ENODEV
+        values, err = self._run(bus, attrs.get(MDIO_NLA_PROG, b''))
+        return self._reply(self.family_id, MDIO_GENL_XFER, seq, [
+            nla(MDIO_NLA_DATA, b''.join(nla(MDIO_NLA_DATA, NLA_U32.pack(v)) for v in values)),
+            nla(MDIO_NLA_ERROR, NLA_S32.pack(-err)),
+        ])
+
+    @staticmethod
+    def _reply(family, cmd, seq, attrs):
+        message = bytearray(genl_message(family, cmd, 1, seq, attrs))
+        NLMSG_HDR.pack_into(message, 0, len(message), family, 0, seq, 0)
+        return bytes(message)
+
+    def _run(self, bus, prog):
+        """执行程序，返回 (EMIT 的值, errno)"""
+        insns = [decode_insn(prog[i:i + INSN.size]) for i in range(0, len(prog) - INSN.size + 1, INSN.size)]
+        regs = [0] * PROG_REGS
+        values = []
+
+        def arg(a):
+            mode, value = a >> 16, a & 0xFFFF
+            if mode == ARG_REG and value < PROG_REGS:
+                return regs[value]
+            if mode == ARG_IMM:
+                return value
+            raise ValueError("bad argument")
+
+        def dst(a, value):
+            if a >> 16 != ARG_REG or (a & 0xFFFF) >= PROG_REGS:
+                raise ValueError("bad destination")
+            regs[a & 0xFFFF] = value & 0xFFFF
+
+        pc = 0
+        try:
+            while pc < len(insns):
+                op, a0, a1, a2 = insns[pc]
+                pc += 1
+                if op == OP_READ:
+                    dst(a2, self._read(bus, arg(a0), arg(a1)))
+                elif op == OP_WRITE:
+                    self._write(bus, arg(a0), arg(a1), arg(a2))
+                elif op in (OP_AND, OP_OR, OP_ADD):
+                    x, y = arg(a0), arg(a1)
+                    dst(a2, x & y if op == OP_AND else x | y if op == OP_OR else x + y)
+                elif op in (OP_JEQ, OP_JNE):
+                    if (arg(a0) == arg(a1)) == (op == OP_JEQ):
+                        pc += (a2 & 0xFFFF) - ((a2 & 0x8000) << 1)
+                elif op == OP_EMIT:
+                    values.append(arg(a0))
+                else:
+                    return values, 22   # EINVAL
+        except ValueError:
+            return values, 22
+        return values, 0
+
+    def _read(self, bus, dev, port):
+        if dev & C45_FLAG:
+            return self._backend_read(bus, (dev >> 5) & 0x1F, MODE_MMD, dev & 0x1F, port)
+        state = self._mmd.setdefault((bus, dev), [0, 0])
+        if port == MMD_CTRL:
+            return state[0]
+        if port == MMD_DATA:
+            if state[0] & MMD_FUNC_DATA:
+                return self._backend_read(bus, dev, MODE_MMD, state[0] & 0x1F, state[1])
+            return state[1]
+        return self._backend_read(bus, dev, MODE_C22, 0, port)
+
+    def _write(self, bus, dev, port, value):
+        if dev & C45_FLAG:
+            self._backend_write(bus, (dev >> 5) & 0x1F, MODE_MMD, dev & 0x1F, port, value)
+            return
+        state = self._mmd.setdefault((bus, dev), [0, 0])
+        if port == MMD_CTRL:
+            state[0] = value
+        elif port == MMD_DATA and state[0] & MMD_FUNC_DATA:
+            self._backend_write(bus, dev, MODE_MMD, state[0] & 0x1F, state[1], value)
+        elif port == MMD_DATA:
+            state[1] = value
+        else:
+            self._backend_write(bus, dev, MODE_C22, 0, port, value)
+
+    def _backend_read(self, bus, addr, mode, dev_id, reg_addr):
+        try:
+            return self.backend.read(bus, addr, mode, dev_id, reg_addr)
+        except MdioError:
+            return 0xFFFF   # 地址上没有设备
+
+    def _backend_write(self, bus, addr, mode, dev_id, reg_addr, value):
+        try:
+            self.backend.write(bus, addr, mode, dev_id, reg_addr, value)
+        except MdioError:
+            pass
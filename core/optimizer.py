@@ -0,0 +1,137 @@
+"""
+批量程序优化：合并对同一寄存器的相邻带掩码写。
+
+厂商序列经常在连续的几个步骤中分别写同一寄存器的不同位段，每个带掩码的写在总线上都是一次
+读-改-写（读 + 写两次访问）。按 mdio 工具的写语义 new = (old & mask) | val，两次相邻的写
+
+    W1 (v1, m1) 之后 W2 (v2, m2)  等价于  (old & m1 & m2) | (v1 & m2) | v2
+
+因此可以合并为一次 mask = m1 & m2、val = (v1 & m2) | v2 的写；合并后 mask 为 0 时连读都省去。
+
+只合并程序中紧邻的、同一 (模板, dev_id, reg) 的写。以下情况作为屏障，不跨越合并：
+  - 读、延时、完成检查轮询（它们在程序中位于两次写之间，写不再相邻）；
+  - 写入复位位或自清零位（配置 "registers" 中的 reset / self_clear 及 IEEE 默认属性）；
+  - 易失寄存器（"volatile": true）；
+  - 步骤中标记了 "separate": true 的写；
+  - 配置中 "coalesce_writes": false 时整个配置都不合并。
+
+    python3 -m core.optimizer              # 报告每个测试模式合并的步骤数与节省的总线访问次数
+"""
+from core.shadow import RegisterAttrs, op_space
+from core.transport import ACTION_DELAY, ACTION_WRITE, MdioOp
+
+FULL_MASK = 0xFFFF
+
+_DEFAULT_ATTRS = None
+
+
+def bus_cost(op):
+    """一个操作在总线上的访问次数：带掩码的写需要先读，延时不访问总线，轮询按一次计"""
+    if op.action == ACTION_WRITE:
+        return 2 if op.mask else 1
+    return 0 if op.action == ACTION_DELAY else 1
+
+
+def program_cost(ops):
+    return sum(bus_cost(op) for op in ops)
+
+
+def _default_attrs():
+    global _DEFAULT_ATTRS
+    if _DEFAULT_ATTRS is None:
+        _DEFAULT_ATTRS = RegisterAttrs({}, {})
+    return _DEFAULT_ATTRS
+
+
+def _mergeable(step, op, attrs):
+    if op is None or op.action != ACTION_WRITE or step.get('separate'):
+        return False
+    space, dev_id = op_space(op)
+    attr = attrs.get(space, dev_id, op.reg)
+    return attr.volatile is not True and not op.val & (attr.self_clear | attr.reset)
+
+
+def coalesce_writes(program, attrs=None):
+    """
+    在编译好的 SequenceProgram 上原地合并相邻的写。被合并的各步骤共享合并后的操作
+    （op_index 相同，结果均为 None）。program.merged 记录被合并掉的步骤数，
+    program.saved 记录节省的总线访问次数。
+    """
+    attrs = attrs or _default_attrs()
+    before = program_cost(program.ops)
+    ops = []
+    merged = 0
+    last = None   # 可以继续合并的上一个写在 ops 中的序号
+
+    for step in program.steps:
+        op = program.ops[step.op_index]
+        mergeable = step.action == 'WRITE' and _mergeable(step.step, op, attrs)
+        prev = ops[last] if last is not None and mergeable else None
+        if prev is not None and (prev.fmt, prev.dev_id, prev.reg) == (op.fmt, op.dev_id, op.reg):
+            ops[last] = MdioOp.write(op.fmt, op.reg, ((prev.val & op.mask) | op.val) & FULL_MASK,
+                                     prev.mask & op.mask, op.dev_id)
+            step.op_index = last
+            merged += 1
+        else:
+            ops.append(op)
+            step.op_index = len(ops) - 1
+            last = step.op_index if mergeable else None
+        if step.poll_index is not None:
+            ops.append(program.ops[step.poll_index])
+            step.poll_index = len(ops) - 1
+            last = None
+
+    program.ops = ops
+    program.merged = merged
+    program.saved = before - program_cost(ops)
+    return program
+
+
+def report(configs, common_config):
+    """返回 [(配置名, 路径, 步骤数, 合并前总线访问次数, 合并的步骤数, 节省的访问次数), ...]"""
+    from core.sequence import compile_sequence, iter_sequences, resolve_default_template, sequence_path
+    templates = common_config.get('cmd_templates', {})
+    rows = []
+    for cfg in configs:
+        name = cfg.get('config_name', 'Unnamed Config')
+        default_tmpl_key, _ = resolve_default_template(cfg, templates)
+        attrs = RegisterAttrs(cfg, templates)
+        for path, sequence in iter_sequences(cfg.get('test_modes', {})):
+            try:
+                plain = compile_sequence(sequence, templates, default_tmpl_key, cfg.get('check_inprogress'),
+                                         coalesce=False)
+            except (ValueError, TypeError, AttributeError):
+                continue
+            before = program_cost(plain.ops)
+            optimized = coalesce_writes(plain, attrs)
+            rows.append((name, sequence_path(path), len(optimized.steps), before, optimized.merged, optimized.saved))
+    return rows
+
+
+def main(argv=None):
+    # 命令行工具的依赖在这里导入：编译每个序列都会导入本模块，不为它们付出启动时间
+    import argparse
+    import contextlib
+    import io
+    from core.config_cache import load_compiled_configs
+    parser = argparse.ArgumentParser(description="Report bus operations saved by write coalescing")
+    parser.add_argument('--configs', default="configs", help="Config directory")
+    parser.add_argument('--all', action='store_true', help="Also list test modes with nothing to merge")
+    args = parser.parse_args(argv)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        configs, common_config, _, _ = load_compiled_configs(args.configs, use_cache=False)
+    rows = report(configs, common_config)
+    total_before = sum(r[3] for r in rows)
+    total_saved = sum(r[5] for r in rows)
+    print(f"  {'config / test mode':<72} {'steps':>5} {'bus ops':>7} {'merged':>6} {'saved':>5}")
+    for name, path, steps, before, merged, saved in rows:
+        if merged or args.all:
+            print(f"  {(name + ': ' + path)[:72]:<72} {steps:>5} {before:>7} {merged:>6} {saved:>5}")
+    print(f"[*] {len(rows)} test modes, {total_saved} of {total_before} bus operations saved")
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
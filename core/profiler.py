@@ -0,0 +1,203 @@
+"""
+热路径计时埋点。
+
+用 `--profile` 启用后，扫描、Read ID、序列执行、复位以及传输层的每次访问都会记录耗时
+（命令模板渲染、子进程 / Broker / 后端访问延迟、排队等待、完成检查的轮询次数与休眠时间），
+会话结束时输出各类操作的直方图与 p50 / p99，并可导出为 Chrome trace（.json，
+可在 chrome://tracing 或 Perfetto 中打开）或 JSONL（.jsonl）。
+
+未启用时 ACTIVE 为 None，span() 直接返回一个共享的空上下文，开销只有一次函数调用。
+
+    with profiler.span('transport', 'process', argv=argv) as sp:
+        ...
+        sp.set(returncode=0)
+"""
+import json
+import os
+import threading
+import time
+
+# 当前的 Profiler；为 None 时所有埋点都直接返回
+ACTIVE = None
+
+# trace 中最多保留的事件数，超出后只做统计不再记录事件
+MAX_EVENTS = 200000
+
+# 直方图的桶上界（秒）
+HISTOGRAM_BOUNDS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0)
+HISTOGRAM_LABELS = ('<10us', '<100us', '<1ms', '<10ms', '<100ms', '<1s', '>=1s')
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ('profiler', 'cat', 'name', 'args', 'start')
+
+    def __init__(self, profiler, cat, name, args):
+        self.profiler = profiler
+        self.cat = cat
+        self.name = name
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.profiler.record(self.cat, self.name, self.start, time.perf_counter() - self.start, self.args)
+        return False
+
+    def set(self, **args):
+        """补充在执行过程中才知道的参数，例如轮询次数"""
+        self.args.update(args)
+
+
+def _percentile(samples, q):
+    return samples[min(len(samples) - 1, int(round(q * (len(samples) - 1))))]
+
+
+class Stat:
+    """一类操作的耗时样本"""
+    __slots__ = ('samples', 'histogram')
+
+    def __init__(self):
+        self.samples = []
+        self.histogram = [0] * len(HISTOGRAM_LABELS)
+
+    def add(self, duration):
+        self.samples.append(duration)
+        for i, bound in enumerate(HISTOGRAM_BOUNDS):
+            if duration < bound:
+                self.histogram[i] += 1
+                return
+        self.histogram[-1] += 1
+
+    def as_dict(self):
+        ordered = sorted(self.samples)
+        return {
+            "count": len(ordered),
+            "total_ms": sum(ordered) * 1000.0,
+            "mean_ms": sum(ordered) * 1000.0 / len(ordered),
+            "p50_ms": _percentile(ordered, 0.50) * 1000.0,
+            "p99_ms": _percentile(ordered, 0.99) * 1000.0,
+            "max_ms": ordered[-1] * 1000.0,
+            "histogram": dict(zip(HISTOGRAM_LABELS, self.histogram)),
+        }
+
+
+class Profiler:
+    def __init__(self, max_events=MAX_EVENTS):
+        self.max_events = max_events
+        self.origin = time.perf_counter()
+        self.events = []
+        self.dropped = 0
+        self.stats = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def record(self, cat, name, start, duration, args=None):
+        event = (cat, name, start, duration, threading.get_ident(), args or None)
+        with self._lock:
+            stat = self.stats.get((cat, name))
+            if stat is None:
+                stat = self.stats[(cat, name)] = Stat()
+            stat.add(duration)
+            if len(self.events) < self.max_events:
+                self.events.append(event)
+            else:
+                self.dropped += 1
+
+    def add_count(self, cat, name, value):
+        with self._lock:
+            total, n = self.counters.get((cat, name), (0, 0))
+            self.counters[(cat, name)] = (total + value, n + 1)
+
+    def summary(self):
+        with self._lock:
+            stats = {f"{cat}.{name}": stat.as_dict() for (cat, name), stat in sorted(self.stats.items())}
+            counters = {f"{cat}.{name}": {"total": total, "samples": n}
+                        for (cat, name), (total, n) in sorted(self.counters.items())}
+        return {"timings": stats, "counters": counters, "dropped_events": self.dropped}
+
+    def summary_lines(self):
+        summary = self.summary()
+        lines = [f"{'operation':<28} {'count':>7} {'total ms':>10} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}  histogram"]
+        for key, s in summary['timings'].items():
+            hist = ' '.join(f"{label}:{n}" for label, n in s['histogram'].items() if n)
+            lines.append(f"{key:<28} {s['count']:>7} {s['total_ms']:>10.2f} {s['p50_ms']:>9.3f} "
+                         f"{s['p99_ms']:>9.3f} {s['max_ms']:>9.3f}  {hist}")
+        for key, c in summary['counters'].items():
+            lines.append(f"{key:<28} {c['samples']:>7} samples, total {c['total']:g}")
+        if summary['dropped_events']:
+            lines.append(f"({summary['dropped_events']} trace events dropped, statistics are complete)")
+        return lines
+
+    def _trace_events(self):
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+        for cat, name, start, duration, tid, args in events:
+            event = {"name": name, "cat": cat, "ph": "X", "pid": pid, "tid": tid,
+                     "ts": round((start - self.origin) * 1e6, 3), "dur": round(duration * 1e6, 3)}
+            if args:
+                event["args"] = args
+            yield event
+
+    def export(self, path):
+        """按扩展名导出：.jsonl 为每行一个事件，其余为 Chrome trace JSON"""
+        with open(path, 'w') as fp:
+            if path.endswith('.jsonl'):
+                for event in self._trace_events():
+                    fp.write(json.dumps(event, default=str) + "\n")
+            else:
+                json.dump({"traceEvents": list(self._trace_events()), "displayTimeUnit": "ms"}, fp, default=str)
+
+
+def enable(max_events=MAX_EVENTS):
+    global ACTIVE
+    ACTIVE = Profiler(max_events)
+    return ACTIVE
+
+
+def disable():
+    global ACTIVE
+    profiler, ACTIVE = ACTIVE, None
+    return profiler
+
+
+def span(cat, name, **args):
+    profiler = ACTIVE
+    if profiler is None:
+        return NULL_SPAN
+    return Span(profiler, cat, name, args)
+
+
+def record(cat, name, duration, **args):
+    """记录一个已经测量好的时长（例如排队等待时间）"""
+    profiler = ACTIVE
+    if profiler is not None:
+        profiler.record(cat, name, time.perf_counter() - duration, duration, args)
+
+
+def count(cat, name, value):
+    """累加计数，例如轮询次数"""
+    profiler = ACTIVE
+    if profiler is not None:
+        profiler.add_count(cat, name, value)
@@ -0,0 +1,99 @@
+"""
+写入结果的回读确认。
+
+根据编译好的批量程序推算序列执行完后各寄存器应有的值：按顺序应用每个写（new = (old & mask) | val），
+同时记录哪些位由序列确定（写入时 mask 中为 0 的位以及 val 中为 1 的位）。以下位不参与确认：
+  - 自清零位与复位位（配置 "registers" 中的 self_clear / reset 及 IEEE 默认属性）；
+  - 易失寄存器（"volatile": true）的全部位；
+  - 写入复位位之后，复位之前写入的其他寄存器（复位使它们恢复默认值）。
+确认时对所有寄存器做一次批量读取，按 (值 & 确定位) 比较。
+"""
+from core.shadow import op_space
+from core.snapshot import format_register
+from core.transport import ACTION_WRITE, MdioError, MdioOp
+
+FULL_MASK = 0xFFFF
+
+
+class Expectation:
+    """一个寄存器的期望值：op 为回读用的读操作，mask 为由序列确定的位，steps 为写入它的步骤序号（从 0 起）"""
+    __slots__ = ('op', 'value', 'mask', 'steps', 'space', 'dev_id')
+
+    def __init__(self, op, value, mask, steps, space, dev_id):
+        self.op = op
+        self.value = value
+        self.mask = mask
+        self.steps = steps
+        self.space = space
+        self.dev_id = dev_id
+
+    @property
+    def register(self):
+        return format_register(self.space, self.dev_id, self.op.reg)
+
+
+def expected_registers(program, attrs):
+    """返回 [Expectation, ...]，按寄存器第一次被写入的顺序排列"""
+    state = {}   # (space, dev_id, reg) -> [最后一次写的 op, 值, 确定位, 步骤]
+    seen = set()
+    for i, step in enumerate(program.steps):
+        op = program.ops[step.op_index]
+        if op.action != ACTION_WRITE:
+            continue
+        space, dev_id = op_space(op)
+        key = (space, dev_id, op.reg)
+        if step.op_index in seen:
+            # 与前面的步骤合并为同一个写（见 core/optimizer.py），已经应用过
+            state[key][3].append(i)
+            continue
+        seen.add(step.op_index)
+        attr = attrs.get(space, dev_id, op.reg)
+        if op.val & attr.reset:
+            state.clear()
+        entry = state.setdefault(key, [op, 0, 0, []])
+        entry[0] = op
+        entry[1] = ((entry[1] & op.mask) | op.val) & FULL_MASK
+        # mask 中为 0 的位由 val 决定；val 中为 1 的位无论原值如何写入后都是 1
+        entry[2] = ((entry[2] & op.mask) | (~op.mask & FULL_MASK) | op.val) & ~(attr.self_clear | attr.reset)
+        entry[3].append(i)
+        if attr.volatile is True:
+            entry[2] = 0
+
+    expectations = []
+    for (space, dev_id, reg), (op, value, mask, steps) in state.items():
+        if mask:
+            expectations.append(Expectation(MdioOp.read(op.fmt, reg, op.dev_id), value & mask, mask,
+                                            steps, space, dev_id))
+    return expectations
+
+
+def readback_ops(expectations):
+    return [e.op for e in expectations]
+
+
+def mismatches(expectations, values):
+    """比较回读的值，返回 [(Expectation, 读到的值), ...]"""
+    return [(e, value) for e, value in zip(expectations, values) if value & e.mask != e.value]
+
+
+def by_step(bad):
+    """按最后写入寄存器的步骤分组：返回 [(步骤序号, [(Expectation, 读到的值), ...]), ...]，按步骤排序"""
+    groups = {}
+    for e, value in bad:
+        groups.setdefault(e.steps[-1], []).append((e, value))
+    return sorted(groups.items())
+
+
+class ReadbackMismatch(MdioError):
+    """序列执行成功但回读确认不一致；index 为第一个不一致寄存器最后写入它的操作序号"""
+
+    def __init__(self, program, bad):
+        step = program.steps[by_step(bad)[0][0]]
+        super().__init__(f"Readback mismatch in {len(bad)} register(s)", index=step.op_index)
+        self.mismatches = bad
+
+
+def format_mismatch(expectation, value):
+    steps = ', '.join(str(i + 1) for i in expectation.steps)
+    return (f"{expectation.register}: expected 0x{expectation.value:04x} under mask 0x{expectation.mask:04x}, "
+            f"read 0x{value:04x} (step {steps})")
@@ -0,0 +1,218 @@
+"""
+MDIO 会话的录制与回放。
+
+录制：RecordingTransport 包装任意传输层，把每次总线访问（请求、结果、开始时间、耗时）
+追加写入一个紧凑的二进制日志。回放：ReplayTransport 从日志中按顺序取出结果交给
+同样的扫描 / 序列执行代码，可以尽快回放，也可以按录制时的节奏回放。
+
+日志格式：8 字节文件头 MAGIC，之后每条记录为
+    RECORD 头 (开始时间 s, 耗时 s, 请求长度, 响应长度) + 请求 + 响应
+请求与响应的编码与 Broker 协议相同（见 core/broker.py），出错的访问记录为错误响应。
+
+    python3 main.py --record board7.mdiolog ...
+    python3 main.py --replay board7.mdiolog [--replay-pacing original]
+    python3 -m core.record board7.mdiolog          # 查看日志内容
+"""
+import argparse
+import collections
+import struct
+import sys
+import threading
+import time
+
+from core.broker import (
+    OP_EXEC, OP_LIST, OP_SCAN, STATUS_OK,
+    _pack_str, _unpack_str, check_reply, decode_buses, decode_exec, decode_scan, decode_values,
+    encode_buses, encode_error, encode_exec, encode_scan, encode_values,
+)
+from core.transport import MdioError, MdioTransport, describe_op
+
+MAGIC = b'PHYMDIO\x01'
+RECORD = struct.Struct('!ddII')
+
+PACING_FAST = 'fast'
+PACING_ORIGINAL = 'original'
+
+
+class RecordingTransport(MdioTransport):
+    """把每次访问追加记录到日志文件中，行为与被包装的传输层完全相同"""
+
+    def __init__(self, inner, path):
+        self.inner = inner
+        self.path = path
+        self.records = 0
+        self._lock = threading.Lock()
+        self._origin = time.monotonic()
+        self._fp = open(path, 'wb')
+        self._fp.write(MAGIC)
+        self._fp.flush()
+
+    def _append(self, start, request, reply):
+        header = RECORD.pack(start - self._origin, time.monotonic() - start, len(request), len(reply))
+        with self._lock:
+            self._fp.write(header + request + reply)
+            self._fp.flush()
+            self.records += 1
+
+    def _call(self, request, fn, encode):
+        start = time.monotonic()
+        try:
+            result = fn()
+        except MdioError as e:
+            self._append(start, request, encode_error(str(e), e.index))
+            raise
+        self._append(start, request, bytes([STATUS_OK]) + encode(result))
+        return result
+
+    def describe(self, bus, addr, op):
+        return self.inner.describe(bus, addr, op)
+
+    def execute(self, bus, addr, ops):
+        return self._call(encode_exec(bus, addr, ops), lambda: self.inner.execute(bus, addr, ops), encode_values)
+
+    def list_buses(self):
+        return self._call(bytes([OP_LIST]), self.inner.list_buses, encode_buses)
+
+    def scan_bus(self, bus):
+        return self._call(bytes([OP_SCAN]) + _pack_str(bus), lambda: self.inner.scan_bus(bus), encode_scan)
+
+    def close(self):
+        with self._lock:
+            self._fp.close()
+
+
+class Record:
+    __slots__ = ('index', 'start', 'duration', 'request', 'reply')
+
+    def __init__(self, index, start, duration, request, reply):
+        self.index = index
+        self.start = start
+        self.duration = duration
+        self.request = request
+        self.reply = reply
+
+    @property
+    def opcode(self):
+        return self.request[0]
+
+    @property
+    def bus(self):
+        """请求所在的总线，列出总线的请求为 None"""
+        if self.opcode == OP_LIST:
+            return None
+        bus, _ = _unpack_str(self.request, 1)
+        return bus
+
+
+def read_log(path):
+    """逐条读取日志记录"""
+    with open(path, 'rb') as fp:
+        if fp.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"'{path}' is not an MDIO session log")
+        index = 0
+        while True:
+            header = fp.read(RECORD.size)
+            if not header:
+                return
+            if len(header) < RECORD.size:
+                raise ValueError(f"Truncated record {index} in '{path}'")
+            start, duration, req_len, reply_len = RECORD.unpack(header)
+            request = fp.read(req_len)
+            reply = fp.read(reply_len)
+            if len(request) < req_len or len(reply) < reply_len:
+                raise ValueError(f"Truncated record {index} in '{path}'")
+            yield Record(index, start, duration, request, reply)
+            index += 1
+
+
+class ReplayTransport(MdioTransport):
+    """
+    按录制顺序回放日志中的结果。并行扫描时不同总线的访问顺序不确定，
+    因此按总线分别排队：每条总线上的请求必须与录制时的顺序完全一致，否则报告回放偏离。
+    pacing 为 PACING_ORIGINAL 时按录制时的开始时间和耗时等待后再返回结果。
+    """
+
+    def __init__(self, path, pacing=PACING_FAST):
+        self.path = path
+        self.pacing = pacing
+        self.replayed = 0
+        self._queues = collections.defaultdict(collections.deque)
+        for record in read_log(path):
+            self._queues[record.bus].append(record)
+        self._lock = threading.Lock()
+        self._origin = None
+
+    def remaining(self):
+        with self._lock:
+            return sum(len(q) for q in self._queues.values())
+
+    def _next(self, request, bus):
+        with self._lock:
+            if self._origin is None:
+                self._origin = time.monotonic()
+            queue = self._queues.get(bus)
+            if not queue:
+                raise MdioError(f"Replay log exhausted for bus {bus}: {describe_request(request)}")
+            record = queue[0]
+            if record.request != request:
+                raise MdioError(f"Replay diverged at record {record.index}: expected "
+                                f"{describe_request(record.request)}, got {describe_request(request)}")
+            queue.popleft()
+            self.replayed += 1
+        if self.pacing == PACING_ORIGINAL:
+            delay = self._origin + record.start + record.duration - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return check_reply(record.reply, source=None)
+
+    def execute(self, bus, addr, ops):
+        return decode_values(self._next(encode_exec(bus, addr, ops), bus), ops)
+
+    def list_buses(self):
+        return decode_buses(self._next(bytes([OP_LIST]), None))
+
+    def scan_bus(self, bus):
+        return decode_scan(self._next(bytes([OP_SCAN]) + _pack_str(bus), bus))
+
+
+def describe_request(request):
+    opcode = request[0]
+    if opcode == OP_LIST:
+        return "list buses"
+    if opcode == OP_SCAN:
+        bus, _ = _unpack_str(request, 1)
+        return f"scan {bus}"
+    if opcode == OP_EXEC:
+        bus, addr, ops = decode_exec(request, 1)
+        if len(ops) == 1:
+            return describe_op(bus, addr, ops[0])
+        return f"{len(ops)} ops on {bus}:{addr} ({describe_op(bus, addr, ops[0])}, ...)"
+    return f"opcode {opcode}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the contents of an MDIO session log")
+    parser.add_argument('log', help="Log file written by --record")
+    parser.add_argument('--limit', type=int, default=None, help="Show at most N records")
+    args = parser.parse_args(argv)
+
+    total = 0
+    bus_time = 0.0
+    errors = 0
+    last = 0.0
+    for record in read_log(args.log):
+        total += 1
+        bus_time += record.duration
+        last = max(last, record.start + record.duration)
+        ok = record.reply[0] == STATUS_OK
+        errors += not ok
+        if args.limit is None or record.index < args.limit:
+            status = "" if ok else f"  [ERR] {_unpack_str(record.reply, 1)[0]}"
+            print(f"{record.index:>6} {record.start * 1000:>10.3f} ms {record.duration * 1000:>8.3f} ms  "
+                  f"{describe_request(record.request)}{status}")
+    print(f"[*] {total} records, {errors} errors, {bus_time * 1000:.1f} ms of bus time over {last * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
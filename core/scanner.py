@@ -1,40 +1,44 @@
-import subprocess
-import re
+import shutil
 import sys
-import json
-import os
+import threading
+
+from core import profiler
+from core.identity import IdentityIndex
+from core.sequence import find_template, read_id_sequence
+from core.transport import MdioError, MdioOp, SubprocessTransport, to_int
+
+# 默认并行扫描的线程数（同时处理的总线数量）
+DEFAULT_WORKERS = 8
 
 class PhyScanner:
-    def __init__(self, configs, common_config):
-        # 将命令定义为包含 sudo 的列表
-        self.mdio_base_cmd = ["sudo", "mdio"]
+    def __init__(self, configs, common_config, transport=None, identity_index=None):
+        # 寄存器访问传输层，默认沿用 sudo mdio 子进程方式
+        self.transport = transport or SubprocessTransport()
         # 加载配置文件
         self.configs = configs
         self.common_config = common_config
+        # Read ID 探测计划在首次使用时生成：(计划列表, {key: MdioOp}, {配置名: keys})，
+        # 并行扫描时多个线程可能同时首次使用，在锁内生成后一次性赋值
+        self._id_tables = None
+        self._id_lock = threading.Lock()
+        # PHY ID 匹配索引，未传入时自行构建（不重复打印加载告警）
+        self.identity_index = identity_index or IdentityIndex(configs, verbose=False)
 
     def check_tool(self):
-        """检查 mdio 工具是否存在，这里跳过实际执行，只检查 mdio"""
-        # 实际检查 sudo 和 mdio 比较复杂，通常我们信任用户已配置 sudo
-        try:
-            # 仅检查 mdio
-            subprocess.run(["mdio", "-h"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            return True
-        except FileNotFoundError:
+        """检查 mdio 工具是否存在（只查找 PATH，不启动子进程）"""
+        if shutil.which("mdio") is None:
             print(f"Error: 'mdio' tool not found. Please install it.")
             sys.exit(1)
+        return True
 
     def get_buses(self):
         """列出所有 MDIO 总线"""
         try:
-            # 命令：sudo mdio
-            res = subprocess.run(self.mdio_base_cmd, capture_output=True, text=True)
-            if res.returncode != 0:
-                print(f"[ERR] Failed to execute 'sudo mdio'. Check sudo permissions or mdio installation.")
-                print(f"  {res.stderr.strip()}")
-                return []
-                
-            buses = [line.strip() for line in res.stdout.splitlines() if line.strip()]
-            return buses
+            return self.transport.list_buses()
+        except MdioError as e:
+            print(f"[ERR] Failed to list MDIO buses. Check sudo permissions or mdio installation.")
+            print(f"  {e.stderr or e}")
+            return []
         except Exception as e:
             print(f"Error scanning buses: {e}")
             return []
@@ -43,135 +47,235 @@ class PhyScanner:
         """扫描指定总线下的 PHY 设备"""
         devices = []
         try:
-            # 命令：sudo mdio $BUS
-            cmd = self.mdio_base_cmd + [bus]
-            res = subprocess.run(cmd, capture_output=True, text=True)
-            
-            if res.returncode != 0:
-                print(f"[ERR] Failed to execute {' '.join(cmd)}. Check sudo permissions.")
-                print(f"  {res.stderr.strip()}")
+            try:
+                with profiler.span('scan', 'scan_bus', bus=bus):
+                    found = self.transport.scan_bus(bus)
+            except MdioError as e:
+                print(f"[ERR] Failed to scan bus {bus}. Check sudo permissions.")
+                print(f"  {e.stderr or e}")
                 return []
 
-            # 解析 mdio 输出格式，例如:
-            # 0x01  0x002b0980  up
-            # 正则捕获: (Address) (PHY_ID)
-            pattern = re.compile(r"(0x[0-9a-fA-F]+)\s+(0x[0-9a-fA-F]+)")
-            
-            for line in res.stdout.splitlines():
-                match = pattern.search(line)
-                if match:
-                    addr_str = match.group(1)
-                    id_str = match.group(2)
-                    # 关键修改点：将 PHY ID 转换为整数
-                    phy_id_int = int(id_str, 16)
-                    
-                    # 🚨 如果 ID 为 0，使用 Read ID 指令重新获取
-                    if phy_id_int == 0:
-                        phy_id_int = self.read_phy_id(bus, addr_str)
-                    
-                    # 只保留 ID 不为零的结果
-                    if phy_id_int > 0: 
-                        devices.append({
-                            "bus": bus,
-                            "addr_hex": addr_str,
-                            "addr_int": int(addr_str, 16),
-                            "phy_id": phy_id_int  # 整数形式的 PHY ID
-                        })
+            for addr_int, phy_id_int in found:
+                addr_str = f"0x{addr_int:02x}"
+                # 🚨 如果 ID 为 0，使用 Read ID 指令重新获取
+                probed = phy_id_int == 0
+                if probed:
+                    phy_id_int = self.read_phy_id(bus, addr_str)
+                
+                # 只保留 ID 不为零的结果
+                if phy_id_int > 0: 
+                    devices.append(self.device_record(bus, addr_int, phy_id_int, probed))
         except Exception as e:
             print(f"Error scanning devices on {bus}: {e}")
         
         return devices
     
-    def read_phy_id(self, bus, addr_hex):
-        """使用所有configs中定义的Read ID方法来获取硬件ID，保留返回id不为零的结果并返回"""
-        valid_ids = []
-        # 遍历所有配置文件中的Read ID方法
+    @staticmethod
+    def device_record(bus, addr_int, phy_id_int, probed=False):
+        return {
+            "bus": bus,
+            "addr_hex": f"0x{addr_int:02x}",
+            "addr_int": addr_int,
+            "phy_id": phy_id_int,  # 整数形式的 PHY ID
+            "probed": probed,      # ID 是否由 Read ID 探测得到（扫描时 ID 为 0）
+        }
+
+    def discover(self, buses=None, workers=DEFAULT_WORKERS):
+        """
+        并行扫描多条总线：每条总线作为一个任务交给线程池，
+        任务内部的扫描与 Read ID 探测按顺序进行，保证同一总线上的访问串行化，
+        不同总线之间并发。结果按 (总线顺序, 地址) 排序，与串行扫描一致。
+        """
+        if buses is None:
+            buses = self.get_buses()
+        if not buses:
+            return []
+
+        workers = max(1, min(workers, len(buses)))
+        with profiler.span('scan', 'discover', buses=len(buses), workers=workers):
+            if workers == 1:
+                per_bus = [self.scan_devices(bus) for bus in buses]
+            else:
+                # 按需导入：concurrent.futures 会连带导入 logging 等模块，单总线时用不到
+                from concurrent.futures import ThreadPoolExecutor
+                from core.scheduler import inherit_priority
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mdio-scan") as pool:
+                    per_bus = list(pool.map(inherit_priority(self.scan_devices), buses))
+
+        devices = []
+        for devs in per_bus:
+            devices.extend(sorted(devs, key=lambda d: d['addr_int']))
+        return devices
+
+    def _build_id_plans(self):
+        """
+        收集所有配置中 General_Ops -> Read ID 序列的读操作，生成探测计划。
+        同一个 (模板, dev_id, reg) 只对应一个读操作；读寄存器完全相同的配置合并为一个计划。
+        返回 [(配置名, (key, ...)), ...]、{key: MdioOp} 以及 {配置名: (key, ...)}
+        """
+        templates = self.common_config.get('cmd_templates', {})
+        plans = []
+        ops = {}
+        config_keys = {}
+        seen = set()
         for config_data in self.configs:
             config_name = config_data.get('config_name', 'Unnamed Config')
-            if not config_data.get('cmd_template'):
-                continue
             # 获取当前配置指定的模板名称
             tmpl_key = config_data.get('cmd_template')
             if not tmpl_key:
                 continue
-            # 查找General_Ops中的Read ID选项
-            if 'test_modes' in config_data and 'General_Ops' in config_data['test_modes']:
-                general_ops = config_data['test_modes']['General_Ops']
-                if 'options' in general_ops:
-                    for option in general_ops['options']:
-                        if option.get('name') == 'Read ID' and 'sequence' in option:
-                            sequence = option['sequence']
-                            # 执行Read ID序列
-                            phy_id = self._execute_read_id_sequence(bus, addr_hex, sequence, tmpl_key)
-                            if phy_id > 0:
-                                valid_ids.append(phy_id)
-                                print(f"    [+] Successfully read PHY ID: 0x{phy_id:08x}")
-        
-        # 返回第一个有效的ID（如果有的话）
-        return valid_ids[0] if valid_ids else 0
-    
-    def _execute_read_id_sequence(self, bus, addr_hex, sequence, template_name):
-        """执行Read ID序列并返回PHY ID，参考executor.py的实现方式"""
-        try:
-            read_values = []
-            
-            # 从 common 配置中获取命令模板
-            templates = self.common_config.get('cmd_templates', {})
-            
+            # 延迟加载的配置只需要索引中的 Read ID 序列，不会因此加载整个 test_modes
+            sequence = read_id_sequence(config_data)
+            if sequence is None:
+                continue
+            keys = []
             for step in sequence:
-                action = step.get('action', 'WRITE').upper()
-                if action != 'READ':
+                if step.get('action', 'WRITE').upper() != 'READ':
                     continue
-
-                tmpl_key = step.get('cmd', template_name)
-    
-                # 获取模板格式
-                if tmpl_key not in templates:
-                    print(f"    [!] Template '{template_name}' not found in templates")
-                    return 0
-                    
-                tmpl_fmt = templates[tmpl_key]['format']
-                
-                # 构造命令参数
-                cmd_params = {
-                    'bus': bus,
-                    'phy_addr': int(addr_hex, 16),  # 转换为整数
-                    'dev_id': step.get('dev_id', 0),
-                    'reg': step.get('reg'),
-                    'data': ""
-                }
-                
-                # 构造命令字符串
-                cmd_str_no_sudo = tmpl_fmt.format(**cmd_params)
-                cmd_list = cmd_str_no_sudo.split()
-                full_cmd_list = ["sudo"] + cmd_list
-                
-                comment = step.get('comment', '')
-                # print(f"    -> Exec: {' '.join(full_cmd_list):<50} # {comment}")
-                
-                # 执行命令
+                step_tmpl = step.get('template', step.get('cmd', tmpl_key))
+                if step_tmpl not in templates:
+                    print(f"    [!] Template '{step_tmpl}' not found in templates ({config_name})")
+                    keys = []
+                    break
                 try:
-                    result = subprocess.run(full_cmd_list, check=True, capture_output=True, text=True)
-                    if action == 'READ':
-                        read_val = result.stdout.strip()
-                        # print(f"    [RESULT] Register {step.get('reg')} value: {read_val}")
-                        read_values.append(int(read_val, 16))
-                except subprocess.CalledProcessError as e:
-                    print(f"    [!] Failed to read register {step.get('reg')}")
-                    print(f"      STDERR: {e.stderr.strip()}")
-                    return 0
-                except FileNotFoundError:
-                    print("    [!] 'sudo' or 'mdio' command not found.")
-                    return 0
-            
+                    key = (templates[step_tmpl]['format'], to_int(step.get('dev_id', 0)), to_int(step.get('reg')))
+                except ValueError as e:
+                    print(f"    [!] Invalid Read ID step in {config_name}: {e}")
+                    keys = []
+                    break
+                if key not in ops:
+                    ops[key] = MdioOp.read(key[0], key[2], key[1])
+                keys.append(key)
+            keys = tuple(keys)
+            if keys:
+                config_keys.setdefault(config_name, keys)
+            if keys and keys not in seen:
+                seen.add(keys)
+                plans.append((config_name, keys))
+        return plans, ops, config_keys
+
+    def _get_id_tables(self):
+        tables = self._id_tables
+        if tables is None:
+            with self._id_lock:
+                tables = self._id_tables
+                if tables is None:
+                    tables = self._id_tables = self._build_id_plans()
+        return tables
+
+    def id_probe(self, bus, addr_hex):
+        """
+        Read ID 探测过程（生成器），与具体的执行方式无关，同步和异步扫描共用：
+        每次 yield (配置名, [MdioOp, ...])，由调用方执行后 send() 回读到的值列表
+        （执行失败时 send(None)），生成器结束时的返回值即 PHY ID（0 表示未读到）。
+        每个不同的寄存器读取在同一 (bus, addr) 上只执行一次，结果在各配置间共享；
+        一旦组合出的 ID 能匹配某个配置的 identity 即停止探测，
+        否则返回第一个有效（非 0、非 0xFFFFFFFF）的 ID。
+        """
+        plans, id_ops, _ = self._get_id_tables()
+
+        cache = {}
+        fallback = 0
+        for config_name, keys in plans:
+            missing = [k for k in keys if k not in cache]
+            if missing:
+                values = yield config_name, [id_ops[k] for k in missing]
+                if values is None:
+                    values = [None] * len(missing)
+                cache.update(zip(missing, values))
+
+            read_values = [cache[k] for k in keys]
+            if None in read_values:
+                continue
             # 如果读取了两个值（PHY ID1 和 PHY ID2），合并它们
             if len(read_values) >= 2:
-                full_phy_id = (read_values[0] << 16) | read_values[1]
-                return full_phy_id
-            elif len(read_values) == 1:
-                return read_values[0]
-            
-        except Exception as e:
-            print(f"Error executing Read ID sequence for {bus} addr {addr_hex}: {e}")
-        
-        return 0
+                phy_id = (read_values[0] << 16) | read_values[1]
+            else:
+                phy_id = read_values[0]
+            if phy_id in (0, 0xFFFFFFFF):
+                continue
+
+            if self.identity_index.match(phy_id) is not None:
+                print(f"    [+] Successfully read PHY ID: 0x{phy_id:08x}")
+                return phy_id
+            if not fallback:
+                fallback = phy_id
+
+        if fallback:
+            print(f"    [+] Successfully read PHY ID: 0x{fallback:08x}")
+        return fallback
+
+    def verify_ops(self, phy_id, probed):
+        """
+        确认缓存中的设备是否仍在时重新读取的 ID 寄存器：扫描得到的 ID 读 C22 寄存器 2、3
+        （与 mdio 扫描相同），探测得到的 ID 读其匹配配置的 Read ID 寄存器。
+        """
+        _, id_ops, config_keys = self._get_id_tables()
+        cfg = self.identity_index.resolve(phy_id) if probed else None
+        keys = config_keys.get(cfg.get('config_name', 'Unnamed Config')) if cfg else None
+        if keys:
+            return [id_ops[k] for k in keys]
+        fmt = find_template(self.common_config.get('cmd_templates', {}), c22=True)
+        return [MdioOp.read(fmt, 0x02), MdioOp.read(fmt, 0x03)] if fmt else []
+
+    def verify_device(self, bus, addr_int, phy_id, probed):
+        """重新读取 ID 寄存器（一次批量读取），返回读到的 ID；读取失败返回 0"""
+        ops = self.verify_ops(phy_id, probed)
+        if not ops:
+            return 0
+        with profiler.span('scan', 'verify', bus=bus, addr=addr_int):
+            try:
+                values = self.transport.execute(bus, addr_int, ops)
+            except MdioError:
+                return 0
+        if len(values) >= 2:
+            return (values[0] << 16) | values[1]
+        return values[0]
+
+    def rescan_bus(self, bus, cached=()):
+        """
+        增量重新扫描一条总线：扫描得到非零 ID 的地址直接使用；ID 为 0 的地址如果在 cached 中
+        且 ID 寄存器仍然匹配则沿用缓存，否则才执行完整的 Read ID 探测。
+        """
+        known = {dev['addr_int']: dev for dev in cached}
+        try:
+            with profiler.span('scan', 'scan_bus', bus=bus):
+                found = self.transport.scan_bus(bus)
+        except MdioError as e:
+            print(f"[ERR] Failed to scan bus {bus}: {e.stderr or e}")
+            return list(cached)
+        devices = []
+        for addr_int, phy_id in sorted(found):
+            if phy_id != 0:
+                devices.append(self.device_record(bus, addr_int, phy_id))
+                continue
+            dev = known.get(addr_int)
+            if dev is not None and dev['probed'] and \
+                    self.verify_device(bus, addr_int, dev['phy_id'], True) == dev['phy_id']:
+                devices.append(dev)
+                continue
+            phy_id = self.read_phy_id(bus, f"0x{addr_int:02x}")
+            if phy_id > 0:
+                devices.append(self.device_record(bus, addr_int, phy_id, True))
+        return devices
+
+    def read_phy_id(self, bus, addr_hex):
+        """使用所有configs中定义的Read ID方法来获取硬件ID（见 id_probe）"""
+        addr = int(addr_hex, 16)
+        probe = self.id_probe(bus, addr_hex)
+        values = None
+        with profiler.span('scan', 'read_phy_id', bus=bus, addr=addr) as sp:
+            reads = 0
+            try:
+                while True:
+                    config_name, ops = probe.send(values)
+                    reads += len(ops)
+                    try:
+                        values = self.transport.execute(bus, addr, ops)
+                    except MdioError as e:
+                        print(f"    [!] Failed to read ID registers for {config_name} on {bus} addr {addr_hex}")
+                        print(f"      STDERR: {e.stderr or e}")
+                        values = None
+            except StopIteration as stop:
+                sp.set(reads=reads, phy_id=f"0x{stop.value:08x}")
+                return stop.value
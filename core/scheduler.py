@@ -0,0 +1,318 @@
+"""
+每总线的寄存器访问调度器。
+
+MDIO 是共享的串行总线：同一总线上的访问必须依次进行，不同总线之间可以并行。
+ScheduledTransport 包装任意传输层，为每条总线维护一个工作线程和请求队列：
+  - 每个 execute() 调用（一个 PHY 的操作列表）作为一个整体执行，
+    分页 / 间接 MMD 访问序列不会被同一总线上的其他请求打断；
+  - 同一优先级内，共享总线的各个 PHY 轮流获得服务（round-robin）；
+  - 高优先级（复位、交互）的请求总是先于低优先级（后台监控）的请求执行；
+  - 同一 PHY 排队中的相邻请求合并为一次底层调用（除最后一个外只能包含写 / 延时，
+    这样出错时能够准确判断哪些请求已经完成）。
+"""
+import collections
+import contextlib
+import threading
+import time
+
+from core import profiler
+from core.transport import ACTION_POLL, ACTION_READ, MdioError, MdioTransport
+
+# 优先级，数值越小越优先
+PRIORITY_RESET = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_LEVELS = (PRIORITY_RESET, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND)
+
+# 合并后的一次底层调用最多包含的操作数
+MAX_BATCH_OPS = 256
+
+# 扫描等非寄存器操作使用的队列键
+_BUS_KEY = None
+
+# 等待请求完成时检查工作线程是否仍在运行的间隔（秒）
+WORKER_CHECK_INTERVAL = 1.0
+
+_context = threading.local()
+
+
+@contextlib.contextmanager
+def priority(level):
+    """在当前线程内临时改变提交请求的优先级，例如 `with priority(PRIORITY_RESET): ...`"""
+    previous = getattr(_context, 'priority', None)
+    _context.priority = level
+    try:
+        yield
+    finally:
+        _context.priority = previous
+
+
+def current_priority(default=PRIORITY_INTERACTIVE):
+    level = getattr(_context, 'priority', None)
+    return default if level is None else level
+
+
+def inherit_priority(fn):
+    """
+    优先级保存在线程局部变量中，线程池的工作线程不会继承。
+    在提交任务的线程中调用，返回以当前优先级执行 fn 的包装，例如 pool.map(inherit_priority(fn), items)
+    """
+    level = getattr(_context, 'priority', None)
+
+    def run(*args, **kwargs):
+        with priority(level):
+            return fn(*args, **kwargs)
+    return run
+
+
+class _Request:
+    __slots__ = ('addr', 'ops', 'call', 'submitted', 'done', 'result', 'error')
+
+    def __init__(self, addr, ops=None, call=None):
+        self.addr = addr
+        self.ops = ops
+        self.call = call
+        self.submitted = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    @property
+    def has_reads(self):
+        return any(op.action in (ACTION_READ, ACTION_POLL) for op in self.ops)
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.done.set()
+
+
+class BusStats:
+    """一条总线的调度统计"""
+
+    def __init__(self):
+        self.requests = 0        # 提交的请求数
+        self.calls = 0           # 实际的底层调用次数
+        self.ops = 0             # 执行的操作数
+        self.merged = 0          # 被合并进其他调用的请求数
+        self.max_depth = 0       # 观察到的最大排队深度
+        self.wait_time = 0.0     # 请求排队等待的总时间（秒）
+        self.busy_time = 0.0     # 总线忙碌的总时间（秒）
+
+    def as_dict(self, depth):
+        return {
+            "depth": depth,
+            "max_depth": self.max_depth,
+            "requests": self.requests,
+            "calls": self.calls,
+            "ops": self.ops,
+            "merged": self.merged,
+            "avg_wait_ms": round(self.wait_time * 1000.0 / self.requests, 3) if self.requests else 0.0,
+            "busy_ms": round(self.busy_time * 1000.0, 3),
+        }
+
+
+class _BusWorker:
+    """一条总线的请求队列及其工作线程"""
+
+    def __init__(self, transport, bus):
+        self.transport = transport
+        self.bus = bus
+        self.stats = BusStats()
+        self._cond = threading.Condition()
+        # 每个优先级: {addr: deque[_Request]}，OrderedDict 的顺序即 round-robin 顺序
+        self._levels = {level: collections.OrderedDict() for level in PRIORITY_LEVELS}
+        self._depth = {level: 0 for level in PRIORITY_LEVELS}
+        self._stopped = False
+        self._thread = threading.Thread(target=self._loop, name=f"mdio-bus-{bus}", daemon=True)
+        self._thread.start()
+
+    def submit(self, request, level):
+        with self._cond:
+            if self._stopped:
+                raise MdioError(f"Scheduler for bus {self.bus} is stopped")
+            self._levels[level].setdefault(request.addr, collections.deque()).append(request)
+            self._depth[level] += 1
+            self.stats.requests += 1
+            self.stats.max_depth = max(self.stats.max_depth, sum(self._depth.values()))
+            self._cond.notify()
+
+    def depth(self):
+        with self._cond:
+            return dict(self._depth)
+
+    def alive(self):
+        return self._thread.is_alive()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _take(self):
+        """取出下一批请求：最高优先级中轮到的 PHY，合并其队首的相邻请求"""
+        with self._cond:
+            while True:
+                for level in PRIORITY_LEVELS:
+                    queues = self._levels[level]
+                    if queues:
+                        break
+                else:
+                    if self._stopped:
+                        return None, None
+                    self._cond.wait()
+                    continue
+                addr, pending = queues.popitem(last=False)
+                batch = [pending.popleft()]
+                if batch[0].call is None:
+                    count = len(batch[0].ops)
+                    while (pending and pending[0].call is None and not batch[-1].has_reads
+                           and count + len(pending[0].ops) <= MAX_BATCH_OPS):
+                        count += len(pending[0].ops)
+                        batch.append(pending.popleft())
+                if pending:
+                    queues[addr] = pending   # 放到队尾，下一轮先服务其他 PHY
+                self._depth[level] -= len(batch)
+                return level, batch
+
+    def _requeue(self, level, requests):
+        """把未执行的请求放回该 PHY 队列的最前面"""
+        with self._cond:
+            pending = self._levels[level].setdefault(requests[0].addr, collections.deque())
+            pending.extendleft(reversed(requests))
+            self._levels[level].move_to_end(requests[0].addr, last=False)
+            self._depth[level] += len(requests)
+
+    def _loop(self):
+        batch = None
+        try:
+            while True:
+                level, batch = self._take()
+                if batch is None:
+                    return
+                start = time.monotonic()
+                for request in batch:
+                    self.stats.wait_time += start - request.submitted
+                    profiler.record('scheduler', 'queue_wait', start - request.submitted, bus=self.bus)
+                try:
+                    self._run(level, batch)
+                finally:
+                    self.stats.busy_time += time.monotonic() - start
+        except BaseException as e:
+            # 工作线程意外退出：当前批次与队列中的请求都以错误结束，调用方不会一直等待
+            self._abandon(batch or [], MdioError(f"Scheduler for bus {self.bus} stopped unexpectedly: {e!r}"))
+            raise
+
+    def _abandon(self, batch, error):
+        with self._cond:
+            self._stopped = True
+            pending = [request for level in PRIORITY_LEVELS
+                       for queue in self._levels[level].values() for request in queue]
+            for level in PRIORITY_LEVELS:
+                self._levels[level].clear()
+                self._depth[level] = 0
+        for request in list(batch) + pending:
+            if not request.done.is_set():
+                request.finish(error=error)
+
+    def _run(self, level, batch):
+        first = batch[0]
+        if first.call is not None:
+            self.stats.calls += 1
+            try:
+                first.finish(first.call())
+            except Exception as e:
+                first.finish(error=e)
+            return
+
+        ops = [op for request in batch for op in request.ops]
+        self.stats.calls += 1
+        self.stats.merged += len(batch) - 1
+        try:
+            values = self.transport.execute(self.bus, first.addr, ops)
+        except MdioError as e:
+            self._fail(level, batch, e)
+            return
+        except Exception as e:
+            for request in batch:
+                request.finish(error=e)
+            return
+        self.stats.ops += len(ops)
+        offset = 0
+        for request in batch:
+            request.finish(values[offset:offset + len(request.ops)])
+            offset += len(request.ops)
+
+    def _fail(self, level, batch, error):
+        if error.index is None or len(batch) == 1:
+            for request in batch:
+                request.finish(error=error)
+            return
+        # 出错位置之前的请求只包含写 / 延时，已经完成；之后的请求尚未执行，放回队列
+        offset = 0
+        for i, request in enumerate(batch):
+            if error.index < offset + len(request.ops):
+                error.index -= offset
+                request.finish(error=error)
+                self.stats.ops += error.index
+                if batch[i + 1:]:
+                    self._requeue(level, batch[i + 1:])
+                return
+            request.finish([None] * len(request.ops))
+            self.stats.ops += len(request.ops)
+            offset += len(request.ops)
+
+
+class ScheduledTransport(MdioTransport):
+    """在任意传输层之上按总线排队调度的传输层"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self._workers = {}
+        self._guard = threading.Lock()
+
+    def _worker(self, bus):
+        with self._guard:
+            worker = self._workers.get(bus)
+            if worker is None or not worker.alive():
+                worker = self._workers[bus] = _BusWorker(self.inner, bus)
+            return worker
+
+    def _submit(self, bus, request):
+        worker = self._worker(bus)
+        worker.submit(request, current_priority())
+        # 工作线程异常退出时会结束所有请求；这里再定期检查一次，避免在任何情况下无限期等待
+        while not request.done.wait(WORKER_CHECK_INTERVAL):
+            if not worker.alive() and not request.done.is_set():
+                raise MdioError(f"Scheduler for bus {bus} stopped unexpectedly")
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def describe(self, bus, addr, op):
+        return self.inner.describe(bus, addr, op)
+
+    def execute(self, bus, addr, ops):
+        if not ops:
+            return []
+        return self._submit(bus, _Request(addr, ops=list(ops)))
+
+    def list_buses(self):
+        return self.inner.list_buses()
+
+    def scan_bus(self, bus):
+        return self._submit(bus, _Request(_BUS_KEY, call=lambda: self.inner.scan_bus(bus)))
+
+    def stats(self):
+        """各总线的排队深度与吞吐统计：{bus: {...}}"""
+        with self._guard:
+            workers = dict(self._workers)
+        return {bus: worker.stats.as_dict(sum(worker.depth().values())) for bus, worker in sorted(workers.items())}
+
+    def close(self):
+        with self._guard:
+            workers = list(self._workers.values())
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
@@ -0,0 +1,214 @@
+from core.optimizer import coalesce_writes
+from core.transport import MODE_C22, MdioOp, parse_template, to_int
+
+
+class CompiledStep:
+    """序列中的一个步骤及其在批量程序中的位置"""
+    __slots__ = ('step', 'action', 'op_index', 'poll_index')
+
+    def __init__(self, step, action, op_index, poll_index=None):
+        self.step = step
+        self.action = action
+        self.op_index = op_index       # 步骤对应操作在 ops 中的序号
+        self.poll_index = poll_index   # 步骤之后完成检查 (check_inprogress) 的序号
+
+
+class SequenceProgram:
+    """一个完整序列编译后的批量程序，一次传输层调用即可执行完毕"""
+
+    def __init__(self):
+        self.ops = []
+        self.steps = []
+        self.errors = []   # 编译时被跳过的步骤说明
+        self.merged = 0    # 合并相邻写时被合并掉的步骤数（见 core/optimizer.py）
+        self.saved = 0     # 合并相邻写节省的总线访问次数
+
+    def __len__(self):
+        return len(self.ops)
+
+    def add(self, op):
+        self.ops.append(op)
+        return len(self.ops) - 1
+
+
+def resolve_default_template(config, templates):
+    """
+    返回配置的默认模板名称：优先使用 cmd_template，找不到时使用第一个模板。
+    返回 (模板名称, 是否找到指定模板)
+    """
+    cmd_template_name = config.get('cmd_template')
+    if cmd_template_name and cmd_template_name in templates:
+        return cmd_template_name, True
+    default = next(iter(templates)) if templates else None
+    return default, not cmd_template_name
+
+
+def find_template(templates, c22, preferred=None):
+    """
+    返回寻址方式符合的模板格式字符串：preferred 模板符合时优先使用，
+    否则取第一个 C22（c22 为 True）或 MMD 模板，没有时返回 None。
+    """
+    names = ([preferred] if preferred in templates else []) + list(templates)
+    for name in names:
+        fmt = templates[name].get('format', '')
+        if fmt and (parse_template(fmt).mode == MODE_C22) == c22:
+            return fmt
+    return None
+
+
+def read_id_sequence(config):
+    """
+    General_Ops 中 Read ID 选项的序列，没有时返回 None。
+    延迟加载的配置（见 core/config_cache.py）在索引中保存了这一序列，扫描时不必加载整个 test_modes。
+    """
+    if '_read_id' in config:
+        return config['_read_id']
+    for option in config.get('test_modes', {}).get('General_Ops', {}).get('options', []):
+        if option.get('name') == 'Read ID' and 'sequence' in option:
+            return option['sequence']
+    return None
+
+
+def iter_sequences(test_modes, path=()):
+    """
+    遍历 test_modes 树中的所有叶子节点，产出 (路径, sequence)。
+    路径由各级名称组成，例如 ('1000M_Test_Mode', '1000BASE-T Test Mode-1 (...)')
+    """
+    if isinstance(test_modes, dict):
+        if 'sequence' in test_modes:
+            yield path, test_modes['sequence']
+            return
+        for child_key in ('sub_modes', 'options'):
+            if child_key in test_modes:
+                yield from iter_sequences(test_modes[child_key], path)
+                return
+        for key, val in test_modes.items():
+            yield from iter_sequences(val, path + (key,))
+    elif isinstance(test_modes, list):
+        for item in test_modes:
+            yield from iter_sequences(item, path + (item.get('name', ''),))
+
+
+def sequence_path(path):
+    """iter_sequences 产出的路径元组对应的字符串形式，例如 'General_Ops/Read ID'"""
+    return '/'.join(path)
+
+
+def find_sequence(test_modes, path):
+    """按路径字符串查找序列，找不到时返回 None"""
+    for seq_path, sequence in iter_sequences(test_modes):
+        if sequence_path(seq_path) == path:
+            return sequence
+    return None
+
+
+def build_step_op(step, templates, default_tmpl_key):
+    """
+    将 JSON 中的一个步骤转换为 MdioOp。
+    返回 (action, op)；步骤无效时抛出 ValueError，消息与逐步执行时的报错一致。
+    """
+    action = step.get('action', 'WRITE').upper()  # 默认为写入操作
+    if action == 'DELAY':
+        return action, MdioOp.delay(to_int(step.get('ms', 0)))
+
+    # 优先使用步骤中定义的 template，否则使用默认模板
+    tmpl_key = step.get('template', default_tmpl_key)
+    if tmpl_key not in templates:
+        raise ValueError(f"Template '{tmpl_key}' not found in config.")
+    tmpl_fmt = templates[tmpl_key]['format']
+    reg = to_int(step.get('reg'))
+    dev_id = to_int(step.get('dev_id', 0))
+
+    if action == 'WRITE':
+        shift = to_int(step.get('shift', 0))
+        val = to_int(step.get('val', 0))
+        mask = to_int(step.get('mask', "0x0000"))
+        return action, MdioOp.write(tmpl_fmt, reg, (val << shift) & 0xFFFF, mask & 0xFFFF, dev_id)
+    if action == 'READ':
+        return action, MdioOp.read(tmpl_fmt, reg, dev_id)
+    raise ValueError(f"Unknown action type: {action}. Skipping step.")
+
+
+# check_inprogress 的应用策略（配置中的 "apply" 字段）
+CHECK_AUTO = 'auto'              # 标记了 "check_inprogress": true 的步骤之后 + 序列末尾
+CHECK_END = 'end'                # 仅在序列末尾检查一次
+CHECK_STEPS = 'steps'            # 仅在标记的步骤之后检查
+CHECK_EVERY_STEP = 'every_step'  # 每个步骤之后都检查（旧行为）
+CHECK_POLICIES = (CHECK_AUTO, CHECK_END, CHECK_STEPS, CHECK_EVERY_STEP)
+
+# 轮询退避参数默认值（毫秒）
+DEFAULT_POLL_INTERVAL = 1
+DEFAULT_POLL_MAX_INTERVAL = 100
+DEFAULT_POLL_TIMEOUT = 10000
+
+
+def build_check_op(check_config, templates, default_tmpl_key):
+    """根据 check_inprogress 配置构造轮询操作；配置缺失或无效时返回 None"""
+    if not check_config or not check_config.get('completed_value'):
+        return None
+    if check_config.get('apply', CHECK_AUTO) not in CHECK_POLICIES:
+        return None
+    tmpl_key = check_config.get('template', default_tmpl_key)
+    if tmpl_key not in templates:
+        return None
+    return MdioOp.poll(
+        templates[tmpl_key]['format'],
+        to_int(check_config.get('reg')),
+        to_int(check_config.get('completed_value')),
+        to_int(check_config.get('mask', '0x0000')),
+        to_int(check_config.get('dev_id', 0)),
+        interval=to_int(check_config.get('initial_interval_ms'), DEFAULT_POLL_INTERVAL),
+        max_interval=to_int(check_config.get('max_interval_ms'), DEFAULT_POLL_MAX_INTERVAL),
+        timeout=to_int(check_config.get('timeout_ms'), DEFAULT_POLL_TIMEOUT),
+    )
+
+
+def check_points(steps, check_config):
+    """
+    根据策略计算需要在哪些步骤之后做完成检查。
+    steps 为 [(step, action), ...]，返回步骤序号的集合。
+    READ / DELAY 步骤本身不会触发检查；序列末尾的检查只在序列中有写操作时进行。
+    """
+    if not check_config:
+        return set()
+    policy = check_config.get('apply', CHECK_AUTO)
+    if policy == CHECK_EVERY_STEP:
+        return {i for i, (_, action) in enumerate(steps) if action != 'DELAY'}
+
+    points = set()
+    if policy in (CHECK_AUTO, CHECK_STEPS):
+        points.update(i for i, (step, action) in enumerate(steps)
+                      if action == 'WRITE' and step.get('check_inprogress'))
+    if policy in (CHECK_AUTO, CHECK_END):
+        if any(action == 'WRITE' for _, action in steps):
+            points.add(len(steps) - 1)
+    return points
+
+
+def compile_sequence(sequence, templates, default_tmpl_key, check_config=None, attrs=None, coalesce=True):
+    """
+    将整个 sequence 编译为批量程序：
+    读、带掩码的写、延时按顺序排列，并按 check_inprogress 策略在相应步骤之后
+    插入完成检查轮询。coalesce 时再合并同一寄存器的相邻写（见 core/optimizer.py），
+    attrs 为配置的寄存器属性（RegisterAttrs），决定哪些写不能合并。
+    """
+    program = SequenceProgram()
+    check_op = build_check_op(check_config, templates, default_tmpl_key)
+
+    built = []
+    for step in sequence:
+        try:
+            action, op = build_step_op(step, templates, default_tmpl_key)
+        except ValueError as e:
+            program.errors.append(str(e))
+            continue
+        built.append((step, action, op))
+
+    points = check_points([(step, action) for step, action, _ in built], check_config) if check_op else set()
+    for i, (step, action, op) in enumerate(built):
+        op_index = program.add(op)
+        poll_index = program.add(check_op) if i in points else None
+        program.steps.append(CompiledStep(step, action, op_index, poll_index))
+    if coalesce:
+        coalesce_writes(program, attrs)
+    return program
@@ -0,0 +1,221 @@
+"""
+寄存器影子缓存（write-through）。
+
+按 (bus, addr, 寄存器空间, dev_id, reg) 记录寄存器的已知值，用于：
+  - 跳过不会改变寄存器内容的写操作（例如重复的页选择）；
+  - 直接回答标记为非易失（"volatile": false）寄存器的读操作。
+
+寄存器属性来自配置中的 "registers" 列表，例如：
+    "registers": [
+      { "reg": "0x1F", "self_clear": "0xC000", "reset": "0x8000", "comment": "SW reset / restart" },
+      { "dev_id": "0x1E", "reg": "0xC831", "volatile": true, "comment": "Processor busy" }
+    ]
+  - volatile: true   从不跳过写、从不缓存读（状态寄存器等）
+  - volatile: false  读操作可以直接由缓存回答
+  - 未指定           写操作可以跳过，读操作仍然访问总线
+  - self_clear       写入后会被硬件清零的位，这些位写入后视为未知，因此不会被跳过
+  - reset            写入这些位会复位 PHY，使该 PHY 的全部缓存失效
+完成检查的状态寄存器和监控中读后清零（"clear_on_read"）的计数器总是视为易失。
+"""
+import threading
+
+from core.transport import ACTION_DELAY, ACTION_POLL, ACTION_READ, ACTION_WRITE, MODE_C22, parse_template, to_int
+
+SPACE_C22 = 'c22'
+SPACE_MMD = 'mmd'
+
+FULL_MASK = 0xFFFF
+
+
+class RegisterAttr:
+    __slots__ = ('volatile', 'self_clear', 'reset')
+
+    def __init__(self, volatile=None, self_clear=0, reset=0):
+        self.volatile = volatile
+        self.self_clear = self_clear
+        self.reset = reset
+
+
+# IEEE 802.3 标准寄存器的默认属性：控制寄存器 bit 15 为自清零的复位位，
+# 状态寄存器（含锁存位）为易失，ID 寄存器为只读常量
+_DEFAULT_ATTRS = {
+    (SPACE_C22, 0x00): RegisterAttr(self_clear=0x8200, reset=0x8000),
+    (SPACE_C22, 0x01): RegisterAttr(volatile=True),
+    (SPACE_C22, 0x02): RegisterAttr(volatile=False),
+    (SPACE_C22, 0x03): RegisterAttr(volatile=False),
+    (SPACE_C22, 0x05): RegisterAttr(volatile=True),
+    (SPACE_C22, 0x06): RegisterAttr(volatile=True),
+    (SPACE_C22, 0x0A): RegisterAttr(volatile=True),
+    (SPACE_MMD, 0x00): RegisterAttr(self_clear=0x8000, reset=0x8000),
+    (SPACE_MMD, 0x01): RegisterAttr(volatile=True),
+    (SPACE_MMD, 0x02): RegisterAttr(volatile=False),
+    (SPACE_MMD, 0x03): RegisterAttr(volatile=False),
+}
+_PLAIN = RegisterAttr()
+_PLAIN_ATTRS = None
+
+
+def _plain_attrs():
+    """没有芯片配置时使用的属性表（只有 IEEE 标准寄存器的默认属性）"""
+    global _PLAIN_ATTRS
+    if _PLAIN_ATTRS is None:
+        _PLAIN_ATTRS = RegisterAttrs({}, {})
+    return _PLAIN_ATTRS
+
+
+def op_space(op):
+    """mmd 与 mmd-c22 访问的是同一个 Clause 45 寄存器空间"""
+    if op.mode == MODE_C22:
+        return SPACE_C22, 0
+    return SPACE_MMD, op.dev_id
+
+
+def _entry_space(entry, templates, default_fmt):
+    """配置条目（registers / check_inprogress）所在的寄存器空间"""
+    fmt = templates.get(entry.get('template'), {}).get('format', default_fmt)
+    if fmt and parse_template(fmt).mode == MODE_C22:
+        return SPACE_C22, 0
+    return SPACE_MMD, to_int(entry.get('dev_id', 0))
+
+
+class RegisterAttrs:
+    """一个芯片配置的寄存器属性表"""
+
+    def __init__(self, config, templates):
+        self._attrs = {}
+        default_fmt = templates.get(config.get('cmd_template'), {}).get('format', '')
+        for entry in config.get('registers', []):
+            space, dev_id = _entry_space(entry, templates, default_fmt)
+            volatile = entry.get('volatile')
+            self._attrs[(space, dev_id, to_int(entry.get('reg')))] = RegisterAttr(
+                None if volatile is None else bool(volatile),
+                to_int(entry.get('self_clear', 0)),
+                to_int(entry.get('reset', 0)),
+            )
+        # 完成检查的状态寄存器一定是易失的
+        check = config.get('check_inprogress')
+        if check and check.get('reg') is not None:
+            space, dev_id = _entry_space(check, templates, default_fmt)
+            self._attrs[(space, dev_id, to_int(check.get('reg')))] = RegisterAttr(volatile=True)
+        # 读后清零的计数器读一次就会丢失计数，同样是易失的（无效的监控条目由 MonitorLayout 报告）
+        for entry in config.get('monitor') or ():
+            if not isinstance(entry, dict) or not entry.get('clear_on_read'):
+                continue
+            try:
+                space, dev_id = _entry_space(entry, templates, default_fmt)
+                key = (space, dev_id, to_int(entry.get('reg')))
+            except (TypeError, ValueError):
+                continue
+            attr = self._attrs.get(key)
+            self._attrs[key] = RegisterAttr(True, attr.self_clear, attr.reset) if attr else RegisterAttr(volatile=True)
+
+    def get(self, space, dev_id, reg):
+        attr = self._attrs.get((space, dev_id, reg))
+        if attr is None:
+            attr = _DEFAULT_ATTRS.get((space, reg), _PLAIN)
+        return attr
+
+
+def repeatable(op, attrs):
+    """
+    op 再执行一次是否没有额外的副作用（出错后重试时判断）：写入复位 / 自清零位会再次触发复位，
+    读取易失寄存器会丢失锁存位或读后清零的计数；轮询只是读到条件满足为止，延时没有副作用
+    """
+    if op.action in (ACTION_DELAY, ACTION_POLL):
+        return True
+    space, dev_id = op_space(op)
+    attr = attrs.get(space, dev_id, op.reg)
+    if op.action == ACTION_READ:
+        return attr.volatile is not True
+    return not op.val & (attr.self_clear | attr.reset)
+
+
+class ShadowCache:
+    """
+    多个 PhyExecutor 可以共享同一个缓存实例（键中包含 bus 和 addr）。
+    每个条目为 [值, 已知位掩码]：带掩码的写只让被写入的位变为已知。
+    """
+
+    # plan() 中每个操作的处理方式
+    SEND = 0
+    CACHED = 1
+    SKIPPED = 2
+
+    def __init__(self):
+        self._regs = {}
+        self._lock = threading.Lock()
+        self.read_hits = 0
+        self.writes_skipped = 0
+
+    def invalidate(self, bus, addr=None):
+        """使某个 PHY（addr 为 None 时为整条总线）的缓存失效"""
+        with self._lock:
+            for key in [k for k in self._regs if k[0] == bus and (addr is None or k[1] == addr)]:
+                del self._regs[key]
+
+    def _invalidate_locked(self, bus, addr):
+        for key in [k for k in self._regs if k[0] == bus and k[1] == addr]:
+            del self._regs[key]
+
+    def plan(self, bus, addr, ops, attrs):
+        """
+        决定每个操作是否真正发送到总线，并按 write-through 语义预先更新缓存。
+        返回 [(处理方式, 缓存值), ...]，与 ops 一一对应。
+        """
+        decisions = []
+        with self._lock:
+            for op in ops:
+                if op.action in (ACTION_DELAY, ACTION_POLL):
+                    decisions.append((self.SEND, None))
+                    continue
+                space, dev_id = op_space(op)
+                key = (bus, addr, space, dev_id, op.reg)
+                attr = attrs.get(space, dev_id, op.reg)
+                entry = self._regs.get(key)
+
+                if op.action == ACTION_READ:
+                    if attr.volatile is False and entry is not None and entry[1] == FULL_MASK:
+                        self.read_hits += 1
+                        decisions.append((self.CACHED, entry[0]))
+                    else:
+                        decisions.append((self.SEND, None))
+                    continue
+
+                # 写操作: new = (old & mask) | val，需要已知的位是 val 中为 1 或 mask 中为 0 的位
+                care = (op.val | (~op.mask & FULL_MASK)) & FULL_MASK
+                if (attr.volatile is not True and entry is not None and not (care & attr.self_clear)
+                        and entry[1] & care == care and entry[0] & care == op.val & care):
+                    self.writes_skipped += 1
+                    decisions.append((self.SKIPPED, None))
+                    continue
+
+                decisions.append((self.SEND, None))
+                if op.val & attr.reset:
+                    self._invalidate_locked(bus, addr)
+                    continue
+                old_val, old_known = entry if entry is not None else (0, 0)
+                known = (old_known | care) & ~attr.self_clear & FULL_MASK
+                self._regs[key] = [((old_val & op.mask) | op.val) & known, known]
+        return decisions
+
+    def record_reads(self, bus, addr, ops, values, attrs=None):
+        """
+        记录实际从总线读到的值。plan() 已经按顺序预先更新了批次中的写，
+        因此读之后同一批次中又被写入的寄存器、以及读之后有复位写时该 PHY 的所有寄存器，
+        读到的都是旧值，不再记录
+        """
+        attrs = attrs or _plain_attrs()
+        with self._lock:
+            written = set()
+            reset_after = False
+            for op, value in reversed(list(zip(ops, values))):
+                if op.action not in (ACTION_READ, ACTION_WRITE):
+                    continue
+                space, dev_id = op_space(op)
+                key = (bus, addr, space, dev_id, op.reg)
+                if op.action == ACTION_WRITE:
+                    written.add(key)
+                    if op.val & attrs.get(space, dev_id, op.reg).reset:
+                        reset_after = True
+                elif value is not None and not reset_after and key not in written:
+                    self._regs[key] = [value, FULL_MASK]
\ No newline at end of file
@@ -0,0 +1,170 @@
+import threading
+import time
+
+from core.sequence import read_id_sequence
+from core.transport import MODE_C22, MdioError, parse_template, to_int
+
+# mdio 工具扫描一条总线时探测的地址数（每个地址读取 ID1 / ID2 两个寄存器）
+SCAN_ADDRS = 32
+
+
+class SimulatedMdio:
+    """
+    仿真寄存器后端，用于在没有硬件的 Linux 机器上运行 Broker / 扫描 / 序列执行。
+    拓扑格式: {bus: {addr: phy_id}}；c45_only 中列出的 (bus, addr) 不在 C22 空间响应 ID，
+    只能通过 MMD 0x1E 读到，以模拟扫描时 ID 为 0 的 MMD-only PHY。
+    latency 为每次寄存器访问的耗时（秒），同一总线上的访问串行，不同总线之间可以并行，
+    用于在没有硬件时评估传输层和调度的性能。
+    """
+
+    # MMD 空间中存放 PHY ID 的设备号
+    ID_MMD_DEV = 0x1E
+
+    def __init__(self, topology=None, c45_only=(), latency=0.0):
+        self._lock = threading.Lock()
+        self._regs = {}
+        self._present = {}
+        self._bus_locks = {}
+        self.c45_only = set(c45_only)
+        self.latency = latency
+        for bus, devices in (topology or {}).items():
+            for addr, phy_id in devices.items():
+                self.add_device(bus, addr, phy_id)
+
+    def add_device(self, bus, addr, phy_id, id_regs=()):
+        """
+        添加一个 PHY。id_regs 为额外存放 ID1 / ID2 的寄存器 [(mode, dev_id, reg), (mode, dev_id, reg)]，
+        例如配置中 Read ID 序列读取的寄存器
+        """
+        self._present.setdefault(bus, set()).add(addr)
+        self._bus_locks.setdefault(bus, threading.Lock())
+        id1, id2 = (phy_id >> 16) & 0xFFFF, phy_id & 0xFFFF
+        if (bus, addr) not in self.c45_only:
+            self._regs[(bus, addr, 'c22', 0, 0x02)] = id1
+            self._regs[(bus, addr, 'c22', 0, 0x03)] = id2
+        self._regs[(bus, addr, 'mmd', self.ID_MMD_DEV, 0x02)] = id1
+        self._regs[(bus, addr, 'mmd', self.ID_MMD_DEV, 0x03)] = id2
+        for (mode, dev_id, reg), value in zip(id_regs, (id1, id2)):
+            self.set_register(bus, addr, mode, dev_id, reg, value)
+
+    def set_register(self, bus, addr, mode, dev_id, reg, value):
+        with self._lock:
+            self._regs[self._key(bus, addr, mode, dev_id, reg)] = value & 0xFFFF
+
+    @classmethod
+    def from_configs(cls, configs, common_config, buses=1, per_bus=None, latency=0.0, prefix="emu-"):
+        """
+        根据各配置的 identity 生成仿真拓扑：每个有具体 ID 的配置对应一个 PHY，依次分布到
+        buses 条总线上；per_bus 指定每条总线的 PHY 数时循环使用各配置填满。
+        Read ID 只通过 MMD 读取的配置被建模为 MMD-only PHY，ID 放在其 Read ID 读取的寄存器中；
+        check_inprogress 寄存器预置为完成状态。
+        返回 (仿真后端, [(bus, addr, config), ...])
+        """
+        templates = common_config.get('cmd_templates', {})
+        models = []
+        for cfg in configs:
+            ident = cfg.get('identity', {})
+            if not to_int(ident.get('phy_id_mask')) or ident.get('fallback'):
+                continue
+            models.append(cfg)
+        if not models:
+            return cls(latency=latency), []
+
+        count = per_bus * buses if per_bus else len(models)
+        sim = cls(latency=latency)
+        placements = []
+        for i in range(count):
+            cfg = models[i % len(models)]
+            bus = f"{prefix}{i % buses}"
+            addr = i // buses + 1
+            id_regs = _read_id_registers(cfg, templates)
+            if id_regs and all(mode != MODE_C22 for mode, _, _ in id_regs):
+                sim.c45_only.add((bus, addr))
+            sim.add_device(bus, addr, to_int(cfg['identity']['phy_id']), id_regs)
+
+            check = cfg.get('check_inprogress')
+            fmt = templates.get(check.get('template', cfg.get('cmd_template')), {}).get('format') if check else None
+            if fmt and parse_template(fmt).mode is not None:
+                sim.set_register(bus, addr, parse_template(fmt).mode, to_int(check.get('dev_id', 0)),
+                                 to_int(check.get('reg')),
+                                 to_int(check.get('completed_value')) & to_int(check.get('mask', 0xFFFF)))
+            placements.append((bus, addr, cfg))
+        return sim, placements
+
+    def _access(self, bus, accesses=1):
+        """模拟总线访问耗时：持有总线锁休眠，同一总线上的访问因此串行"""
+        if self.latency and bus in self._bus_locks:
+            with self._bus_locks[bus]:
+                time.sleep(self.latency * accesses)
+
+    def _key(self, bus, addr, mode, dev_id, reg):
+        if addr not in self._present.get(bus, ()):
+            raise MdioError(f"No device at {bus}:{addr}")
+        # mmd 与 mmd-c22 访问的是同一个 Clause 45 寄存器空间
+        if mode == MODE_C22:
+            return (bus, addr, 'c22', 0, reg)
+        return (bus, addr, 'mmd', dev_id, reg)
+
+    def read(self, bus, addr, mode, dev_id, reg):
+        self._access(bus)
+        with self._lock:
+            return self._regs.get(self._key(bus, addr, mode, dev_id, reg), 0)
+
+    def write(self, bus, addr, mode, dev_id, reg, val, mask=0):
+        # 带掩码的写在总线上是一次读加一次写
+        self._access(bus, 2 if mask else 1)
+        with self._lock:
+            key = self._key(bus, addr, mode, dev_id, reg)
+            self._regs[key] = ((self._regs.get(key, 0) & mask) | val) & 0xFFFF
+
+    def list_buses(self):
+        if not self._present:
+            raise MdioError("No MDIO buses in simulated topology")
+        return sorted(self._present)
+
+    def scan_bus(self, bus):
+        if bus not in self._present:
+            raise MdioError(f"Unknown bus '{bus}'")
+        self._access(bus, SCAN_ADDRS * 2)
+        found = []
+        for addr in sorted(self._present[bus]):
+            phy_id = (self._regs.get((bus, addr, 'c22', 0, 0x02), 0) << 16) | \
+                self._regs.get((bus, addr, 'c22', 0, 0x03), 0)
+            found.append((addr, phy_id))
+        return found
+
+
+def _read_id_registers(cfg, templates):
+    """配置中 General_Ops/Read ID 序列读取的寄存器 [(mode, dev_id, reg), ...]"""
+    sequence = read_id_sequence(cfg) or []
+    regs = []
+    for step in sequence:
+        if step.get('action', 'WRITE').upper() != 'READ':
+            continue
+        tmpl = templates.get(step.get('template', cfg.get('cmd_template')))
+        mode = parse_template(tmpl['format']).mode if tmpl else None
+        if mode is None:
+            return []
+        regs.append((mode, to_int(step.get('dev_id', 0)), to_int(step.get('reg'))))
+    return regs[:2]
+
+
+def parse_topology(spec):
+    """
+    解析命令行仿真拓扑，例如:
+    "fixed-0:1=0x002b0980,2=0x31c31c13*;fixed-1:0=0x2000a230"
+    地址后的 * 表示该 PHY 只响应 MMD 访问（C22 扫描 ID 为 0）
+    """
+    topology = {}
+    c45_only = []
+    for bus_spec in filter(None, spec.split(';')):
+        bus, _, devs = bus_spec.partition(':')
+        topology[bus] = {}
+        for dev in filter(None, devs.split(',')):
+            addr_raw, _, id_raw = dev.partition('=')
+            addr = int(addr_raw, 0)
+            if id_raw.endswith('*'):
+                id_raw = id_raw[:-1]
+                c45_only.append((bus, addr))
+            topology[bus][addr] = int(id_raw, 0)
+    return topology, c45_only
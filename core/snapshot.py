@@ -0,0 +1,425 @@
+"""
+寄存器快照与差异比较。
+
+一次快照读取 PHY 的整个寄存器空间：C22 0x00–0x1F，以及芯片配置中 "snapshot" 指定的 MMD 范围：
+
+    "snapshot": {
+      "c22": false,
+      "mmd": [
+        { "dev_id": "0x01", "start": "0x0000", "end": "0x001F" },
+        { "dev_id": "0x1E", "start": "0xC830", "end": "0xC83F", "template": "marvell_mmd" }
+      ]
+    }
+
+  - c22 默认为 true；只支持 Clause 45 的芯片应设为 false。
+  - MMD 范围的 end 包含在内；template 缺省时使用配置的 cmd_template（须为 MMD 寻址），
+    否则使用 common.json 中第一个 MMD 模板。
+
+每个 PHY 的所有读操作组成一个批量程序一次执行（一个子进程脚本 / 一次 Broker 请求），
+不同总线上的 PHY 并发读取。快照文件为紧凑的二进制格式：
+
+    MAGIC | HEADER (JSON 头长度, 寄存器值个数) | JSON 头 | 填充到 8 字节对齐 | uint16 小端寄存器值
+
+JSON 头记录每个设备的区段表（寄存器空间, dev_id, 起始寄存器, 个数）及其值在数组中的起始位置，
+加载时直接把文件 mmap 为 16 位数组，不需要逐个解析寄存器。
+
+    python3 main.py --snapshot before.physnap
+    python3 -m core.snapshot show before.physnap
+    python3 -m core.snapshot diff before.physnap after.physnap [--ignore-volatile] [--json]
+"""
+import argparse
+import json
+import mmap
+import struct
+import sys
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from core import profiler
+from core.scanner import DEFAULT_WORKERS
+from core.scheduler import inherit_priority
+from core.sequence import find_template
+from core.shadow import SPACE_C22, SPACE_MMD, RegisterAttrs
+from core.transport import MdioError, MdioOp, to_int
+
+MAGIC = b'PHYSNAP\x01'
+HEADER = struct.Struct('<II')
+
+# C22 寄存器范围（含）
+C22_RANGE = (0x00, 0x1F)
+
+# 单个 MMD 范围最多的寄存器个数，防止配置笔误读取整个 64K 空间
+MAX_RANGE = 0x400
+
+
+def _align(n, size=8):
+    return (n + size - 1) // size * size
+
+
+class SnapshotLayout:
+    """
+    一个芯片配置的快照区段表及对应的批量读操作。
+    regions 为 [(寄存器空间, dev_id, 起始寄存器, 个数), ...]，ops 与各区段的寄存器依次对应。
+    """
+
+    def __init__(self, config, templates):
+        self.regions = []
+        self.ops = []
+        self.problems = []
+        block = config.get('snapshot', {})
+
+        if block.get('c22', True):
+            fmt = find_template(templates, c22=True)
+            if fmt is None:
+                self.problems.append("no Clause 22 template in common config")
+            else:
+                self._add(SPACE_C22, 0, C22_RANGE[0], C22_RANGE[1], fmt)
+
+        default_tmpl = config.get('cmd_template')
+        for entry in block.get('mmd', []):
+            try:
+                dev_id = to_int(entry.get('dev_id'))
+                start = to_int(entry.get('start'))
+                end = to_int(entry.get('end', entry.get('start')))
+            except ValueError as e:
+                self.problems.append(f"invalid MMD range {entry}: {e}")
+                continue
+            if not 0 <= start <= end <= 0xFFFF or end - start + 1 > MAX_RANGE:
+                self.problems.append(f"invalid MMD range 0x{dev_id:02x}:0x{start:04x}-0x{end:04x}")
+                continue
+            fmt = find_template(templates, c22=False, preferred=entry.get('template', default_tmpl))
+            if fmt is None:
+                self.problems.append("no MMD template in common config")
+                continue
+            self._add(SPACE_MMD, dev_id, start, end, fmt)
+
+        self.count = len(self.ops)
+        self._attrs = RegisterAttrs(config, templates)
+
+    def _add(self, space, dev_id, start, end, fmt):
+        self.regions.append((space, dev_id, start, end - start + 1))
+        self.ops.extend(MdioOp.read(fmt, reg, dev_id) for reg in range(start, end + 1))
+
+    def volatile(self):
+        """区段中标记为易失的寄存器 [(寄存器空间, dev_id, reg), ...]"""
+        return [[space, dev_id, reg]
+                for space, dev_id, start, count in self.regions
+                for reg in range(start, start + count)
+                if self._attrs.get(space, dev_id, reg).volatile]
+
+
+class Snapshot:
+    """
+    一组 PHY 的寄存器快照。
+    devices 为设备描述（bus, addr, phy_id, chip, config, offset, regions, volatile, error），
+    values 为全部寄存器值组成的 16 位数组（array('H') 或 mmap 上的 memoryview）。
+    """
+
+    def __init__(self, devices, values, meta=None):
+        self.devices = devices
+        self.values = values
+        self.meta = meta or {}
+        self._mmap = None
+        self._index = None
+
+    def device(self, bus, addr):
+        if self._index is None:
+            self._index = {(d['bus'], d['addr']): d for d in self.devices}
+        return self._index.get((bus, addr))
+
+    def device_values(self, dev):
+        """设备的全部寄存器值（按区段顺序）"""
+        count = sum(r[3] for r in dev['regions'])
+        return self.values[dev['offset']:dev['offset'] + count]
+
+    def registers(self, dev):
+        """依次产生 (寄存器空间, dev_id, reg, 值)"""
+        i = dev['offset']
+        for space, dev_id, start, count in dev['regions']:
+            for reg in range(start, start + count):
+                yield space, dev_id, reg, self.values[i]
+                i += 1
+
+    def save(self, path):
+        header = json.dumps({"meta": self.meta, "devices": self.devices}, separators=(',', ':')).encode()
+        values = array('H', self.values)
+        if sys.byteorder != 'little':
+            values.byteswap()
+        prefix = MAGIC + HEADER.pack(len(header), len(values)) + header
+        with open(path, 'wb') as fp:
+            fp.write(prefix + b'\0' * (_align(len(prefix)) - len(prefix)))
+            values.tofile(fp)
+
+    @classmethod
+    def load(cls, path, use_mmap=True):
+        """加载快照；use_mmap 时寄存器值直接映射自文件，不复制"""
+        with open(path, 'rb') as fp:
+            prefix = fp.read(len(MAGIC) + HEADER.size)
+            if prefix[:len(MAGIC)] != MAGIC or len(prefix) < len(MAGIC) + HEADER.size:
+                raise ValueError(f"'{path}' is not a register snapshot")
+            header_len, count = HEADER.unpack_from(prefix, len(MAGIC))
+            header = json.loads(fp.read(header_len))
+            data_offset = _align(len(prefix) + header_len)
+
+            if use_mmap and sys.byteorder == 'little' and count:
+                mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+                if len(mapped) < data_offset + count * 2:
+                    mapped.close()
+                    raise ValueError(f"Truncated snapshot '{path}'")
+                values = memoryview(mapped)[data_offset:data_offset + count * 2].cast('H')
+            else:
+                mapped = None
+                fp.seek(data_offset)
+                values = array('H')
+                try:
+                    values.fromfile(fp, count)
+                except EOFError:
+                    raise ValueError(f"Truncated snapshot '{path}'")
+                if sys.byteorder != 'little':
+                    values.byteswap()
+
+        snapshot = cls(header['devices'], values, header.get('meta'))
+        snapshot._mmap = mapped
+        return snapshot
+
+    def close(self):
+        if self._mmap is not None:
+            self.values.release()
+            self._mmap.close()
+            self._mmap = None
+
+
+class SnapshotTaker:
+    """读取 PHY 的寄存器快照；每个配置的区段表只构建一次"""
+
+    def __init__(self, common_config, transport, identity_index, workers=DEFAULT_WORKERS):
+        self.templates = common_config.get('cmd_templates', {})
+        self.transport = transport
+        self.identity_index = identity_index
+        self.workers = workers
+        self._layouts = {}
+        self._lock = threading.Lock()
+
+    def layout(self, cfg):
+        """配置为 None（没有匹配的配置）时只读取 C22 寄存器"""
+        # 以 id(cfg) 为键并保存 cfg 本身：配置对象不会被释放，其 id 也就不会被另一个配置复用
+        key = id(cfg)
+        with self._lock:
+            _, layout = self._layouts.get(key, (None, None))
+            if layout is None:
+                layout = SnapshotLayout(cfg or {}, self.templates)
+                self._layouts[key] = (cfg, layout)
+                for problem in layout.problems:
+                    name = cfg.get('config_name', '') if cfg else 'default'
+                    print(f"[WARN] Snapshot layout of {name}: {problem}")
+        return layout
+
+    def read_device(self, bus, addr, cfg):
+        """读取一个 PHY 的全部快照寄存器，返回 (layout, 值列表)；失败时抛出 MdioError"""
+        layout = self.layout(cfg)
+        with profiler.span('snapshot', 'device', bus=bus, addr=addr, registers=layout.count):
+            values = self.transport.execute(bus, addr, layout.ops) if layout.ops else []
+        return layout, values
+
+    def capture_device(self, hw, cfg):
+        """返回 (设备描述, 值列表)；读取失败的设备没有寄存器值，error 中记录原因"""
+        dev = {
+            "bus": hw['bus'],
+            "addr": hw['addr_int'],
+            "phy_id": f"0x{hw['phy_id']:08x}",
+            "chip": cfg['identity'].get('chip_name', '') if cfg else '',
+            "config": cfg.get('config_name', '') if cfg else '',
+            "offset": 0,
+            "regions": [],
+            "volatile": [],
+            "error": None,
+        }
+        try:
+            layout, values = self.read_device(hw['bus'], hw['addr_int'], cfg)
+        except MdioError as e:
+            dev['error'] = str(e)
+            return dev, []
+        dev['regions'] = [list(r) for r in layout.regions]
+        dev['volatile'] = layout.volatile()
+        return dev, values
+
+    def _capture_bus(self, targets):
+        return [self.capture_device(hw, cfg) for hw, cfg in targets]
+
+    def capture(self, devices, label=None):
+        """对 devices（PhyScanner.discover 的结果）拍摄快照，同一总线上的设备依次读取，不同总线并发"""
+        start = time.monotonic()
+        by_bus = {}
+        for hw in devices:
+            by_bus.setdefault(hw['bus'], []).append((hw, self.identity_index.resolve(hw['phy_id'])))
+        groups = list(by_bus.values())
+
+        workers = max(1, min(self.workers, len(groups) or 1))
+        if workers == 1:
+            per_bus = [self._capture_bus(targets) for targets in groups]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mdio-snap") as pool:
+                per_bus = list(pool.map(inherit_priority(self._capture_bus), groups))
+
+        records = []
+        values = array('H')
+        for dev, dev_values in (item for items in per_bus for item in items):
+            dev['offset'] = len(values)
+            values.extend(dev_values)
+            records.append(dev)
+        meta = {
+            "label": label or "",
+            "taken": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "elapsed_ms": round((time.monotonic() - start) * 1000.0, 3),
+        }
+        return Snapshot(records, values, meta)
+
+
+def _change(dev, space, dev_id, reg, old, new, volatile):
+    return {"bus": dev['bus'], "addr": dev['addr'], "space": space, "dev_id": dev_id, "reg": reg,
+            "old": old, "new": new, "volatile": volatile}
+
+
+def diff_device(a, dev_a, b, dev_b):
+    """
+    比较同一 PHY 在两个快照中的寄存器，返回变化列表。
+    区段表相同时逐区段比较数组切片（在 C 层完成），只对不相等的区段逐个寄存器查找差异；
+    区段表不同时只比较两者都有的寄存器。
+    """
+    volatile = {tuple(v) for v in dev_a['volatile']} | {tuple(v) for v in dev_b['volatile']}
+    changes = []
+    if dev_a['regions'] == dev_b['regions']:
+        i = dev_a['offset']
+        j = dev_b['offset']
+        for space, dev_id, start, count in dev_a['regions']:
+            old = a.values[i:i + count]
+            new = b.values[j:j + count]
+            if old != new:
+                for k in range(count):
+                    if old[k] != new[k]:
+                        key = (space, dev_id, start + k)
+                        changes.append(_change(dev_a, *key, old[k], new[k], key in volatile))
+            i += count
+            j += count
+        return changes
+
+    old_regs = {(space, dev_id, reg): value for space, dev_id, reg, value in a.registers(dev_a)}
+    for space, dev_id, reg, value in b.registers(dev_b):
+        key = (space, dev_id, reg)
+        if key in old_regs and old_regs[key] != value:
+            changes.append(_change(dev_a, *key, old_regs[key], value, key in volatile))
+    return changes
+
+
+def diff_captures(before, after):
+    """比较同一 PHY 的两次 capture_device 结果（例如执行测试模式前后），返回变化列表"""
+    (dev_a, values_a), (dev_b, values_b) = before, after
+    return diff_device(Snapshot([dev_a], values_a), dev_a, Snapshot([dev_b], values_b), dev_b)
+
+
+def diff(a, b, ignore_volatile=False):
+    """
+    比较两个快照，返回 {"changes": [...], "added": [...], "removed": [...], "errors": [...]}。
+    设备按 (bus, addr) 对应；任一快照中读取失败的设备记入 errors。
+    """
+    result = {"changes": [], "added": [], "removed": [], "errors": []}
+    for dev_a in a.devices:
+        dev_b = b.device(dev_a['bus'], dev_a['addr'])
+        if dev_b is None:
+            result['removed'].append({"bus": dev_a['bus'], "addr": dev_a['addr'], "phy_id": dev_a['phy_id']})
+            continue
+        if dev_a['error'] or dev_b['error']:
+            result['errors'].append({"bus": dev_a['bus'], "addr": dev_a['addr'],
+                                     "error": dev_a['error'] or dev_b['error']})
+            continue
+        changes = diff_device(a, dev_a, b, dev_b)
+        if ignore_volatile:
+            changes = [c for c in changes if not c['volatile']]
+        result['changes'].extend(changes)
+    for dev_b in b.devices:
+        if a.device(dev_b['bus'], dev_b['addr']) is None:
+            result['added'].append({"bus": dev_b['bus'], "addr": dev_b['addr'], "phy_id": dev_b['phy_id']})
+    return result
+
+
+def format_register(space, dev_id, reg):
+    if space == SPACE_C22:
+        return f"c22 0x{reg:02x}"
+    return f"mmd 0x{dev_id:02x}:0x{reg:04x}"
+
+
+def format_diff(result):
+    lines = []
+    for c in result['changes']:
+        note = "  (volatile)" if c['volatile'] else ""
+        lines.append(f"  {c['bus']} 0x{c['addr']:02x} {format_register(c['space'], c['dev_id'], c['reg']):<18} "
+                     f"0x{c['old']:04x} -> 0x{c['new']:04x}{note}")
+    for key, word in (('added', 'only in second snapshot'), ('removed', 'only in first snapshot')):
+        for d in result[key]:
+            lines.append(f"  {d['bus']} 0x{d['addr']:02x} {d['phy_id']} {word}")
+    for d in result['errors']:
+        lines.append(f"  [WARN] {d['bus']} 0x{d['addr']:02x} not compared: {d['error']}")
+    return lines
+
+
+def cmd_show(args):
+    snapshot = Snapshot.load(args.snapshot)
+    try:
+        meta = snapshot.meta
+        print(f"[*] Snapshot '{meta.get('label', '')}' taken {meta.get('taken', '?')}: "
+              f"{len(snapshot.devices)} device(s), {len(snapshot.values)} registers")
+        for dev in snapshot.devices:
+            print(f"\n  {dev['bus']} 0x{dev['addr']:02x} {dev['phy_id']} {dev['chip']}")
+            if dev['error']:
+                print(f"    [ERR] {dev['error']}")
+            if args.summary:
+                continue
+            for space, dev_id, reg, value in snapshot.registers(dev):
+                print(f"    {format_register(space, dev_id, reg):<18} 0x{value:04x}")
+    finally:
+        snapshot.close()
+    return 0
+
+
+def cmd_diff(args):
+    a = Snapshot.load(args.first)
+    b = Snapshot.load(args.second)
+    try:
+        result = diff(a, b, args.ignore_volatile)
+    finally:
+        a.close()
+        b.close()
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"[*] {len(result['changes'])} register(s) changed")
+        for line in format_diff(result):
+            print(line)
+    return 1 if result['changes'] or result['added'] or result['removed'] else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show or compare PHY register snapshots")
+    sub = parser.add_subparsers(dest='command', required=True)
+    show = sub.add_parser('show', help="Print the registers of a snapshot")
+    show.add_argument('snapshot')
+    show.add_argument('--summary', action='store_true', help="Only list the devices")
+    show.set_defaults(func=cmd_show)
+    compare = sub.add_parser('diff', help="Compare two snapshots (exit code 1 when they differ)")
+    compare.add_argument('first')
+    compare.add_argument('second')
+    compare.add_argument('--ignore-volatile', action='store_true', help="Skip registers marked volatile")
+    compare.add_argument('--json', action='store_true', help="Print the differences as JSON")
+    compare.set_defaults(func=cmd_diff)
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    except (OSError, ValueError) as e:
+        print(f"[ERR] {e}")
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+总线拓扑缓存。
+
+完整扫描（尤其是扫描 ID 为 0 时逐个配置尝试的 Read ID 探测）在每次启动时都要重新做一遍。
+扫描结果（总线、地址、PHY ID、匹配的配置、ID 是否由探测得到）保存在 configs/.cache/topology.json 中，
+之后启动时：
+  - 缓存中的总线仍然扫描一次（一次 mdio 扫描，不同总线并发），新接入的设备照常被发现；
+    只有扫描时 ID 为 0 的地址（需要 Read ID 探测的 PHY）在缓存中的 ID 仍然匹配时跳过探测；
+  - 缓存中没有的总线做完整扫描。
+只有 --fast-start 完全信任缓存、不访问总线；--rescan 完整扫描并重建缓存。
+
+缓存与访问方式绑定（sudo mdio / Broker socket / 仿真拓扑），访问方式变化时缓存失效。
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core import profiler
+from core.scanner import DEFAULT_WORKERS
+from core.scheduler import inherit_priority
+
+TOPOLOGY_VERSION = 1
+TOPOLOGY_FILE_NAME = "topology.json"
+
+
+class TopologyCache:
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self.buses = None   # {bus: [设备, ...]}，load() 后有效
+
+    def load(self):
+        """加载缓存；文件不存在、损坏或访问方式不同时返回 False"""
+        try:
+            with open(self.path, 'r') as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            return False
+        if data.get('version') != TOPOLOGY_VERSION or data.get('key') != self.key:
+            return False
+        try:
+            self.buses = {
+                bus: [{"bus": bus, "addr_hex": f"0x{int(d['addr']):02x}", "addr_int": int(d['addr']),
+                       "phy_id": int(d['phy_id'], 16), "probed": bool(d.get('probed'))} for d in devices]
+                for bus, devices in data['buses'].items()
+            }
+        except (KeyError, TypeError, ValueError):
+            self.buses = None
+            return False
+        return True
+
+    def save(self, devices, identity_index, buses):
+        """保存 devices（PhyScanner.discover 的结果）；buses 为扫描过的全部总线（包括没有设备的）"""
+        by_bus = {bus: [] for bus in buses}
+        for dev in devices:
+            cfg = identity_index.resolve(dev['phy_id'])
+            by_bus.setdefault(dev['bus'], []).append({
+                "addr": dev['addr_int'],
+                "phy_id": f"0x{dev['phy_id']:08x}",
+                "probed": dev.get('probed', False),
+                "config": cfg.get('config_name', '') if cfg else '',
+            })
+        data = {"version": TOPOLOGY_VERSION, "key": self.key, "saved": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "buses": by_bus}
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w') as fp:
+            json.dump(data, fp, indent=1)
+        os.replace(tmp, self.path)
+        self.buses = {bus: [d for d in devices if d['bus'] == bus] for bus in by_bus}
+
+
+def discover_cached(scanner, cache, buses, workers=DEFAULT_WORKERS):
+    """
+    使用拓扑缓存发现设备：缓存中的总线增量扫描（PhyScanner.rescan_bus），其余总线完整扫描。
+    返回 (设备列表, 统计 {"verified", "changed", "scanned_buses"})
+    """
+    cached = cache.buses or {}
+    stats = {"verified": 0, "changed": 0, "scanned_buses": 0}
+
+    def visit(bus):
+        if bus not in cached:
+            return scanner.scan_devices(bus), 0, 0, 1
+        before = {dev['addr_int']: dev['phy_id'] for dev in cached[bus]}
+        devices = scanner.rescan_bus(bus, cached[bus])
+        after = {dev['addr_int']: dev['phy_id'] for dev in devices}
+        for addr in sorted(set(before) | set(after)):
+            old, new = before.get(addr), after.get(addr)
+            if old == new:
+                continue
+            if old is None:
+                print(f"    [*] {bus} 0x{addr:02x}: new PHY 0x{new:08x}")
+            elif new is None:
+                print(f"    [*] {bus} 0x{addr:02x}: PHY 0x{old:08x} no longer responds")
+            else:
+                print(f"    [*] {bus} 0x{addr:02x}: PHY ID changed 0x{old:08x} -> 0x{new:08x}")
+        verified = sum(1 for addr, phy_id in after.items() if before.get(addr) == phy_id)
+        return devices, verified, len(set(before) | set(after)) - verified, 0
+
+    workers = max(1, min(workers, len(buses) or 1))
+    with profiler.span('scan', 'discover_cached', buses=len(buses), workers=workers):
+        if workers == 1:
+            per_bus = [visit(bus) for bus in buses]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mdio-scan") as pool:
+                per_bus = list(pool.map(inherit_priority(visit), buses))
+
+    devices = []
+    for devs, verified, changed, scanned in per_bus:
+        devices.extend(sorted(devs, key=lambda d: d['addr_int']))
+        stats['verified'] += verified
+        stats['changed'] += changed
+        stats['scanned_buses'] += scanned
+    return devices, stats
@@ -0,0 +1,619 @@
+import functools
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import threading
+import time
+
+from core import profiler
+
+# 寻址模式，对应 mdio 工具命令中 {bus} 之后的关键字
+MODE_C22 = 0       # mdio BUS phy ADDR raw REG
+MODE_MMD = 1       # mdio BUS mmd ADDR:DEV raw REG
+MODE_MMD_C22 = 2   # mdio BUS mmd-c22 ADDR:DEV raw REG
+
+MODE_KEYWORDS = {
+    'phy': MODE_C22,
+    'mmd': MODE_MMD,
+    'mmd-c22': MODE_MMD_C22,
+}
+MODE_NAMES = {v: k for k, v in MODE_KEYWORDS.items()}
+
+ACTION_READ = 0
+ACTION_WRITE = 1
+ACTION_DELAY = 2   # interval 毫秒的延时
+ACTION_POLL = 3    # 反复读取直到 (值 & mask) == val：间隔从 interval 毫秒起指数退避至 max_interval，
+                   # 超过 timeout 毫秒仍未完成则视为失败
+
+# 批量脚本中轮询超时的退出码
+POLL_TIMEOUT_EXIT = 124
+
+# mdio 进程失败时 stderr 中表示偶发错误（总线忙、I/O 错误、连接中断）的内容，只有这些才会重试
+TRANSIENT_STDERR = re.compile(
+    r"\b(EBUSY|EIO|EAGAIN)\b|Device or resource busy|Input/output error|Resource temporarily unavailable|"
+    r"Broken pipe|Connection (reset|refused|aborted)|Transport endpoint is not connected",
+    re.IGNORECASE)
+
+# 每次总线访问的默认时间预算（毫秒）；一次调用的预算另加其中的延时与轮询超时（见 op_budget_ms）
+DEFAULT_OP_TIMEOUT_MS = 5000
+# 超时的子进程收到 SIGTERM 后等待退出的时间，之后 SIGKILL
+KILL_GRACE = 0.5
+
+# 解析 mdio 扫描输出，例如: 0x01  0x002b0980  up
+SCAN_PATTERN = re.compile(r"(0x[0-9a-fA-F]+)\s+(0x[0-9a-fA-F]+)")
+
+# 内核中注册的 MDIO 总线，目录名即 mdio 工具使用的总线名
+SYSFS_MDIO_BUS = "/sys/class/mdio_bus"
+
+
+class MdioError(Exception):
+    """MDIO 访问失败（命令返回非零、工具缺失、Broker 报错等）"""
+
+    def __init__(self, message, stderr="", stdout="", returncode=None, index=None, transient=False):
+        super().__init__(message)
+        self.stderr = stderr
+        self.stdout = stdout
+        self.returncode = returncode
+        self.index = index  # 批量执行时出错的操作序号
+        # 可能是偶发的总线 / 进程错误，重试可能成功（轮询超时、输出无法解析等不属于此类）
+        self.transient = transient
+
+
+class MdioTimeout(MdioError):
+    """访问超过时间预算（进程被终止或请求被放弃）；卡住的访问重试通常仍会卡住，不视为偶发错误"""
+
+
+def to_int(raw, default=0):
+    """配置中的数值可能是 int 或 "0x1E" / "30" 这样的字符串"""
+    if raw is None or raw == "":
+        return default
+    return int(str(raw), 0)
+
+
+def transient_exit(returncode, stderr):
+    """进程返回非零时，只有 stderr 表明是偶发错误才可以重试；轮询超时和其他错误重试也不会成功"""
+    return returncode != POLL_TIMEOUT_EXIT and bool(TRANSIENT_STDERR.search(stderr or ""))
+
+
+class ArgvTemplate:
+    """
+    预先拆分好的命令模板。
+    tokens 为 (是否含占位符, 文本) 元组，渲染时只对含占位符的片段做替换，
+    不必每次访问都对整条格式字符串 format() 再 split()。
+    """
+    __slots__ = ('fmt', 'tokens', 'mode')
+
+    def __init__(self, fmt):
+        self.fmt = fmt
+        self.tokens = tuple(('{' in token, token) for token in fmt.split())
+        self.mode = None
+        for _, token in self.tokens:
+            if token in MODE_KEYWORDS:
+                self.mode = MODE_KEYWORDS[token]
+                break
+
+    def render(self, bus, addr, dev_id, reg, data):
+        params = {'bus': bus, 'phy_addr': addr, 'dev_id': dev_id, 'reg': reg, 'data': data}
+        argv = []
+        for is_field, token in self.tokens:
+            if is_field:
+                token = token.format(**params)
+                if not token:
+                    continue  # 例如读操作中为空的 {data}
+            argv.append(token)
+        return argv
+
+
+@functools.lru_cache(maxsize=None)
+def parse_template(fmt):
+    """同一格式字符串只拆分一次，所有操作共享同一个 ArgvTemplate"""
+    return ArgvTemplate(fmt)
+
+
+class MdioOp:
+    """
+    一次寄存器访问（或批量程序中的延时 / 轮询指令）。
+    写操作的 mask 沿用 mdio 工具的语义：需要保留的原有位，
+    即 new = (old & mask) | val，mask 为 0 时直接覆盖。
+    轮询操作的 mask 则是比较掩码。
+    """
+    __slots__ = ('action', 'fmt', 'argv', 'mode', 'dev_id', 'reg', 'val', 'mask',
+                 'interval', 'max_interval', 'timeout')
+
+    def __init__(self, action, fmt, reg, dev_id=0, val=0, mask=0, interval=0, max_interval=0, timeout=0):
+        self.action = action
+        self.fmt = fmt
+        self.argv = parse_template(fmt) if fmt else None
+        self.mode = self.argv.mode if self.argv else None
+        self.dev_id = dev_id
+        self.reg = reg
+        self.val = val
+        self.mask = mask
+        self.interval = interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+
+    @classmethod
+    def read(cls, fmt, reg, dev_id=0):
+        return cls(ACTION_READ, fmt, reg, dev_id)
+
+    @classmethod
+    def write(cls, fmt, reg, val, mask=0, dev_id=0):
+        return cls(ACTION_WRITE, fmt, reg, dev_id, val, mask)
+
+    @classmethod
+    def delay(cls, ms):
+        return cls(ACTION_DELAY, None, 0, interval=ms)
+
+    @classmethod
+    def poll(cls, fmt, reg, target, mask, dev_id=0, interval=1, max_interval=100, timeout=10000):
+        return cls(ACTION_POLL, fmt, reg, dev_id, target, mask, interval, max_interval, timeout)
+
+    def poll_done(self, value):
+        return value & self.mask == self.val
+
+    def data_str(self):
+        if self.action == ACTION_WRITE:
+            return f"0x{self.val:04x}/0x{self.mask:04x}"
+        return ""
+
+
+def poll_timeout_error(op, value):
+    return MdioError(f"Operation check timed out after {op.timeout} ms "
+                     f"(reg 0x{op.reg:x}: 0x{value:04x}, expected 0x{op.val:04x} under mask 0x{op.mask:04x})")
+
+
+def poll_backoff_ms(op):
+    """轮询操作的退避参数（毫秒）：(首次等待, 最长等待)，批量 shell 脚本与各 Python 执行路径共用"""
+    return max(op.interval, 1), max(op.max_interval, op.interval, 1)
+
+
+class PollBackoff:
+    """
+    一个轮询操作的退避与超时判定，与读取和等待的方式无关，所有执行路径共用：
+    调用方每读到一次值调用 next_wait()，返回 None 表示条件已满足，
+    否则为下一次读取前需要等待的秒数；超过 timeout 仍未满足时抛出 MdioError。
+    """
+
+    def __init__(self, op):
+        self.op = op
+        self.deadline = time.monotonic() + op.timeout / 1000.0
+        wait, max_wait = poll_backoff_ms(op)
+        self.wait = wait / 1000.0
+        self.max_wait = max_wait / 1000.0
+        self.iterations = 0
+        self.slept = 0.0
+
+    def next_wait(self, value):
+        self.iterations += 1
+        if self.op.poll_done(value):
+            profiler.count('poll', 'iterations', self.iterations)
+            return None
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise poll_timeout_error(self.op, value)
+        wait = min(self.wait, remaining)
+        self.wait = min(self.wait * 2, self.max_wait)
+        self.slept += wait
+        return wait
+
+
+def op_steps(ops, poll_span='poll'):
+    """
+    按顺序执行操作列表的过程（生成器），与实际的访问和等待方式无关，各执行路径共用：
+    需要一次读或写时 yield 该 MdioOp，调用方执行后 send() 回读到的值（写为 None），
+    访问失败时把 MdioError throw() 回生成器（补充出错的操作序号后抛出）；
+    需要等待（延时、轮询间隔）时 yield 秒数，调用方 time.sleep() 或 await asyncio.sleep() 后继续。
+    生成器的返回值即每一步的结果：读操作为读到的值，轮询操作为最后一次读到的值，写 / 延时为 None
+    """
+    results = []
+    for index, op in enumerate(ops):
+        try:
+            if op.action in (ACTION_READ, ACTION_WRITE):
+                results.append((yield op))
+            elif op.action == ACTION_DELAY:
+                yield op.interval / 1000.0
+                results.append(None)
+            else:
+                poll = PollBackoff(op)
+                read_op = MdioOp.read(op.fmt, op.reg, op.dev_id)
+                with profiler.span('poll', poll_span, reg=op.reg) as sp:
+                    try:
+                        while True:
+                            value = yield read_op
+                            wait = poll.next_wait(value)
+                            if wait is None:
+                                break
+                            yield wait
+                    finally:
+                        sp.set(iterations=poll.iterations, sleep_ms=poll.slept * 1000.0)
+                results.append(value)
+        except MdioError as e:
+            if e.index is None:
+                e.index = index
+            raise
+    return results
+
+
+def run_steps(steps, access):
+    """同步执行 op_steps：access(op) 完成一次读 / 写，等待使用 time.sleep"""
+    value = None
+    error = None
+    while True:
+        try:
+            request = steps.throw(error) if error is not None else steps.send(value)
+        except StopIteration as done:
+            return done.value
+        value = error = None
+        if isinstance(request, MdioOp):
+            try:
+                value = access(request)
+            except MdioError as e:
+                error = e
+        else:
+            time.sleep(request)
+
+
+def backend_access(backend, bus, addr, op):
+    """在寄存器后端上执行一次读或写"""
+    if op.mode is None:
+        raise MdioError(f"Cannot determine MDIO addressing mode from template: {op.fmt}")
+    if op.action == ACTION_READ:
+        return backend.read(bus, addr, op.mode, op.dev_id, op.reg)
+    backend.write(bus, addr, op.mode, op.dev_id, op.reg, op.val, op.mask)
+    return None
+
+
+def apply_ops(backend, bus, addr, ops):
+    """
+    在一个寄存器后端上按顺序执行操作列表，返回每一步的结果：
+    读操作为读到的值，轮询操作为最后一次读到的值，写 / 延时为 None
+    """
+    return run_steps(op_steps(ops, 'backend_poll'), lambda op: backend_access(backend, bus, addr, op))
+
+
+def op_budget_ms(ops, per_access_ms=DEFAULT_OP_TIMEOUT_MS):
+    """一次 execute 调用的时间预算（毫秒）：每次总线访问 per_access_ms，另加延时与轮询的超时"""
+    total = 0
+    for op in ops:
+        if op.action == ACTION_DELAY:
+            total += op.interval
+        elif op.action == ACTION_POLL:
+            total += op.timeout + per_access_ms
+        else:
+            total += per_access_ms
+    return total
+
+
+def sysfs_buses(root=SYSFS_MDIO_BUS):
+    """从 sysfs 读取总线列表，不需要特权也不启动子进程；sysfs 不可用时返回 None"""
+    try:
+        return sorted(os.listdir(root))
+    except OSError:
+        return None
+
+
+class MdioTransport:
+    """传输层基类：子类至少实现 execute / list_buses / scan_bus"""
+
+    def describe(self, bus, addr, op):
+        return describe_op(bus, addr, op)
+
+    def execute(self, bus, addr, ops):
+        raise NotImplementedError
+
+    def read(self, bus, addr, op):
+        return self.execute(bus, addr, [op])[0]
+
+    def list_buses(self):
+        raise NotImplementedError
+
+    def scan_bus(self, bus):
+        raise NotImplementedError
+
+    def abort(self, thread_id):
+        """终止 thread_id 线程中正在进行的访问（供看门狗使用）；不支持时返回 False"""
+        return False
+
+
+class SubprocessTransport(MdioTransport):
+    """
+    原有的访问方式：每次寄存器访问执行一次 `sudo mdio ...`，延时和轮询在本进程中完成。
+    shell_batch 为 True 时把整个操作列表编译为一段 shell 脚本，只执行一次 `sudo sh -c`；
+    这要求 sudo 规则允许以 root 运行 sh（等同于任意 root 命令），因此需要显式启用（--shell-batch）
+    """
+
+    def __init__(self, use_sudo=True, op_timeout_ms=DEFAULT_OP_TIMEOUT_MS, shell_batch=False):
+        self.prefix = ["sudo"] if use_sudo else []
+        self.shell_batch = shell_batch
+        self.tool_missing = None   # 第一次访问失败时检查
+        # 每次总线访问的时间预算，超时的进程被终止（见 op_budget_ms）
+        self.op_timeout_ms = op_timeout_ms
+        self._procs = {}   # {线程: 正在运行的子进程}，供 abort() 使用
+        self._procs_lock = threading.Lock()
+
+    def render(self, bus, addr, op):
+        """根据模板构造完整的命令列表，例如: ['sudo', 'mdio', 'fixed-0', 'phy', '1', 'raw', '0x0', '0x8000/0x7fff']"""
+        return self.prefix + op.argv.render(bus, addr, op.dev_id, f"0x{op.reg:x}", op.data_str())
+
+    def describe(self, bus, addr, op):
+        if op.action in (ACTION_READ, ACTION_WRITE):
+            return ' '.join(self.render(bus, addr, op))
+        return describe_op(bus, addr, op)
+
+    def _trace_name(self, cmd):
+        argv = cmd[len(self.prefix):]
+        return 'sh -c <batch script>' if argv[:1] == ['sh'] else ' '.join(argv)
+
+    def _run(self, cmd, timeout_ms=None):
+        timeout_ms = self.op_timeout_ms if timeout_ms is None else timeout_ms
+        ident = threading.get_ident()
+        try:
+            with profiler.span('transport', 'process', argv=self._trace_name(cmd)):
+                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+                with self._procs_lock:
+                    self._procs[ident] = proc
+                try:
+                    out, err = proc.communicate(timeout=timeout_ms / 1000.0)
+                except subprocess.TimeoutExpired:
+                    out, err = self._kill(proc)
+                    hint = " (is sudo waiting for a password? run 'sudo -v' first)" if self.prefix else ""
+                    raise MdioTimeout(f"'{self._trace_name(cmd)}' timed out after {timeout_ms} ms{hint}",
+                                      stderr=err.strip(), stdout=out.strip(), returncode=proc.returncode)
+                finally:
+                    with self._procs_lock:
+                        self._procs.pop(ident, None)
+        except FileNotFoundError:
+            self._check_tool()
+            raise MdioError("'sudo' or 'mdio' command not found")
+        if proc.returncode != 0:
+            self._check_tool()
+            raise MdioError(f"Command failed with error code {proc.returncode}",
+                            stderr=err.strip(), stdout=out.strip(), returncode=proc.returncode,
+                            transient=transient_exit(proc.returncode, err))
+        return out
+
+    @staticmethod
+    def _kill(proc):
+        """
+        终止超时的进程：先 SIGTERM（sudo 会转发给 mdio），宽限期后 SIGKILL。
+        仍持有管道的孙进程不再等待，返回已经读到的输出
+        """
+        try:
+            proc.terminate()
+            return proc.communicate(timeout=KILL_GRACE)
+        except subprocess.TimeoutExpired:
+            pass
+        except OSError:
+            return "", ""
+        try:
+            proc.kill()
+        except OSError:
+            pass
+        for pipe in (proc.stdout, proc.stderr):
+            pipe.close()
+        try:
+            proc.wait(timeout=KILL_GRACE)
+        except subprocess.TimeoutExpired:
+            pass
+        return "", ""
+
+    def abort(self, thread_id):
+        with self._procs_lock:
+            proc = self._procs.get(thread_id)
+        if proc is None:
+            return False
+        try:
+            proc.terminate()
+        except OSError:
+            return False
+        return True
+
+    def _check_tool(self):
+        """
+        访问失败时才检查 mdio 工具是否存在（启动时不再执行 `mdio -h`），
+        工具缺失时给出明确的错误而不是 sudo 的退出码
+        """
+        if self.tool_missing is None:
+            self.tool_missing = shutil.which("mdio") is None
+        if self.tool_missing:
+            raise MdioError("'mdio' tool not found. Please install it.")
+
+    def execute(self, bus, addr, ops):
+        if len(ops) == 1 and ops[0].action in (ACTION_READ, ACTION_WRITE):
+            return [self._execute_one(bus, addr, ops[0])]
+        if self.shell_batch:
+            return self._execute_script(bus, addr, ops)
+        return run_steps(op_steps(ops, 'process_poll'), lambda op: self._execute_one(bus, addr, op))
+
+    def _execute_one(self, bus, addr, op):
+        with profiler.span('transport', 'render'):
+            argv = self.render(bus, addr, op)
+        out = self._run(argv, self.op_timeout_ms)
+        return self._parse_value(out) if op.action == ACTION_READ else None
+
+    def _parse_value(self, out, index=None):
+        try:
+            return int(out.strip(), 16)
+        except ValueError:
+            raise MdioError(f"Unexpected read output: '{out.strip()}'", stdout=out, index=index)
+
+    def _script(self, bus, addr, ops):
+        """
+        将整个操作列表编译为一段 shell 脚本，只需一次 sudo 即可完成（shell_batch）。
+        每个操作执行前先输出 "@序号" 标记，用于拆分各步骤的输出。
+        """
+        lines = ["set -e"]
+        for index, op in enumerate(ops):
+            lines.append(f"echo @{index}")
+            if op.action == ACTION_DELAY:
+                lines.append(f"sleep {op.interval / 1000.0:g}")
+                continue
+            argv = self.render(bus, addr, op)[len(self.prefix):]
+            cmd = ' '.join(shlex.quote(arg) for arg in argv)
+            if op.action != ACTION_POLL:
+                lines.append(cmd)
+                continue
+            # 指数退避轮询，超过截止时间以 POLL_TIMEOUT_EXIT 退出；
+            # "%次数" 行记录轮询次数，供计时统计使用
+            first_ms, max_ms = poll_backoff_ms(op)
+            lines.append(
+                f"d=$(( $(date +%s%N) / 1000000 + {op.timeout} )); w={first_ms}; n=0; "
+                f"while :; do n=$((n + 1)); v=$({cmd}); "
+                f"[ $(( v & {op.mask} )) -eq {op.val} ] && break; "
+                f"[ $(( $(date +%s%N) / 1000000 )) -ge $d ] && {{ echo %$n; echo $v; exit {POLL_TIMEOUT_EXIT}; }}; "
+                f"sleep $(printf '%d.%03d' $((w / 1000)) $((w % 1000))); "
+                f"w=$((w * 2)); [ $w -gt {max_ms} ] && w={max_ms}; "
+                f"done; echo %$n; echo $v"
+            )
+        return '\n'.join(lines)
+
+    def _execute_script(self, bus, addr, ops):
+        try:
+            out = self._run(self.script_command(bus, addr, ops), op_budget_ms(ops, self.op_timeout_ms))
+            failed = None
+        except MdioError as e:
+            out = e.stdout
+            failed = e
+        return self.parse_script_output(ops, out, failed)
+
+    def script_command(self, bus, addr, ops):
+        with profiler.span('transport', 'render_script', ops=len(ops)):
+            return self.prefix + ["sh", "-c", self._script(bus, addr, ops)]
+
+    def parse_script_output(self, ops, out, failed=None):
+        """
+        按 "@序号" 标记拆分批量脚本的输出，返回每个操作的结果；
+        failed 为脚本执行失败时的 MdioError，补充出错的操作序号后抛出
+        """
+        outputs = {}
+        current = None
+        for line in out.splitlines():
+            if line.startswith('@'):
+                current = int(line[1:])
+                outputs[current] = []
+            elif line.startswith('%'):
+                profiler.count('poll', 'iterations', int(line[1:]))
+            elif current is not None:
+                outputs[current].append(line)
+        if failed is not None:
+            failed.index = current
+            failed.stdout = '\n'.join(outputs.get(current, []))
+            op = ops[current] if current is not None else None
+            if failed.returncode == POLL_TIMEOUT_EXIT and op is not None and op.action == ACTION_POLL:
+                value = self._parse_value(failed.stdout, current)
+                error = poll_timeout_error(op, value)
+                error.index = current
+                raise error
+            raise failed
+        results = []
+        for index, op in enumerate(ops):
+            if op.action in (ACTION_READ, ACTION_POLL):
+                results.append(self._parse_value('\n'.join(outputs.get(index, [])), index))
+            else:
+                results.append(None)
+        return results
+
+    def list_buses(self):
+        """优先从 sysfs 读取，没有 sysfs 时才执行 `sudo mdio`"""
+        buses = sysfs_buses()
+        if buses is not None:
+            return buses
+        return self.parse_buses(self._run(self.prefix + ["mdio"]))
+
+    def scan_bus(self, bus):
+        return self.parse_scan(self._run(self.prefix + ["mdio", bus]))
+
+    @staticmethod
+    def parse_buses(out):
+        return [line.strip() for line in out.splitlines() if line.strip()]
+
+    @staticmethod
+    def parse_scan(out):
+        found = []
+        for line in out.splitlines():
+            match = SCAN_PATTERN.search(line)
+            if match:
+                found.append((int(match.group(1), 16), int(match.group(2), 16)))
+        return found
+
+
+class BackendTransport(MdioTransport):
+    """进程内直接调用寄存器后端（如仿真后端），不经过 Broker"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def execute(self, bus, addr, ops):
+        with profiler.span('transport', 'backend', ops=len(ops)):
+            return apply_ops(self.backend, bus, addr, ops)
+
+    def list_buses(self):
+        return self.backend.list_buses()
+
+    def scan_bus(self, bus):
+        return self.backend.scan_bus(bus)
+
+
+class RoutedTransport(MdioTransport):
+    """
+    按命令模板选择访问方式：routes 为 {模板格式字符串: 传输层}，其余操作、总线列表与扫描使用 inner。
+    一个操作列表中使用不同传输层的连续片段依次执行，延时归入所在的片段。
+    """
+
+    def __init__(self, inner, routes):
+        self.inner = inner
+        self.routes = routes
+
+    def _route(self, op):
+        return self.routes.get(op.fmt, self.inner) if op.fmt else None
+
+    def describe(self, bus, addr, op):
+        return (self._route(op) or self.inner).describe(bus, addr, op)
+
+    def execute(self, bus, addr, ops):
+        runs = []   # [(传输层, 起始序号, 操作列表)]
+        for index, op in enumerate(ops):
+            target = self._route(op)
+            if runs and target in (None, runs[-1][0]):
+                runs[-1][2].append(op)
+            else:
+                runs.append((target or self.inner, index, [op]))
+        results = []
+        for target, start, run in runs:
+            try:
+                results.extend(target.execute(bus, addr, run))
+            except MdioError as e:
+                if e.index is not None:
+                    e.index += start
+                raise
+        return results
+
+    def list_buses(self):
+        return self.inner.list_buses()
+
+    def scan_bus(self, bus):
+        return self.inner.scan_bus(bus)
+
+    def abort(self, thread_id):
+        aborted = False
+        for target in {self.inner, *self.routes.values()}:
+            aborted = target.abort(thread_id) or aborted
+        return aborted
+
+
+def describe_op(bus, addr, op):
+    """非 subprocess 传输的调试输出，格式与 mdio 命令保持一致"""
+    if op.action == ACTION_DELAY:
+        return f"delay {op.interval}ms"
+    mode = op.mode
+    if mode is None:
+        return f"{op.fmt} (reg 0x{op.reg:x})"
+    target = f"{addr}" if mode == MODE_C22 else f"{addr}:{op.dev_id}"
+    text = f"mdio {bus} {MODE_NAMES[mode]} {target} raw 0x{op.reg:x}"
+    if op.action == ACTION_POLL:
+        return f"{text} (poll until &0x{op.mask:04x} == 0x{op.val:04x}, {op.interval}-{op.max_interval}ms backoff, timeout {op.timeout}ms)"
+    data = op.data_str()
+    return f"{text} {data}" if data else text
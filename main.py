@@ -1,66 +1,403 @@
+import json
 import os
 import sys
-import glob
-import json
-from core.scanner import PhyScanner
-from core.executor import PhyExecutor
+import threading
+from core import profiler
 
 CONFIG_DIR = "configs"
 
+def get_option(name, default=None):
+    """读取形如 `--name value` 的命令行参数；只给出开关不带值时返回 default"""
+    if name not in sys.argv:
+        return None
+    idx = sys.argv.index(name)
+    if idx + 1 < len(sys.argv) and not sys.argv[idx + 1].startswith('--'):
+        return sys.argv[idx + 1]
+    return default
+
+def create_transport(common_config):
+    """
+    根据命令行参数选择寄存器访问方式：
+      --broker [SOCKET]  通过常驻特权 Broker 访问（见 core/broker.py）
+      --sim TOPOLOGY     使用进程内仿真寄存器，无需硬件
+      --replay LOG       回放 --record 录制的会话日志（--replay-pacing original 按原节奏）
+      默认               每次访问执行一次 sudo mdio（--shell-batch 时每个序列只执行一次 sudo sh -c，
+                         需要 sudo 规则允许以 root 运行 sh）
+    命令模板中 "backend": "netlink" 的操作改为在进程内通过 mdio-netlink 访问，--netlink 使其成为
+    所有模板的默认方式（见 core/netlink.py）；仿真时使用假 netlink 端点，经过 Broker 时不使用。
+    除非指定 --no-scheduler，所有访问都经过每总线调度器（见 core/scheduler.py）；
+    调度器之下是超时、重试与熔断层（见 core/guard.py，--no-guard 不使用）；
+    --record LOG 把所有访问录制到日志中（见 core/record.py）。
+    """
+    replay_path = get_option('--replay')
+    if replay_path:
+        from core.record import ReplayTransport, PACING_FAST
+        return ReplayTransport(replay_path, get_option('--replay-pacing', PACING_FAST) or PACING_FAST)
+
+    from core.guard import GuardedTransport, GuardPolicy
+    policy = GuardPolicy.from_config(common_config.get('timeouts'))
+    sim_spec = get_option('--sim')
+    netlink_channel = None
+    if sim_spec:
+        from core.sim import SimulatedMdio, parse_topology
+        topology, c45_only = parse_topology(sim_spec)
+        sim = SimulatedMdio(topology, c45_only)
+        from core.transport import BackendTransport
+        transport = BackendTransport(sim)
+        from core.netlink import FakeNetlinkEndpoint
+        netlink_channel = FakeNetlinkEndpoint(sim)
+    elif '--broker' in sys.argv:
+        from core.broker import BrokerTransport, DEFAULT_SOCKET
+        transport = BrokerTransport(get_option('--broker', DEFAULT_SOCKET), policy.op_timeout_ms)
+    else:
+        from core.transport import SubprocessTransport
+        transport = SubprocessTransport(op_timeout_ms=policy.op_timeout_ms, shell_batch='--shell-batch' in sys.argv)
+    if '--broker' not in sys.argv:
+        transport = route_templates(transport, common_config, netlink_channel)
+    if '--no-guard' not in sys.argv:
+        transport = GuardedTransport(transport, policy)
+    if '--no-scheduler' not in sys.argv:
+        from core.scheduler import ScheduledTransport
+        transport = ScheduledTransport(transport)
+    record_path = get_option('--record')
+    if record_path:
+        from core.record import RecordingTransport
+        transport = RecordingTransport(transport, record_path)
+    return transport
+
+def route_templates(transport, common_config, netlink_channel=None):
+    """按模板的 "backend" 字段（未指定时由 --netlink 决定）把操作分派给 mdio 工具或 netlink"""
+    default = 'netlink' if '--netlink' in sys.argv else 'mdio'
+    templates = common_config.get('cmd_templates', {}).values()
+    chosen = {t['format']: t.get('backend', default) for t in templates if 'format' in t}
+    if 'netlink' not in chosen.values():
+        return transport
+    from core.netlink import NetlinkTransport
+    from core.transport import RoutedTransport
+    netlink = NetlinkTransport(netlink_channel)
+    if default == 'netlink':
+        routes = {fmt: transport for fmt, backend in chosen.items() if backend == 'mdio'}
+        return RoutedTransport(netlink, routes) if routes else netlink
+    return RoutedTransport(transport, {fmt: netlink for fmt, backend in chosen.items() if backend == 'netlink'})
+
+def open_topology():
+    """
+    拓扑缓存（见 core/topology.py），以访问方式作为缓存键。
+    --no-topology-cache 以及录制 / 回放时不使用：缓存会改变总线访问的顺序和内容。
+    """
+    if '--no-topology-cache' in sys.argv or '--record' in sys.argv or '--replay' in sys.argv:
+        return None
+    from core.config_cache import CACHE_DIR_NAME
+    from core.topology import TopologyCache, TOPOLOGY_FILE_NAME
+    if get_option('--sim'):
+        key = f"sim:{get_option('--sim')}"
+    elif '--broker' in sys.argv:
+        from core.broker import DEFAULT_SOCKET
+        key = f"broker:{get_option('--broker', DEFAULT_SOCKET)}"
+    else:
+        key = "mdio"
+    return TopologyCache(os.path.join(CONFIG_DIR, CACHE_DIR_NAME, TOPOLOGY_FILE_NAME), key)
+
+def use_topology(topology):
+    """拓扑缓存可用（且没有指定 --rescan）时返回 True，缓存只加载一次"""
+    if topology is None or '--rescan' in sys.argv:
+        return False
+    return topology.buses is not None or topology.load()
+
+def list_buses(scanner, topology):
+    """
+    列出总线：sysfs 可用时不启动子进程（见 SubprocessTransport.list_buses）；
+    --fast-start 且拓扑缓存可用时直接使用缓存中的总线列表，不访问总线
+    """
+    if '--fast-start' in sys.argv and use_topology(topology):
+        return list(topology.buses)
+    return scanner.get_buses()
+
+def discover_devices(scanner, identity_index, topology, buses, workers):
+    """
+    发现设备：有可用的拓扑缓存时增量扫描缓存中的总线，未变化的 PHY 不再 Read ID 探测（--rescan 强制完整扫描），并更新缓存。
+    --fast-start 时直接信任缓存，第一次总线访问就是真正要执行的操作
+    """
+    if '--fast-start' in sys.argv and use_topology(topology):
+        devices = [dev for bus in buses for dev in topology.buses.get(bus, ())]
+        print(f"[*] Topology cache: {len(devices)} device(s) used without verification (--fast-start)")
+        return devices
+    if use_topology(topology):
+        from core.topology import discover_cached
+        devices, stats = discover_cached(scanner, topology, buses, workers)
+        print(f"[*] Topology cache: {stats['verified']} device(s) verified, {stats['changed']} changed, "
+              f"{stats['scanned_buses']} new bus(es) scanned")
+    else:
+        devices = scanner.discover(buses, workers)
+    save_topology(topology, devices, identity_index, buses)
+    return devices
+
+def save_topology(topology, devices, identity_index, buses):
+    if topology is None:
+        return
+    try:
+        topology.save(devices, identity_index, buses)
+    except OSError as e:
+        print(f"[WARN] Failed to write topology cache: {e}")
+
+def rescan_bus_menu(scanner, identity_index, topology, devices, buses):
+    """交互菜单中的 'r'：选择一条总线增量重新扫描，返回更新后的设备列表"""
+    for i, bus in enumerate(buses):
+        count = sum(1 for dev in devices if dev['bus'] == bus)
+        print(f"  {i+1}. {bus} ({count} device(s))")
+    sel = input("Select bus to rescan (Number): ")
+    try:
+        bus = buses[int(sel) - 1]
+    except (ValueError, IndexError):
+        print("Invalid number.")
+        return devices
+    print(f"[*] Rescanning {bus}...")
+    found = scanner.rescan_bus(bus, [dev for dev in devices if dev['bus'] == bus])
+    print(f"[*] {len(found)} device(s) on {bus}")
+    devices = [dev for dev in devices if dev['bus'] != bus]
+    devices.extend(found)
+    devices.sort(key=lambda dev: (buses.index(dev['bus']) if dev['bus'] in buses else len(buses), dev['addr_int']))
+    save_topology(topology, devices, identity_index, buses)
+    return devices
+
+def select_group(valid_devices, sel):
+    """解析 '1,2,3' 形式的多端口选择；所选设备必须使用同一配置，无效时返回 None"""
+    try:
+        numbers = [int(part) for part in sel.split(',') if part.strip()]
+    except ValueError:
+        numbers = []
+    if len(numbers) < 2 or any(not 1 <= n <= len(valid_devices) for n in numbers):
+        print("Select at least two listed devices for lockstep, e.g. '1,2,3,4'.")
+        return None
+    picked = [valid_devices[n - 1] for n in numbers]
+    if any(d['cfg'] is None or d['cfg'] is not picked[0]['cfg'] for d in picked):
+        print("[ERR] Lockstep ports must share the same configuration.")
+        return None
+    return picked
+
+def match_devices(devices, identity_index):
+    """为每个设备匹配配置；没有匹配到特定配置时使用通用的兜底配置 (ID Mask 为 0 的)"""
+    return [{"hw": dev, "cfg": identity_index.resolve(dev['phy_id'])} for dev in devices]
+
+def apply_timeout_options(common_config):
+    """命令行的 --op-timeout / --sequence-timeout / --retries 覆盖 common.json 的 "timeouts" 段并校验"""
+    overrides = {'op_timeout_ms': get_option('--op-timeout'), 'sequence_timeout_ms': get_option('--sequence-timeout'),
+                 'retries': get_option('--retries')}
+    timeouts = dict(common_config.get('timeouts') or {})
+    timeouts.update({k: v for k, v in overrides.items() if v is not None})
+    from core.guard import GuardPolicy
+    GuardPolicy.from_config(timeouts)
+    common_config['timeouts'] = timeouts
+
+def find_layer(transport, cls):
+    """在层层包装的传输层（录制 → 调度 → 实际访问）中查找指定类型的一层"""
+    while transport is not None:
+        if isinstance(transport, cls):
+            return transport
+        transport = getattr(transport, 'inner', None)
+    return None
+
+def register_devices(transport, devices, identity_index, common_config):
+    """把各 PHY 匹配的芯片配置告诉重试层，用于判断出错的访问能否安全重试（见 core/guard.py）"""
+    from core.guard import GuardedTransport
+    guard = find_layer(transport, GuardedTransport)
+    if guard is not None:
+        guard.device_attrs.update(match_devices(devices, identity_index), common_config.get('cmd_templates', {}))
+
+def print_bus_stats(transport):
+    """调试模式下输出各总线的调度统计以及重试 / 超时统计"""
+    from core.guard import GuardedTransport
+    from core.scheduler import ScheduledTransport
+    scheduler = find_layer(transport, ScheduledTransport)
+    for bus, stats in (scheduler.stats() if scheduler is not None else {}).items():
+        print(f"[DEBUG] Bus {bus}: {stats['requests']} requests in {stats['calls']} calls "
+              f"({stats['merged']} merged), max queue depth {stats['max_depth']}, "
+              f"avg wait {stats['avg_wait_ms']:.2f} ms, busy {stats['busy_ms']:.1f} ms")
+    guard = find_layer(transport, GuardedTransport)
+    if guard is not None:
+        stats = guard.stats()
+        print(f"[DEBUG] Guard: {stats['retries']} retries, {stats['unsafe']} not retried (unsafe to repeat), "
+              f"{stats['timeouts']} timeouts, "
+              f"{stats['watchdog_aborts']} watchdog aborts, {stats['rejected']} rejected by open circuits")
+
 def load_configs():
-    """加载 configs 目录下所有的 JSON"""
-    configs = []
-    common_config = {}
-    
+    """
+    加载 configs 目录下所有的 JSON。
+    配置在首次加载时被校验并预编译，结果缓存在 configs/.cache/ 下，
+    配置文件未变化时直接使用缓存（--no-cache 可禁用）。
+    默认两阶段加载：启动时只建立 identity 等配置头的索引，测试树在设备第一次被使用时加载，
+    最近使用的 --config-lru 个（默认 32）保留在内存中；--eager-configs 在启动时加载并校验全部配置。
+    """
     if not os.path.exists(CONFIG_DIR):
         os.makedirs(CONFIG_DIR)
         print(f"[WARN] Config directory '{CONFIG_DIR}' created. Please add JSON files.")
-        return configs, common_config
+        return [], {}
 
-    # 首先加载 common.json
-    common_path = os.path.join(CONFIG_DIR, "common.json")
-    if os.path.exists(common_path):
-        try:
-            with open(common_path, 'r') as fp:
-                common_config = json.load(fp)
-                print(f"[*] Loaded common configuration")
-        except Exception as e:
-            print(f"[ERR] Failed to load {common_path}: {e}")
-    
-    # 然后加载其他配置文件
-    files = glob.glob(os.path.join(CONFIG_DIR, "*.json"))
-    for f in files:
-        if os.path.basename(f) == "common.json":
-            continue  # 跳过 common.json
-            
-        try:
-            with open(f, 'r') as fp:
-                cfg = json.load(fp)
-                if 'identity' in cfg:
-                    configs.append(cfg)
-        except Exception as e:
-            print(f"[ERR] Failed to load {f}: {e}")
+    use_cache = '--no-cache' not in sys.argv
+    if '--eager-configs' in sys.argv:
+        from core.config_cache import load_compiled_configs
+        configs, common_config, problems, from_cache = load_compiled_configs(CONFIG_DIR, use_cache=use_cache)
+    else:
+        from core.config_cache import DEFAULT_LRU_SIZE, load_config_index
+        lru_size = int(get_option('--config-lru', DEFAULT_LRU_SIZE) or DEFAULT_LRU_SIZE)
+        configs, common_config, problems, from_cache = load_config_index(CONFIG_DIR, use_cache, lru_size)
+    if from_cache:
+        print(f"[*] Loaded compiled configuration cache")
+    elif common_config:
+        print(f"[*] Loaded common configuration")
+    for problem in problems:
+        print(f"[WARN] {problem}")
     return configs, common_config
 
-def match_device(phy_id, configs):
+def finish_profile(profile_path):
+    """--profile：会话结束时输出计时统计，指定了文件时导出 trace"""
+    active = profiler.disable()
+    if active is None:
+        return
+    print("\n[PROFILE] Timing summary")
+    for line in active.summary_lines():
+        print(f"  {line}")
+    if profile_path:
+        try:
+            active.export(profile_path)
+            print(f"[PROFILE] Trace written to {profile_path}")
+        except OSError as e:
+            print(f"[ERR] Failed to write trace '{profile_path}': {e}")
+
+def run_plan(plan_path, common_config, transport, identity_index, devices, workers, shadow):
+    """
+    无人值守模式：对所有匹配的设备执行测试计划，结果以 JSON 写入 --output 指定的文件
+    （默认 fleet_results.json，"-" 表示标准输出）。有设备失败时返回非零退出码。
+    """
+    from core.fleet import FleetPlan, FleetRunner
+    from core.guard import GuardedTransport
+    from core.scheduler import ScheduledTransport
+    try:
+        plan = FleetPlan.load(plan_path)
+    except (OSError, ValueError) as e:
+        print(f"[FATAL] Invalid test plan '{plan_path}': {e}")
+        return 2
+
+    runner = FleetRunner(common_config, transport, identity_index, workers, shadow)
+    report = runner.run(plan, devices)
+    report['plan'] = plan_path
+    scheduler = find_layer(transport, ScheduledTransport)
+    if scheduler is not None:
+        report['buses'] = scheduler.stats()
+    guard = find_layer(transport, GuardedTransport)
+    if guard is not None:
+        report['guard'] = guard.stats()
+
+    summary = report['summary']
+    print(f"[*] Plan finished in {report['elapsed_ms']:.0f} ms: {report['devices_selected']} device(s), "
+          f"{summary['pass']} passed, {summary['fail']} failed, {summary['skipped']} skipped")
+    for dev in report['devices']:
+        print(f"  [{dev['status'].upper():<7}] {dev['bus']} {dev['addr']} {dev['chip']} ({dev['elapsed_ms']:.0f} ms)")
+        if 'error' in dev:
+            print(f"            {dev['error']}")
+
+    output = get_option('--output', 'fleet_results.json') or 'fleet_results.json'
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if output == '-':
+        print(text)
+    else:
+        with open(output, 'w') as fp:
+            fp.write(text + "\n")
+        print(f"[*] Results written to {output}")
+    return 1 if summary['fail'] else 0
+
+def take_snapshot(path, common_config, transport, identity_index, devices, workers):
+    """--snapshot FILE：读取所有设备的寄存器快照并保存（见 core/snapshot.py）"""
+    from core.snapshot import SnapshotTaker
+    taker = SnapshotTaker(common_config, transport, identity_index, workers)
+    snapshot = taker.capture(devices, label=get_option('--snapshot-label'))
+    failed = [dev for dev in snapshot.devices if dev['error']]
+    for dev in failed:
+        print(f"[ERR] Snapshot of {dev['bus']} 0x{dev['addr']:02x} failed: {dev['error']}")
+    try:
+        snapshot.save(path)
+    except OSError as e:
+        print(f"[ERR] Failed to write snapshot '{path}': {e}")
+        return 2
+    print(f"[*] Snapshot of {len(snapshot.devices)} device(s), {len(snapshot.values)} registers "
+          f"in {snapshot.meta['elapsed_ms']:.0f} ms written to {path}")
+    return 1 if failed else 0
+
+def create_monitor(common_config, transport, identity_index):
+    """--monitor FILE：按 --monitor-interval 毫秒的周期轮询各设备的监控字段（见 core/monitor.py）"""
+    from core.monitor import Monitor, DEFAULT_INTERVAL_MS, open_sink
+    path = get_option('--monitor', '-') or '-'
+    try:
+        sink, fp = open_sink(path)
+    except OSError as e:
+        print(f"[ERR] Failed to open monitor output '{path}': {e}")
+        return None
+    interval = float(get_option('--monitor-interval', DEFAULT_INTERVAL_MS) or DEFAULT_INTERVAL_MS)
+    monitor = Monitor(common_config, transport, identity_index, interval)
+    return monitor, sink, fp
+
+def finish_monitor(summary, fp):
+    if fp is not sys.stdout:
+        fp.close()
+    drift = summary['drift']
+    print(f"[*] Monitor: {summary['polls']} polls, {summary['events']} events, {summary['errors']} errors, "
+          f"{summary['skipped_periods']} skipped periods, drift mean {drift['mean_ms']:.2f} ms "
+          f"max {drift['max_ms']:.2f} ms")
+
+def run_monitor_mode(common_config, transport, identity_index, devices, plan_runner=None):
     """
-    根据 PHY ID 匹配配置
-    逻辑: (Read_ID & Mask) == Config_ID
+    前台监控直到 --monitor-duration 秒后或 Ctrl-C；
+    给出 plan_runner 时在后台监控，plan_runner() 返回后停止并返回其结果。
     """
-    for cfg in configs:
-        ident = cfg['identity']
+    from core.monitor import run_monitor
+    created = create_monitor(common_config, transport, identity_index)
+    if created is None:
+        return 2
+    monitor, sink, fp = created
+    decimate = int(get_option('--monitor-decimate', 0) or 0)
+    duration = get_option('--monitor-duration')
+    duration = float(duration) if duration else None
+
+    if plan_runner is None:
+        print(f"[*] Monitoring {len(devices)} device(s) every {monitor.interval * 1000:.0f} ms (Ctrl-C to stop)...")
         try:
-            target_id = int(ident['phy_id'], 0)
-            mask = int(ident['phy_id_mask'], 0)
-            if (phy_id & mask) == target_id & mask:
-                return cfg
-        except:
-            continue
-    return None
+            run_monitor(monitor, devices, sink, decimate, duration)
+        except KeyboardInterrupt:
+            print("\n[*] Monitor stopped")
+        finish_monitor(monitor.summary(), fp)
+        return 0
+
+    stop = threading.Event()
+    thread = threading.Thread(target=run_monitor, args=(monitor, devices, sink, decimate, duration, stop),
+                              name="mdio-monitor", daemon=True)
+    thread.start()
+    try:
+        return plan_runner()
+    finally:
+        stop.set()
+        thread.join()
+        finish_monitor(monitor.summary(), fp)
 
 def main():
+    # --profile [FILE]：记录计时数据，FILE 为 .json（Chrome trace）或 .jsonl
+    if '--profile' not in sys.argv:
+        return run_session()
+    profiler.enable()
+    try:
+        return run_session()
+    finally:
+        finish_profile(get_option('--profile'))
+
+def run_session():
+    """完整的一次会话：加载配置、扫描、执行测试计划或进入交互菜单"""
     # 检查命令行参数
     debug_mode = '--debug' in sys.argv
+    batch_mode = '--no-batch' not in sys.argv
+    # 寄存器影子缓存在整个程序运行期间共享
+    shadow = None
+    if '--shadow' in sys.argv:
+        from core.shadow import ShadowCache
+        shadow = ShadowCache()
     
     print("========================================")
     print("    Ethernet PHY Auto-Tester v2.0")
@@ -72,37 +409,51 @@ def main():
     print("[*] Loading configurations...")
     configs, common_config = load_configs()
     print(f"[*] Loaded {len(configs)} config files.")
+    from core.identity import IdentityIndex
+    identity_index = IdentityIndex(configs)
+    try:
+        apply_timeout_options(common_config)
+    except ValueError as e:
+        print(f"[FATAL] Invalid timeout settings: {e}")
+        return 2
 
-    scanner = PhyScanner(configs, common_config)
-    scanner.check_tool()
+    # mdio 工具是否存在在第一次访问失败时才检查（见 SubprocessTransport），启动时不再执行 `mdio -h`
+    transport = create_transport(common_config)
+    from core.scanner import PhyScanner, DEFAULT_WORKERS
+    scanner = PhyScanner(configs, common_config, transport, identity_index)
     
     # 2. 扫描硬件
     print("\n[*] Scanning Hardware buses...")
-    buses = scanner.get_buses()
-    all_devices = []
-
-    for bus in buses:
-        devs = scanner.scan_devices(bus)
-        all_devices.extend(devs)
+    topology = open_topology()
+    buses = list_buses(scanner, topology)
+    workers = int(get_option('--workers', DEFAULT_WORKERS) or DEFAULT_WORKERS)
+    all_devices = discover_devices(scanner, identity_index, topology, buses, workers)
+    register_devices(transport, all_devices, identity_index, common_config)
 
     if not all_devices:
         print("[!] No PHY devices found via mdio.")
         return
 
+    # 拍摄寄存器快照后退出
+    snapshot_path = get_option('--snapshot')
+    if snapshot_path:
+        return take_snapshot(snapshot_path, common_config, transport, identity_index, all_devices, workers)
+
+    # 无人值守模式：执行测试计划后退出（指定 --monitor 时同时在后台监控）
+    plan_path = get_option('--plan')
+    if plan_path:
+        if '--monitor' in sys.argv:
+            return run_monitor_mode(common_config, transport, identity_index, all_devices,
+                                    lambda: run_plan(plan_path, common_config, transport, identity_index,
+                                                     all_devices, workers, shadow))
+        return run_plan(plan_path, common_config, transport, identity_index, all_devices, workers, shadow)
+
+    # 持续监控模式
+    if '--monitor' in sys.argv:
+        return run_monitor_mode(common_config, transport, identity_index, all_devices)
+
     # 3. 列出设备并匹配（不显示，只准备数据）
-    valid_devices = []
-    
-    for i, dev in enumerate(all_devices):
-        cfg = match_device(dev['phy_id'], configs)
-        
-        # 如果没有匹配到特定配置，看看有没有通用的 (ID Mask 为 0 的)
-        if not cfg:
-            cfg = match_device(0, configs) 
-            
-        valid_devices.append({
-            "hw": dev,
-            "cfg": cfg
-        })
+    valid_devices = match_devices(all_devices, identity_index)
 
     # 4. 设备选择和测试循环
     while True:
@@ -116,10 +467,20 @@ def main():
         # 用户选择设备
         while True:
             try:
-                sel = input("\nSelect Target Device (Number, or 'q' to quit): ")
+                sel = input("\nSelect Target Device (Number, '1,2,3' for lockstep ports, 'r' to rescan a bus, or 'q' to quit): ")
                 if sel.lower() == 'q':
                     print("Exiting...")
+                    if debug_mode:
+                        print_bus_stats(transport)
                     return
+                if sel.lower() == 'r':
+                    target = None
+                    break
+                if ',' in sel:
+                    target = select_group(valid_devices, sel)
+                    if target:
+                        break
+                    continue
                     
                 idx = int(sel) - 1
                 if 0 <= idx < len(valid_devices):
@@ -133,10 +494,29 @@ def main():
                     return
                 print("Please enter a number or 'q' to quit.")
 
+        if target is None:
+            all_devices = rescan_bus_menu(scanner, identity_index, topology, all_devices, buses)
+            register_devices(transport, all_devices, identity_index, common_config)
+            valid_devices = match_devices(all_devices, identity_index)
+            continue
+
+        # 多端口同步执行：所选端口逐步同步进入同一测试模式（见 core/group.py）
+        if isinstance(target, list):
+            from core.group import GroupExecutor
+            cfg = target[0]['cfg']
+            print(f"\n[*] Starting lockstep session for {len(target)} port(s) of {cfg['identity']['chip_name']}...")
+            group = GroupExecutor(cfg, common_config, [(d['hw']['bus'], d['hw']['addr_int']) for d in target],
+                                  debug_mode, transport, shadow)
+            group.run()
+            group.reset_device()
+            continue
+
         # 5. 启动执行器
         if target['cfg']:
             print(f"\n[*] Starting session for {target['cfg']['identity']['chip_name']}...")
-            executor = PhyExecutor(target['cfg'], common_config, target['hw']['bus'], target['hw']['addr_int'], debug_mode)
+            from core.executor import PhyExecutor
+            executor = PhyExecutor(target['cfg'], common_config, target['hw']['bus'], target['hw']['addr_int'], debug_mode, transport, batch_mode, shadow,
+                                   verify='--verify' in sys.argv)
             
             # 运行执行器，执行完成后自动返回设备列表
             executor.run()
@@ -148,4 +528,4 @@ def main():
             continue
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file